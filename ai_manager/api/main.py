@@ -4,16 +4,17 @@ FastAPI приложение для AI Manager
 """
 
 import asyncio
+import json
 import logging
 import os
 import sys
 from contextlib import asynccontextmanager
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 
 import uvicorn
 from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 # Добавляем путь к модулям форума
@@ -110,6 +111,31 @@ class OllamaService:
         except Exception as e:
             return f"Ошибка: {str(e)}"
 
+    async def stream_response(self, model: str, prompt: str) -> AsyncIterator[str]:
+        """Потоковая генерация: токены из NDJSON-ответа Ollama по мере их появления"""
+        import aiohttp
+        # Общего лимита нет - генерация может идти минутами; ограничено ожидание очередной порции
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=120)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": True
+            }
+            async with session.post(f"{self.base_url}/api/generate", json=payload) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Ollama вернула {response.status}: {await response.text()}")
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        return
+
 # Глобальные переменные для сервисов
 ollama_service: Optional[OllamaService] = None
 app_start_time: float = 0
@@ -214,6 +240,31 @@ async def generate_response(
         logger.error(f"Ошибка при генерации ответа: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/stream")
+async def generate_response_stream(
+    model: str,
+    prompt: str,
+    ollama: OllamaService = Depends(get_ollama_service)
+):
+    """
+    Потоковая генерация ответа (Server-Sent Events): события data: {"token": ...}
+    по мере генерации, в конце data: {"done": true} или data: {"error": ...}
+    """
+    async def events():
+        try:
+            async for token in ollama.stream_response(model, prompt):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            yield 'data: {"done": true}\n\n'
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой генерации ответа: {e}")
+            yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт"""
@@ -261,16 +312,17 @@ if __name__ == "__main__":
     )
 
 import asyncio
+import json
 import logging
 import os
 import sys
 from contextlib import asynccontextmanager
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 
 import uvicorn
 from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 # Добавляем путь к модулям форума
@@ -367,6 +419,31 @@ class OllamaService:
         except Exception as e:
             return f"Ошибка: {str(e)}"
 
+    async def stream_response(self, model: str, prompt: str) -> AsyncIterator[str]:
+        """Потоковая генерация: токены из NDJSON-ответа Ollama по мере их появления"""
+        import aiohttp
+        # Общего лимита нет - генерация может идти минутами; ограничено ожидание очередной порции
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=120)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": True
+            }
+            async with session.post(f"{self.base_url}/api/generate", json=payload) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Ollama вернула {response.status}: {await response.text()}")
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        return
+
 # Глобальные переменные для сервисов
 ollama_service: Optional[OllamaService] = None
 app_start_time: float = 0
@@ -471,6 +548,31 @@ async def generate_response(
         logger.error(f"Ошибка при генерации ответа: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/stream")
+async def generate_response_stream(
+    model: str,
+    prompt: str,
+    ollama: OllamaService = Depends(get_ollama_service)
+):
+    """
+    Потоковая генерация ответа (Server-Sent Events): события data: {"token": ...}
+    по мере генерации, в конце data: {"done": true} или data: {"error": ...}
+    """
+    async def events():
+        try:
+            async for token in ollama.stream_response(model, prompt):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            yield 'data: {"done": true}\n\n'
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой генерации ответа: {e}")
+            yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт"""
@@ -6,13 +6,18 @@ from __future__ import annotations
 import asyncio
 import os
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Coroutine, Dict, Optional
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready
+
 from app.celery_config import celery_app
 from app.config import get_settings
+from app.managers.db_manager import MessageApi
+from app.utils.embedding_indexer import MessageEmbeddingIndexer, message_indexer
+from app.utils.http_clients import http_clients
 from shared_models.models import Task  # используем модель из shared_models (таблица "tasks")
 
 # Асинхронное подключение к той же БД, что и у основного приложения
@@ -20,6 +25,55 @@ settings = get_settings
 async_engine = create_async_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True)
 AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
 
+# Цикл событий процесса воркера: общие HTTP-клиенты и пул соединений БД живут
+# между задачами, а не пересоздаются на каждый asyncio.run
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+@worker_process_init.connect
+def init_worker_loop(**kwargs):
+    """Старт процесса воркера (prefork): собственный долгоживущий цикл событий"""
+    global _worker_loop
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+
+
+async def _close_loop_resources() -> None:
+    """Ресурсы, привязанные к циклу событий: индексатор сообщений и HTTP-клиенты"""
+    await message_indexer.close()
+    await http_clients.aclose()
+
+
+@worker_process_shutdown.connect
+def close_worker_loop(**kwargs):
+    """Завершение процесса воркера: закрываем индексатор, HTTP-клиенты и соединения БД"""
+    global _worker_loop
+    if _worker_loop is None:
+        return
+    try:
+        _worker_loop.run_until_complete(_close_loop_resources())
+        _worker_loop.run_until_complete(async_engine.dispose())
+    finally:
+        _worker_loop.close()
+        _worker_loop = None
+
+
+async def _run_and_close(coro: Coroutine[Any, Any, Any]) -> Any:
+    try:
+        return await coro
+    finally:
+        await _close_loop_resources()
+
+
+def run_async(coro: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Выполнить корутину задачи в цикле процесса воркера. Вне prefork - через asyncio.run,
+    тогда ресурсы цикла закрываются до его завершения
+    """
+    if _worker_loop is None:
+        return asyncio.run(_run_and_close(coro))
+    return _worker_loop.run_until_complete(coro)
+
 
 async def _process_task_async(task_db_id: int) -> Dict[str, Any]:
     """Асинхронная обработка задачи"""
@@ -72,7 +126,7 @@ def process_task(self, task_db_id: int):
     обрабатывает и обновляет статус.
     """
     try:
-        result = asyncio.run(_process_task_async(task_db_id))
+        result = run_async(_process_task_async(task_db_id))
         return result
     except Exception as exc:
         # Повторная попытка с экспоненциальной задержкой
@@ -90,3 +144,65 @@ def ai_analysis_task(topic_id: int, message_id: int):
     """Задача для AI анализа сообщений"""
     # TODO: Реализовать AI анализ
     return {"topic_id": topic_id, "message_id": message_id, "analysis": "completed"}
+
+
+async def _rerender_messages_async(batch_size: int) -> Dict[str, Any]:
+    """Перерисовать сохраненный HTML всех сообщений с устаревшей версией рендерера"""
+    total = 0
+    async with AsyncSessionLocal() as session:
+        while True:
+            processed = await MessageApi.rerender_stale_messages(session, batch_size=batch_size)
+            if not processed:
+                break
+            total += processed
+    return {"status": "success", "rerendered": total}
+
+
+@celery_app.task(name="rerender_messages")
+def rerender_messages(batch_size: int = 500):
+    """Фоновая перерисовка content_html после смены RENDERER_VERSION"""
+    return run_async(_rerender_messages_async(batch_size))
+
+
+async def _index_missing_embeddings_async(batch_size: int) -> Dict[str, Any]:
+    """Догоняющая индексация: эмбеддинги для всех сообщений, у которых их нет"""
+    indexer = MessageEmbeddingIndexer(batch_size=batch_size)
+    try:
+        indexed = await indexer.catch_up()
+    finally:
+        await indexer.close()
+    return {"status": "success", "indexed": indexed}
+
+
+@celery_app.task(name="index_missing_embeddings")
+def index_missing_embeddings(batch_size: int = 64):
+    """Фоновая индексация сообщений, пропущенных очередью индексатора"""
+    return run_async(_index_missing_embeddings_async(batch_size))
+
+
+async def _backfill_embedding_space_async(name: str, batch_size: int, pause: float) -> Dict[str, Any]:
+    """Дозаполнение векторов нового пространства эмбеддингов по истории сообщений"""
+    indexer = MessageEmbeddingIndexer(batch_size=batch_size)
+    try:
+        backfilled = await indexer.backfill_space(name, pause=pause)
+    finally:
+        await indexer.close()
+    return {"status": "success", "space": name, "backfilled": backfilled}
+
+
+@celery_app.task(name="backfill_embedding_space")
+def backfill_embedding_space(name: str, batch_size: int = 64, pause: float = 0.5):
+    """Фоновое дозаполнение пространства эмбеддингов порциями с паузами"""
+    return run_async(_backfill_embedding_space_async(name, batch_size, pause))
+
+
+@worker_ready.connect
+def schedule_rerender_messages(sender, **kwargs):
+    """При старте воркера дорисовываем сообщения, если версия рендерера изменилась"""
+    sender.app.send_task("rerender_messages")
+
+
+@worker_ready.connect
+def schedule_index_missing_embeddings(sender, **kwargs):
+    """При старте воркера индексируем сообщения, созданные пока индексатор не работал"""
+    sender.app.send_task("index_missing_embeddings")
@@ -6,14 +6,16 @@ from app.urls.api_url import router as api_router
 from app.urls.web_url import router as web_router
 from app.urls.admin_url import router as admin_api_router
 from app.urls.admin_web_url import router as admin_web_router
+from app.utils.ai_stream import ai_stream_relay
+from app.utils.embedders import close_query_embedders
+from app.utils.embedding_indexer import message_indexer
+from app.utils.http_clients import http_clients
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 # settings = get_settings
-# Создаем приложение FastAPI
-app = FastAPI(title="Форум", description="Простой форум на FastAPI", version="1.0.0")
 
 
 @asynccontextmanager
@@ -46,7 +48,19 @@ async def lifespan(app: FastAPI):
     yield
 
     # Завершение
-    logger.info("Shutting down RAG Manager service...")
+    logger.info("Shutting down Forum service...")
+    # Прерываем идущие потоковые генерации и закрываем keep-alive соединения с RAG/AI Manager
+    await ai_stream_relay.close()
+    await http_clients.aclose()
+    # Останавливаем фоновую индексацию эмбеддингов, закрываем ее пул соединений
+    # (через него же идет гибридный поиск) и эмбеддеры поисковых запросов
+    await message_indexer.close()
+    await close_query_embedders()
+
+
+# Создаем приложение FastAPI
+app = FastAPI(title="Форум", description="Простой форум на FastAPI", version="1.0.0", lifespan=lifespan)
+
 # Подключаем статические файлы (если нужны)
 # app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
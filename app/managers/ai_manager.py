@@ -2,11 +2,13 @@
 import httpx
 import logging
 import json
+from typing import AsyncIterator, Optional
 from app.config import get_settings
 from app.database import get_db
 from app.database import async_session_maker
 from app.managers.db_manager import TopicApi, MessageApi
-from shared_models.models import Topic
+from app.utils.http_clients import http_clients
+from shared_models.models import Message, Topic
 from shared_models.schemas import MessageCreate
 
 logger = logging.getLogger(__name__)
@@ -20,29 +22,22 @@ class AIManager:
     async def get_prompt(self, topic_id: str, user_id: str, question: str):
         """Получение подсказки для AI на основе темы и пользователя from RAG_service"""
         logger.info(f"Получение подсказки для topic_id={topic_id}, user_id={user_id}")
-        service_url = self.settings.RAG_MANAGER_URL
         # Преобразуем строки в числа с валидацией
         async with async_session_maker() as session:
             topic: Topic = await TopicApi.get_topic_by_id(session, int(topic_id))  # type: ignore
         try:
             user_id_int = int(user_id)
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                client.headers.update({
-                    "Authorization": f"Bearer {self.settings.RAG_SERVICE_API_KEY}",
-                    "Content-Type": "application/json",
-                    "Accept": "*/*"
-                })
-                # Получаем подсказку
-                prompt = await client.post(f"{service_url}/api/v1/rag/process", json={
-                    "topic": topic.title or "",
-                    "user_id": user_id_int,
-                    "question": question,
-                    "reply_to": "string",
-                    "context_limit": 10,
-                    "similarity_threshold": 0.5
-                })
-                print(f"Prompt response: {prompt.text}")
-                return prompt.text
+            # Общий клиент с keep-alive: соединение с RAG сервисом переиспользуется между запросами
+            prompt = await http_clients.get("rag").post("/api/v1/rag/process", json={
+                "topic": topic.title or "",
+                "user_id": user_id_int,
+                "question": question,
+                "reply_to": "string",
+                "context_limit": 10,
+                "similarity_threshold": 0.5
+            })
+            logger.debug(f"Prompt response: {prompt.text}")
+            return prompt.text
         except ValueError as e:
             logger.error(f"Ошибка преобразования ID: {e}")
             raise ValueError("Неверный формат ID")
@@ -58,29 +53,70 @@ class AIManager:
         if not prompt:
             raise RuntimeError("Не удалось получить подсказку от RAG сервиса")
         prompt = json.loads(prompt)  # Предполагаем, что ответ в формате JSON
-        ai_url = self.settings.AI_MANAGER_URL
-        headers = {
-            "Authorization": f"Bearer {self.settings.AI_MANAGER_API_KEY}",
-            "Content-Type": "application/json",
-            "Accept": "*/*"
-        }
         try:
-            timeout = 600.0  # Таймаут в 10 минут
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                client.headers.update(headers)
-                response = await client.post(f"{ai_url}/generate", params={
-                    "prompt": prompt["generated_prompt"],
-                    "model": "gemma3:latest",
-                    "timeout": timeout,
-                })
+            response = await http_clients.get("ai_manager").post("/generate", params={
+                "prompt": prompt["generated_prompt"],
+                "model": "gemma3:latest",
+                "timeout": self.settings.AI_MANAGER_READ_TIMEOUT,
+            })
+            if response.status_code != 200:
+                logger.error(f"Ошибка при генерации AI сообщения: {response.text}")
+                raise RuntimeError("Ошибка при генерации AI сообщения")
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка запроса к AI Manager: {e}")
+            raise RuntimeError("Ошибка запроса к AI Manager")
+        ai_message = json.loads(response.text)
+        return ai_message["response"]
+
+    async def stream_ai_message(self, prompt) -> AsyncIterator[str]:
+        """Потоковая генерация AI сообщения: токены ответа по мере их генерации моделью"""
+        if not prompt:
+            raise RuntimeError("Не удалось получить подсказку от RAG сервиса")
+        prompt = json.loads(prompt)
+        try:
+            async with http_clients.get("ai_manager").stream("POST", "/generate/stream", params={
+                "prompt": prompt["generated_prompt"],
+                "model": "gemma3:latest",
+            }) as response:
                 if response.status_code != 200:
+                    await response.aread()
                     logger.error(f"Ошибка при генерации AI сообщения: {response.text}")
                     raise RuntimeError("Ошибка при генерации AI сообщения")
+                # Server-Sent Events: data: {"token": ...} ... data: {"done": true}
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    if "error" in event:
+                        logger.error(f"Ошибка при генерации AI сообщения: {event['error']}")
+                        raise RuntimeError("Ошибка при генерации AI сообщения")
+                    if event.get("done"):
+                        return
+                    yield event["token"]
         except httpx.RequestError as e:
             logger.error(f"Ошибка запроса к AI Manager: {e}")
             raise RuntimeError("Ошибка запроса к AI Manager")
-        ai_message = json.loads(response.text)
-        return ai_message["response"]
+        raise RuntimeError("Поток генерации оборвался до завершения")
+
+    async def save_ai_message(
+        self,
+        topic_id: int,
+        user_id: int,
+        content: str,
+        last_message_content: str = "",
+        reply_message_id: Optional[int] = None
+    ) -> Message:
+        """Сохранение сгенерированного AI сообщения в базе данных"""
+        async with async_session_maker() as session:
+            username = await MessageApi.get_username_by_id(session, user_id)
+            message = MessageCreate(
+                topic_id=topic_id,
+                user_id=user_id,
+                author_name=username or "AI",
+                content=content,
+                parent_id=reply_message_id
+            )
+            return await MessageApi.create_message(session, message, last_message_content)
 
     async def generate_and_save_ai_message(
         self,
@@ -101,17 +137,9 @@ class AIManager:
             generated_message = await self.generate_ai_message(prompt, question)
 
             # Сохранение AI сообщения в базе данных
-            async with async_session_maker() as session:
-                username = await MessageApi.get_username_by_id(session, user_id_int)
-                message = MessageCreate(
-                    topic_id=topic_id_int,
-                    user_id=user_id_int,
-                    author_name=username or "AI",
-                    content=generated_message,
-                    parent_id=reply_message_id
-                )
-                # Создаем сообщение в базе данных
-                await MessageApi.create_message(session, message, last_message_content)
+            await self.save_ai_message(
+                topic_id_int, user_id_int, generated_message, last_message_content, reply_message_id
+            )
 
         except ValueError as e:
             logger.error(f"Ошибка преобразования ID: {e}")
@@ -127,4 +155,11 @@ if __name__ == "__main__":
     question = "Какой сегодня день?"
 
     import asyncio
-    asyncio.run(rag.generate_and_save_ai_message(topic_id, user_id, question))
\ No newline at end of file
+
+    async def main():
+        try:
+            await rag.generate_and_save_ai_message(topic_id, user_id, question)
+        finally:
+            await http_clients.aclose()
+
+    asyncio.run(main())
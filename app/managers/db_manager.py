@@ -1,17 +1,69 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, update, func
-from sqlalchemy.orm import selectinload
-from shared_models.models import Topic, Message, User, Category, Subcategory
-from shared_models.schemas import TopicCreate, MessageCreate, TopicUpdate, MessageUpdate
+from sqlalchemy import select, desc, update, insert, func, text, or_, literal, literal_column
+from sqlalchemy.orm import selectinload, joinedload, contains_eager
+from shared_models.models import Topic, Message, User, Category, Subcategory, Task
+from shared_models.schemas import TopicCreate, MessageCreate, TopicUpdate, MessageUpdate, MessageResponse
+from app.config import get_settings
 from app.models.pydantic_models import UserBaseModel
-from typing import List, Optional, Sequence
+from app.utils.pagination import keyset_after, next_cursor
+from app.utils.embedding_indexer import message_indexer
+from app.utils.embedders import embed_query
+from app.utils.topic_vector_store import topic_vector_store
+from app.utils.page_cache import page_cache, INDEX_SCOPE, topic_scope
+from app.template_filters import render_message_html, RENDERER_VERSION
+from app.models.extensions import messages_search, topics_search, message_embedding_outbox
+from markupsafe import escape
+import asyncio
+import logging
+import time
+from typing import Dict, List, Literal, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+TopicOrder = Literal["updated", "activity"]
+
+
+class TopicThread(NamedTuple):
+    """Страница дерева ответов темы (MessageApi.get_topic_thread)"""
+    roots: List[MessageResponse]
+    truncated: bool                 # дерево единственного корня страницы не уместилось в limit узлов
+    next_cursor: Optional[str]      # курсор следующей страницы корней (None - страница последняя)
+
+
+def _topic_ordering(order_by: TopicOrder):
+    """Сортировка тем: по времени изменения или по последнему сообщению"""
+    if order_by == "activity":
+        return (Topic.last_message_at.desc().nulls_last(), desc(Topic.id))
+    return (desc(Topic.updated_at), desc(Topic.id))
+
+
+def topic_sort_attr(order_by: TopicOrder) -> str:
+    """Атрибут темы, по которому строится курсор для выбранной сортировки"""
+    return "last_message_at" if order_by == "activity" else "updated_at"
+
+
+def _paginate(query, sort_column, id_column, skip: int, cursor: Optional[str], nullable: bool = False):
+    """Keyset-пагинация при наличии курсора, иначе legacy offset"""
+    if cursor:
+        return query.where(keyset_after(sort_column, id_column, cursor, nullable=nullable))
+    return query.offset(skip)
+
+
+def _topic_page(query, order_by: TopicOrder, skip: int, cursor: Optional[str]):
+    if order_by == "activity":
+        return _paginate(query, Topic.last_message_at, Topic.id, skip, cursor, nullable=True)
+    return _paginate(query, Topic.updated_at, Topic.id, skip, cursor)
 
 
 class UserApi:
     @staticmethod
-    async def get_users_list(db: AsyncSession, skip: int = 0, limit: int = 100) -> Sequence[User]:
-        """Получить список пользователей"""
-        result = await db.execute(select(User).order_by(desc(User.created_at)).offset(skip).limit(limit))
+    async def get_users_list(
+        db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> Sequence[User]:
+        """Получить список пользователей (cursor - keyset-пагинация по created_at, id)"""
+        query = select(User).order_by(desc(User.created_at), desc(User.id))
+        query = _paginate(query, User.created_at, User.id, skip, cursor)
+        result = await db.execute(query.limit(limit))
         return result.scalars().all()
 
     @staticmethod
@@ -47,6 +99,7 @@ class UserApi:
         db.add(db_user)
         await db.commit()
         await db.refresh(db_user)
+        StatsApi.adjust("users_count", 1)
         return db_user
 
     @staticmethod
@@ -75,36 +128,89 @@ class UserApi:
         if user:
             await db.delete(user)
             await db.commit()
+            StatsApi.adjust("users_count", -1)
             return True
         return False
 
 
 class TopicApi:
     @staticmethod
-    async def get_topics_list(db: AsyncSession, skip: int = 0, limit: int = 100) -> Sequence[Topic]:
+    async def get_topics_list(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        order_by: TopicOrder = "updated",
+        cursor: Optional[str] = None,
+    ) -> Sequence[Topic]:
         """Получить список тем с количеством сообщений с предзагрузкой связанных данных"""
-        result = await db.execute(
+        query = (
             select(Topic)
             .options(selectinload(Topic.category), selectinload(Topic.subcategory))
             .where(Topic.is_active)
-            .order_by(desc(Topic.updated_at))
-            .offset(skip)
-            .limit(limit)
+            .order_by(*_topic_ordering(order_by))
         )
+        result = await db.execute(_topic_page(query, order_by, skip, cursor).limit(limit))
         return result.scalars().all()
 
     @staticmethod
-    async def get_all_topics(db: AsyncSession, skip: int = 0, limit: int = 100) -> Sequence[Topic]:
+    async def get_all_topics(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        order_by: TopicOrder = "updated",
+        cursor: Optional[str] = None,
+    ) -> Sequence[Topic]:
         """Получить все темы (включая неактивные) для админ-панели с предзагрузкой связанных данных"""
-        result = await db.execute(
+        query = (
             select(Topic)
             .options(selectinload(Topic.category), selectinload(Topic.subcategory))
-            .order_by(desc(Topic.updated_at))
-            .offset(skip)
-            .limit(limit)
+            .order_by(*_topic_ordering(order_by))
         )
+        result = await db.execute(_topic_page(query, order_by, skip, cursor).limit(limit))
         return result.scalars().all()
 
+    @staticmethod
+    async def get_index_overview(db: AsyncSession, per_category: int = 10) -> dict:
+        """
+        Данные главной страницы одним запросом: топ-N активных тем каждой категории
+        (оконная функция по category_id) и общее число тем в категории. Количество
+        сообщений берется из денормализованного счетчика Topic.message_count.
+        Темы без категории попадают в отдельную секцию (партиция category_id IS NULL).
+        """
+        ranked = (
+            select(
+                Topic.id.label("topic_id"),
+                func.row_number()
+                .over(partition_by=Topic.category_id, order_by=(desc(Topic.updated_at), desc(Topic.id)))
+                .label("rn"),
+                func.count().over(partition_by=Topic.category_id).label("total_topics"),
+            )
+            .where(Topic.is_active)
+            .cte("ranked_topics")
+        )
+        result = await db.execute(
+            select(Topic, ranked.c.total_topics)
+            .join(ranked, ranked.c.topic_id == Topic.id)
+            .outerjoin(Category, Category.id == Topic.category_id)
+            .options(contains_eager(Topic.category), joinedload(Topic.subcategory))
+            .where(ranked.c.rn <= per_category)
+            .order_by(Category.name, Category.id, ranked.c.rn)
+        )
+
+        categories_data: List[dict] = []
+        uncategorized = {"topics": [], "total_topics": 0}
+        for topic, total_topics in result.unique().all():
+            topic_data = {"topic": topic, "message_count": topic.message_count}
+            if topic.category_id is None:
+                uncategorized["topics"].append(topic_data)
+                uncategorized["total_topics"] = total_topics
+                continue
+            if not categories_data or categories_data[-1]["category"].id != topic.category_id:
+                categories_data.append({"category": topic.category, "topics": [], "total_topics": total_topics})
+            categories_data[-1]["topics"].append(topic_data)
+
+        return {"categories_data": categories_data, "uncategorized": uncategorized}
+
     @staticmethod
     async def get_topic_by_id(db: AsyncSession, topic_id: int) -> Optional[Topic]:
         """Получить тему по ID с предзагрузкой связанных данных"""
@@ -115,6 +221,58 @@ class TopicApi:
         )
         return result.scalar_one_or_none()
 
+    @staticmethod
+    def _activity_counters_values() -> dict:
+        """Коррелированные подзапросы для точного пересчета счетчиков активности темы"""
+        last_message = (
+            select(Message.id, Message.created_at)
+            .where(Message.topic_id == Topic.id)
+            .order_by(desc(Message.created_at), desc(Message.id))
+            .limit(1)
+        )
+        return {
+            "message_count": select(func.count(Message.id)).where(Message.topic_id == Topic.id).scalar_subquery(),
+            "last_message_id": last_message.with_only_columns(Message.id).scalar_subquery(),
+            "last_message_at": last_message.with_only_columns(Message.created_at).scalar_subquery(),
+        }
+
+    @staticmethod
+    async def refresh_activity_counters(db: AsyncSession, topic_id: int) -> None:
+        """Пересчитать message_count / last_message_* одной темы (без commit)"""
+        await db.execute(
+            update(Topic)
+            .where(Topic.id == topic_id)
+            .values(**TopicApi._activity_counters_values())
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    async def rebuild_activity_counters(db: AsyncSession, batch_size: int = 1000) -> int:
+        """
+        Пересчитать счетчики активности всех тем пачками по batch_size.
+        Каждая пачка фиксируется отдельной транзакцией, чтобы не держать блокировки
+        на всей таблице. Возвращает количество обработанных тем.
+        """
+        processed = 0
+        last_id = 0
+        while True:
+            result = await db.execute(
+                select(Topic.id).where(Topic.id > last_id).order_by(Topic.id).limit(batch_size)
+            )
+            topic_ids = result.scalars().all()
+            if not topic_ids:
+                return processed
+
+            await db.execute(
+                update(Topic)
+                .where(Topic.id.in_(topic_ids))
+                .values(**TopicApi._activity_counters_values())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            processed += len(topic_ids)
+            last_id = topic_ids[-1]
+
     @staticmethod
     async def create_topic(db: AsyncSession, topic: TopicCreate) -> Topic:
         """Создать новую тему"""
@@ -128,6 +286,8 @@ class TopicApi:
         db.add(db_topic)
         await db.commit()
         await db.refresh(db_topic)
+        StatsApi.adjust("topics_count", 1)
+        await page_cache.invalidate(INDEX_SCOPE)
         return db_topic
 
     @staticmethod
@@ -146,6 +306,7 @@ class TopicApi:
             .returning(Topic)
         )
         await db.commit()
+        await page_cache.invalidate(INDEX_SCOPE, topic_scope(topic_id))
         return result.scalar_one_or_none()
 
     @staticmethod
@@ -155,6 +316,8 @@ class TopicApi:
         if topic:
             await db.delete(topic)
             await db.commit()
+            StatsApi.adjust("topics_count", -1)
+            await page_cache.invalidate(INDEX_SCOPE, topic_scope(topic_id))
             return True
         return False
 
@@ -170,9 +333,98 @@ class MessageApi:
         return list(reversed(messages))  # Показываем от старых к новым
 
     @staticmethod
-    async def get_all_messages(db: AsyncSession, skip: int = 0, limit: int = 100) -> Sequence[Message]:
-        """Получить все сообщения для админ-панели"""
-        result = await db.execute(select(Message).order_by(desc(Message.created_at)).offset(skip).limit(limit))
+    async def get_topic_thread(
+        db: AsyncSession,
+        topic_id: int,
+        root_message_id: Optional[int] = None,
+        max_depth: int = 10,
+        limit: int = 500,
+        root_limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> TopicThread:
+        """
+        Дерево ответов темы (или поддерево под root_message_id) одним рекурсивным запросом.
+        Корневые сообщения темы берутся страницей root_limit, новые первыми (cursor -
+        keyset-пагинация по created_at, id), и рекурсия идет только под ними, не дальше
+        max_depth и limit узлов. Если деревья страницы не уместились в limit, страница
+        корней сужается вдвое, пока не загрузится целиком: next_cursor не перескакивает
+        недогруженные корни. truncated - в limit не уместилось дерево единственного корня
+        """
+        page_size = 1 if root_message_id is not None else max(root_limit, 1)
+        while True:
+            messages = await MessageApi._load_thread(
+                db, topic_id, root_message_id, max_depth, limit + 1, page_size, cursor
+            )
+            truncated = len(messages) > limit
+            if not truncated or page_size == 1:
+                break
+            page_size //= 2
+        if truncated:
+            # Узлы упорядочены по уровням - последний лист, его удаление не разрывает дерево
+            messages = messages[:limit]
+
+        # Сборка дерева за O(n): узлы уже упорядочены по уровням и времени
+        by_id: Dict[int, MessageResponse] = {}
+        tree: List[MessageResponse] = []
+        for message in messages:
+            node = MessageResponse.model_validate(message, from_attributes=True)
+            by_id[message.id] = node
+            parent = by_id.get(message.parent_id) if message.id != root_message_id else None
+            if parent is not None:
+                parent.replies.append(node)
+            else:
+                tree.append(node)
+        # Корни - в порядке страницы (новые первыми), ответы - по времени
+        tree.reverse()
+        page_cursor = next_cursor(tree, page_size, "created_at") if root_message_id is None else None
+        return TopicThread(tree, truncated, page_cursor)
+
+    @staticmethod
+    async def _load_thread(
+        db: AsyncSession,
+        topic_id: int,
+        root_message_id: Optional[int],
+        max_depth: int,
+        node_limit: int,
+        page_size: int,
+        cursor: Optional[str],
+    ) -> Sequence[Message]:
+        """
+        Узлы деревьев под страницей корней, по уровням. CTE выдает узлы уровень за уровнем,
+        и выборка из него без сортировки останавливает рекурсию, как только набрано
+        node_limit узлов, поэтому родитель всегда попадает в выборку раньше своих ответов
+        """
+        roots_q = select(Message.id).where(Message.topic_id == topic_id)
+        if root_message_id is not None:
+            roots_q = roots_q.where(Message.id == root_message_id)
+        else:
+            roots_q = roots_q.where(Message.parent_id.is_(None))
+            if cursor:
+                roots_q = roots_q.where(keyset_after(Message.created_at, Message.id, cursor))
+            roots_q = roots_q.order_by(desc(Message.created_at), desc(Message.id)).limit(page_size)
+        roots_sq = roots_q.subquery("roots")
+        thread = select(roots_sq.c.id, literal(0).label("depth")).cte("thread", recursive=True)
+        thread = thread.union_all(
+            select(Message.id, thread.c.depth + 1)
+            .join(thread, Message.parent_id == thread.c.id)
+            .where(Message.topic_id == topic_id, thread.c.depth < max_depth)
+        )
+        nodes_sq = select(thread.c.id, thread.c.depth).limit(node_limit).subquery("nodes")
+        result = await db.execute(
+            select(Message)
+            .join(nodes_sq, nodes_sq.c.id == Message.id)
+            .order_by(nodes_sq.c.depth, Message.created_at, Message.id)
+        )
+        return result.scalars().all()
+
+    @staticmethod
+    async def get_all_messages(
+        db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> Sequence[Message]:
+        """Получить все сообщения для админ-панели (cursor - keyset-пагинация по created_at, id)"""
+        query = select(Message).order_by(desc(Message.created_at), desc(Message.id))
+        query = _paginate(query, Message.created_at, Message.id, skip, cursor)
+        result = await db.execute(query.limit(limit))
         return result.scalars().all()
 
     @staticmethod
@@ -203,18 +455,33 @@ class MessageApi:
         result_message = f"<div class='quote-message' style='border: 1px solid #007bff; padding-left: 20px; margin-bottom: 10px;'> {'<i>' + last_message_content[:50] + '...</i><br></div>' if last_message_content else ''}{message.content}"
         db_message = Message(
             content=result_message,
+            content_html=render_message_html(result_message),
+            render_version=RENDERER_VERSION,
             author_name=message.author_name,
             topic_id=message.topic_id,
             parent_id=message.parent_id,
             user_id=getattr(message, "user_id", None),
         )
         db.add(db_message)
+        await db.flush()
 
-        # Обновляем время изменения темы
-        await db.execute(select(Topic).where(Topic.id == db_message.topic_id))
+        # Обновляем счетчики активности темы в той же транзакции
+        await db.execute(
+            update(Topic)
+            .where(Topic.id == db_message.topic_id)
+            .values(
+                message_count=Topic.message_count + 1,
+                last_message_id=db_message.id,
+                last_message_at=select(Message.created_at).where(Message.id == db_message.id).scalar_subquery(),
+            )
+            .execution_options(synchronize_session=False)
+        )
 
         await db.commit()
         await db.refresh(db_message)
+        StatsApi.adjust("messages_count", 1)
+        await page_cache.invalidate(INDEX_SCOPE, topic_scope(db_message.topic_id))
+        message_indexer.enqueue(db_message.id)
         return db_message
 
     @staticmethod
@@ -231,23 +498,79 @@ class MessageApi:
             .where(Message.id == message_id)
             .values(
                 content=message_data.content,
+                content_html=render_message_html(message_data.content),
+                render_version=RENDERER_VERSION,
                 author_name=message_data.author_name,
             )
             .returning(Message)
         )
+        updated_message = result.scalar_one_or_none()
+        if updated_message:
+            # Эмбеддинг устарел: запись в outbox в той же транзакции, что и изменение
+            await db.execute(
+                insert(message_embedding_outbox).values(
+                    message_id=message_id, topic_id=updated_message.topic_id, operation="upsert"
+                )
+            )
         await db.commit()
-        return result.scalar_one_or_none()
+        if updated_message:
+            await page_cache.invalidate(INDEX_SCOPE, topic_scope(updated_message.topic_id))
+            if topic_vector_store is not None:
+                topic_vector_store.invalidate(updated_message.topic_id)
+            message_indexer.enqueue(message_id)
+        return updated_message
 
     @staticmethod
     async def delete_message_by_id(db: AsyncSession, message_id: int) -> bool:
         """Удалить сообщение по ID"""
         message = await db.get(Message, message_id)
         if message:
+            topic_id = message.topic_id
             await db.delete(message)
+            await db.flush()
+            # Точный пересчет: удаление может каскадно затронуть ответы на сообщение
+            await TopicApi.refresh_activity_counters(db, topic_id)
+            await db.execute(
+                insert(message_embedding_outbox).values(message_id=message_id, topic_id=topic_id, operation="delete")
+            )
             await db.commit()
+            StatsApi.adjust("messages_count", -1)
+            await page_cache.invalidate(INDEX_SCOPE, topic_scope(topic_id))
+            if topic_vector_store is not None:
+                topic_vector_store.invalidate(topic_id)
+            message_indexer.enqueue(message_id)
             return True
         return False
     
+    @staticmethod
+    async def rerender_stale_messages(db: AsyncSession, batch_size: int = 500) -> int:
+        """
+        Перерисовать одну пачку сообщений, чей content_html получен старой версией
+        рендерера (или отсутствует). Строки блокируются с SKIP LOCKED, поэтому
+        несколько воркеров могут работать параллельно. Возвращает размер пачки.
+        """
+        result = await db.execute(
+            select(Message.id, Message.topic_id, Message.content)
+            .where(or_(Message.render_version.is_(None), Message.render_version < RENDERER_VERSION))
+            .order_by(Message.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        rows = result.all()
+        if not rows:
+            return 0
+
+        await db.execute(
+            update(Message),
+            [
+                {"id": row.id, "content_html": render_message_html(row.content), "render_version": RENDERER_VERSION}
+                for row in rows
+            ],
+        )
+        await db.commit()
+        await page_cache.invalidate(*{topic_scope(row.topic_id) for row in rows})
+        return len(rows)
+
     @staticmethod
     async def get_username_by_id(db: AsyncSession, user_id: int) -> Optional[str]:
         """Получить имя пользователя по ID"""
@@ -300,6 +623,7 @@ class CategoryApi:
         db.add(db_category)
         await db.commit()
         await db.refresh(db_category)
+        await page_cache.invalidate(INDEX_SCOPE)
         return db_category
 
     @staticmethod
@@ -336,6 +660,7 @@ class CategoryApi:
             .returning(Category)
         )
         await db.commit()
+        await page_cache.invalidate(INDEX_SCOPE)
         return result.scalar_one_or_none()
 
     @staticmethod
@@ -345,6 +670,7 @@ class CategoryApi:
         if category:
             await db.delete(category)
             await db.commit()
+            await page_cache.invalidate(INDEX_SCOPE)
             return True
         return False
 
@@ -415,6 +741,7 @@ class SubcategoryApi:
         db.add(db_subcategory)
         await db.commit()
         await db.refresh(db_subcategory)
+        await page_cache.invalidate(INDEX_SCOPE)
         return db_subcategory
 
     @staticmethod
@@ -453,6 +780,7 @@ class SubcategoryApi:
             .returning(Subcategory)
         )
         await db.commit()
+        await page_cache.invalidate(INDEX_SCOPE)
         return result.scalar_one_or_none()
 
     @staticmethod
@@ -462,13 +790,251 @@ class SubcategoryApi:
         if subcategory:
             await db.delete(subcategory)
             await db.commit()
+            await page_cache.invalidate(INDEX_SCOPE)
             return True
         return False
 
 
+class SearchApi:
+    """
+    Полнотекстовый поиск по сообщениям и темам (tsvector russian + simple, GIN-индексы).
+    Совпадения выбираются по индексу и ранжируются все (сортировка top-N по
+    ts_rank_cd), ts_headline считается только для строк текущей страницы.
+    """
+
+    # Маркеры подсветки ts_headline: заменяются на <mark> после HTML-экранирования сниппета
+    HIGHLIGHT_START = "\ue000"
+    HIGHLIGHT_STOP = "\ue001"
+    HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=30, MinWords=10"
+
+    # Время последнего сбоя гибридного поиска (time.monotonic)
+    _hybrid_failed_at: Optional[float] = None
+
+    @staticmethod
+    def _tsquery(query: str):
+        """Запрос в синтаксисе веб-поиска, совпадение по любой из конфигураций"""
+        return func.websearch_to_tsquery(literal_column("'russian'"), query).op("||")(
+            func.websearch_to_tsquery(literal_column("'simple'"), query)
+        )
+
+    @staticmethod
+    def _headline(document, tsquery):
+        return func.ts_headline(literal_column("'russian'"), document, tsquery, SearchApi.HEADLINE_OPTIONS)
+
+    @staticmethod
+    def _format_snippet(snippet: Optional[str]) -> str:
+        """Экранировать сниппет и вернуть подсветку совпадений тегом <mark>"""
+        if not snippet:
+            return ""
+        return (
+            str(escape(snippet))
+            .replace(SearchApi.HIGHLIGHT_START, "<mark>")
+            .replace(SearchApi.HIGHLIGHT_STOP, "</mark>")
+        )
+
+    @staticmethod
+    async def search_messages(
+        db: AsyncSession, query: str, topic_id: Optional[int] = None, limit: int = 20, offset: int = 0
+    ) -> List[dict]:
+        """Найти сообщения активных тем, отсортированные по релевантности"""
+        tsquery = SearchApi._tsquery(query)
+        rank = func.ts_rank_cd(messages_search.c.search_vector, tsquery).label("rank")
+        ranked = (
+            select(messages_search.c.id, rank)
+            .join(topics_search, topics_search.c.id == messages_search.c.topic_id)
+            .where(messages_search.c.search_vector.bool_op("@@")(tsquery), topics_search.c.is_active)
+        )
+        if topic_id:
+            ranked = ranked.where(messages_search.c.topic_id == topic_id)
+        ranked = (
+            ranked.order_by(desc(rank), desc(messages_search.c.id))
+            .limit(limit)
+            .offset(offset)
+            .subquery("ranked")
+        )
+        result = await db.execute(
+            SearchApi._message_rows(tsquery)
+            .add_columns(ranked.c.rank)
+            .join(ranked, ranked.c.id == messages_search.c.id)
+            .order_by(desc(ranked.c.rank), desc(messages_search.c.id))
+        )
+        return [
+            {**row._mapping, "rank": float(row.rank), "snippet": SearchApi._format_snippet(row.snippet)}
+            for row in result.all()
+        ]
+
+    @staticmethod
+    async def search_messages_hybrid(
+        db: AsyncSession, query: str, topic_id: Optional[int] = None, limit: int = 20, offset: int = 0
+    ) -> List[dict]:
+        """
+        Найти сообщения гибридным поиском (SEARCH_MODE=hybrid): полнотекстовая и векторная
+        выдачи объединяются RRF (EmbeddingManager.hybrid_search_messages), вектор запроса
+        берется через кэш embed_query. rank в результатах - RRF-скор. Если сервис
+        эмбеддингов или pgvector недоступны или не ответили за SEARCH_HYBRID_TIMEOUT -
+        обычный полнотекстовый поиск, и следующие SEARCH_HYBRID_RETRY секунд гибридный
+        поиск не пробуется: зависшая зависимость не задерживает каждый запрос
+        """
+        settings = get_settings
+        failed_at = SearchApi._hybrid_failed_at
+        cooling_down = failed_at is not None and time.monotonic() - failed_at < settings.SEARCH_HYBRID_RETRY
+        if settings.SEARCH_MODE != "hybrid" or cooling_down:
+            return await SearchApi.search_messages(db, query, topic_id, limit, offset)
+        try:
+            hits = await asyncio.wait_for(
+                SearchApi._hybrid_hits(query, topic_id, limit, offset), settings.SEARCH_HYBRID_TIMEOUT
+            )
+        except Exception as e:
+            SearchApi._hybrid_failed_at = time.monotonic()
+            logger.warning(f"Гибридный поиск недоступен, используется полнотекстовый: {e!r}")
+            return await SearchApi.search_messages(db, query, topic_id, limit, offset)
+        SearchApi._hybrid_failed_at = None
+        return await SearchApi._scored_messages(db, query, [(hit.message_id, hit.score) for hit in hits])
+
+    @staticmethod
+    async def _hybrid_hits(query: str, topic_id: Optional[int], limit: int, offset: int) -> list:
+        manager = await message_indexer.get_manager()
+        embedding = await embed_query(query, manager.space, manager.dimensions.get("message_embeddings"))
+        return await manager.hybrid_search_messages(query, embedding, topic_id=topic_id, limit=limit, offset=offset)
+
+    @staticmethod
+    def _message_rows(tsquery):
+        """Поля выдачи сообщения: тема, автор и сниппет (ts_headline по тексту без разметки)"""
+        plain_content = func.regexp_replace(messages_search.c.content, "<[^>]*>", " ", "g")
+        return select(
+            messages_search.c.id,
+            messages_search.c.topic_id,
+            messages_search.c.author_name,
+            messages_search.c.created_at,
+            topics_search.c.title.label("topic_title"),
+            SearchApi._headline(plain_content, tsquery).label("snippet"),
+        ).join(topics_search, topics_search.c.id == messages_search.c.topic_id)
+
+    @staticmethod
+    async def _scored_messages(db: AsyncSession, query: str, scored: List[Tuple[int, float]]) -> List[dict]:
+        """Строки выдачи для уже упорядоченных (id сообщения, скор)"""
+        if not scored:
+            return []
+        result = await db.execute(
+            SearchApi._message_rows(SearchApi._tsquery(query))
+            .where(messages_search.c.id.in_([message_id for message_id, _ in scored]))
+        )
+        rows = {row.id: row for row in result.all()}
+        return [
+            {**rows[message_id]._mapping, "rank": score, "snippet": SearchApi._format_snippet(rows[message_id].snippet)}
+            for message_id, score in scored
+            if message_id in rows
+        ]
+
+    @staticmethod
+    async def search_topics(db: AsyncSession, query: str, limit: int = 20, offset: int = 0) -> List[dict]:
+        """Найти активные темы по заголовку и описанию"""
+        tsquery = SearchApi._tsquery(query)
+        rank = func.ts_rank_cd(topics_search.c.search_vector, tsquery).label("rank")
+        ranked = (
+            select(topics_search.c.id, rank)
+            .where(topics_search.c.search_vector.bool_op("@@")(tsquery), topics_search.c.is_active)
+            .order_by(desc(rank), desc(topics_search.c.id))
+            .limit(limit)
+            .offset(offset)
+            .subquery("ranked")
+        )
+        document = func.concat_ws(" ", topics_search.c.title, topics_search.c.description)
+        result = await db.execute(
+            select(
+                topics_search.c.id,
+                topics_search.c.title,
+                topics_search.c.created_at,
+                ranked.c.rank,
+                SearchApi._headline(document, tsquery).label("snippet"),
+            )
+            .join(ranked, ranked.c.id == topics_search.c.id)
+            .order_by(desc(ranked.c.rank), desc(topics_search.c.id))
+        )
+        return [
+            {**row._mapping, "rank": float(row.rank), "snippet": SearchApi._format_snippet(row.snippet)}
+            for row in result.all()
+        ]
+
+
+class StatsApi:
+    """
+    Счетчики для админ-панели. Небольшие таблицы считаются точным COUNT(*),
+    для больших берется оценка pg_class.reltuples. Результат кэшируется на
+    STATS_CACHE_TTL секунд и подправляется на месте при создании/удалении записей.
+    """
+
+    # Выше этой оценки размера таблицы точный COUNT(*) не выполняем
+    EXACT_COUNT_THRESHOLD = 100_000
+    MODELS = {"users_count": User, "topics_count": Topic, "messages_count": Message, "tasks_count": Task}
+
+    _cache: Dict[str, int] = {}
+    _cached_at: float = 0.0
+
+    @staticmethod
+    async def get_counts(db: AsyncSession, force: bool = False) -> Dict[str, int]:
+        """Получить счетчики пользователей, тем, сообщений и задач"""
+        is_fresh = time.monotonic() - StatsApi._cached_at < get_settings.STATS_CACHE_TTL
+        if StatsApi._cache and is_fresh and not force:
+            return dict(StatsApi._cache)
+
+        counts = await StatsApi._compute_counts(db)
+        StatsApi._cache = counts
+        StatsApi._cached_at = time.monotonic()
+        return dict(counts)
+
+    @staticmethod
+    async def _compute_counts(db: AsyncSession) -> Dict[str, int]:
+        """Оценки из pg_class одним запросом, затем точный подсчет только для небольших таблиц"""
+        table_names = {model.__tablename__: key for key, model in StatsApi.MODELS.items()}
+        result = await db.execute(
+            text(
+                "SELECT relname, reltuples::bigint AS estimate FROM pg_class "
+                "WHERE relkind IN ('r', 'p') AND relname = ANY(:names) AND pg_table_is_visible(oid)"
+            ),
+            {"names": list(table_names)},
+        )
+        # Таблицы, которых нет в схеме, показываем нулем
+        counts = {key: 0 for key in StatsApi.MODELS}
+        exact_keys = []
+        for relname, estimate in result.all():
+            key = table_names[relname]
+            # reltuples = -1 (таблица еще не анализировалась) тоже попадает в точный подсчет
+            if estimate >= StatsApi.EXACT_COUNT_THRESHOLD:
+                counts[key] = int(estimate)
+            else:
+                exact_keys.append(key)
+
+        if exact_keys:
+            result = await db.execute(
+                select(
+                    *[
+                        select(func.count()).select_from(StatsApi.MODELS[key]).scalar_subquery().label(key)
+                        for key in exact_keys
+                    ]
+                )
+            )
+            counts.update({key: int(value) for key, value in result.one()._mapping.items()})
+        return counts
+
+    @staticmethod
+    def adjust(key: str, delta: int) -> None:
+        """Инкрементально поправить закэшированный счетчик после записи"""
+        if key in StatsApi._cache:
+            StatsApi._cache[key] = max(StatsApi._cache[key] + delta, 0)
+
+    @staticmethod
+    def invalidate() -> None:
+        """Сбросить кэш счетчиков"""
+        StatsApi._cache = {}
+        StatsApi._cached_at = 0.0
+
+
 # Создаем экземпляры CRUD
 user_crud = UserApi()
 topic_crud = TopicApi()
 message_crud = MessageApi()
 category_crud = CategoryApi()
 subcategory_crud = SubcategoryApi()
+stats_crud = StatsApi()
+search_crud = SearchApi()
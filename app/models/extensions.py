@@ -0,0 +1,65 @@
+"""
+Дополнительные колонки моделей shared_models, которые живут только в схеме форума.
+
+Колонки добавляются SQL-миграциями из docker/migrations и подключаются к уже
+объявленным декларативным классам, пока не переедут в сам пакет shared_models.
+Служебные колонки и таблицы, которые не нужны ORM-объектам (tsvector, outbox
+эмбеддингов), описаны отдельными Core-таблицами.
+"""
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, MetaData, String, Table, Text, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from shared_models.models import Message, Topic
+
+
+def _add_column(model, name: str, column: Column) -> None:
+    """Добавить колонку в маппинг модели, если shared_models её ещё не объявляет"""
+    if name not in model.__mapper__.attrs:
+        setattr(model, name, column)
+
+
+# Денормализованные счетчики активности темы (docker/migrations/001_topic_activity_counters.sql)
+_add_column(Topic, "message_count", Column("message_count", Integer, nullable=False, server_default="0"))
+_add_column(Topic, "last_message_at", Column("last_message_at", DateTime, nullable=True))
+_add_column(Topic, "last_message_id", Column("last_message_id", Integer, nullable=True))
+
+# Предварительно отрендеренный и очищенный HTML сообщения (docker/migrations/003_message_rendered_html.sql)
+_add_column(Message, "content_html", Column("content_html", Text, nullable=True))
+_add_column(Message, "render_version", Column("render_version", Integer, nullable=True))
+
+# Полнотекстовый поиск (docker/migrations/005_full_text_search.sql)
+search_metadata = MetaData()
+
+messages_search = Table(
+    "messages",
+    search_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("topic_id", Integer),
+    Column("author_name", String),
+    Column("content", Text),
+    Column("created_at", DateTime),
+    Column("search_vector", TSVECTOR),
+)
+
+topics_search = Table(
+    "topics",
+    search_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("title", String),
+    Column("description", Text),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime),
+    Column("search_vector", TSVECTOR),
+)
+
+# Очередь изменений сообщений для переиндексации эмбеддингов (docker/migrations/008_message_embedding_outbox.sql)
+outbox_metadata = MetaData()
+
+message_embedding_outbox = Table(
+    "message_embedding_outbox",
+    outbox_metadata,
+    Column("id", BigInteger, primary_key=True),
+    Column("message_id", Integer, nullable=False),
+    Column("topic_id", Integer, nullable=False),
+    Column("operation", String(10), nullable=False),  # upsert | delete
+    Column("created_at", DateTime, nullable=False, server_default=func.now()),
+)
@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CursorPage(BaseModel, Generic[T]):
+    """Страница результатов при keyset-пагинации"""
+    items: List[T] = Field(default_factory=list, description="Элементы страницы")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы (None - страница последняя)")
+
+
+class ThreadPage(CursorPage[T], Generic[T]):
+    """Страница дерева ответов: корни с вложенными ответами"""
+    truncated: bool = Field(
+        False, description="Дерево корня не уместилось в limit узлов - часть ответов не загружена"
+    )
@@ -0,0 +1,30 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class MessageSearchResult(BaseModel):
+    """Найденное сообщение"""
+    id: int
+    topic_id: int
+    topic_title: str
+    author_name: Optional[str] = None
+    created_at: datetime
+    rank: float = Field(..., description="Релевантность (ts_rank_cd, при гибридном поиске - RRF-скор)")
+    snippet: str = Field(..., description="Фрагмент текста, совпадения выделены тегом <mark>")
+
+
+class TopicSearchResult(BaseModel):
+    """Найденная тема"""
+    id: int
+    title: str
+    created_at: datetime
+    rank: float = Field(..., description="Релевантность (ts_rank_cd)")
+    snippet: str = Field(..., description="Фрагмент заголовка и описания, совпадения выделены тегом <mark>")
+
+
+class SearchResponse(BaseModel):
+    """Результаты поиска"""
+    query: str
+    topics: List[TopicSearchResult] = Field(default_factory=list)
+    messages: List[MessageSearchResult] = Field(default_factory=list)
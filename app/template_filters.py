@@ -1,10 +1,137 @@
 """
 Кастомные фильтры для Jinja2 шаблонов
 """
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial, wraps
+
 import bleach
 import markdown
+from bleach.linkifier import LinkifyFilter
 from markupsafe import Markup
-import re
+
+# Версия рендерера сообщений: увеличивается при любом изменении вывода smart_content,
+# после чего фоновая задача rerender_messages перерисовывает сохраненный HTML.
+# 2: ссылки в smart_content расставляет LinkifyFilter bleach (не трогает уже существующие <a>)
+RENDERER_VERSION = 2
+
+SAFE_TAGS = frozenset([
+    'p', 'br', 'strong', 'b', 'em', 'i', 'u', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'ul', 'ol', 'li', 'blockquote', 'code', 'pre', 'a', 'img', 'hr',
+    'div', 'span', 'table', 'thead', 'tbody', 'tr', 'th', 'td'
+])
+
+SAFE_ATTRIBUTES = {
+    'a': ['href', 'title', 'target'],
+    'img': ['src', 'alt', 'title', 'width', 'height'],
+    'code': ['class'],
+    'div': ['class'],
+    'span': ['class'],
+    'pre': ['class'],
+    'table': ['class'],
+    'th': ['class'],
+    'td': ['class']
+}
+
+# Для Markdown дополнительно разрешены зачеркивание/вставка и id заголовков (toc)
+MARKDOWN_TAGS = SAFE_TAGS | {'del', 'ins'}
+
+MARKDOWN_ATTRIBUTES = {
+    **SAFE_ATTRIBUTES,
+    'div': ['class', 'id'],
+    'h1': ['id'],
+    'h2': ['id'],
+    'h3': ['id'],
+    'h4': ['id'],
+    'h5': ['id'],
+    'h6': ['id']
+}
+
+MARKDOWN_EXTENSIONS = [
+    'nl2br',           # Автоматические переносы строк
+    'codehilite',      # Подсветка кода
+    'fenced_code',     # Блоки кода с ```
+    'tables',          # Поддержка таблиц
+    'toc',             # Оглавление
+    'abbr',            # Аббревиатуры
+]
+
+MARKDOWN_EXTENSION_CONFIGS = {
+    'codehilite': {
+        'css_class': 'highlight',
+        'use_pygments': True,
+    }
+}
+
+# Регулярное выражение для поиска URL
+URL_PATTERN = re.compile(
+    r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+)
+
+# Размер LRU-кэша результатов тяжелых фильтров (markdown, smart_content)
+RENDER_CACHE_SIZE = 2048
+
+
+def _link_attributes(attrs, new=False):
+    """Новые автоссылки открываются в новой вкладке, как в auto_link"""
+    if new:
+        attrs[(None, 'target')] = '_blank'
+        attrs[(None, 'rel')] = 'noopener'
+    return attrs
+
+
+class _FilterEngine(threading.local):
+    """
+    Переиспользуемые объекты рендеринга, по одному набору на поток:
+    markdown.Markdown и bleach.Cleaner не потокобезопасны, но дороги в создании
+    """
+
+    def __init__(self):
+        self.markdown = markdown.Markdown(
+            extensions=MARKDOWN_EXTENSIONS,
+            extension_configs=MARKDOWN_EXTENSION_CONFIGS,
+        )
+        self.safe_cleaner = bleach.Cleaner(tags=SAFE_TAGS, attributes=SAFE_ATTRIBUTES, strip=True)
+        self.markdown_cleaner = bleach.Cleaner(tags=MARKDOWN_TAGS, attributes=MARKDOWN_ATTRIBUTES, strip=True)
+        self.linkify_cleaner = bleach.Cleaner(
+            tags=SAFE_TAGS,
+            attributes=SAFE_ATTRIBUTES,
+            strip=True,
+            filters=[partial(LinkifyFilter, callbacks=[_link_attributes], skip_tags={'pre', 'code'})],
+        )
+
+
+_engine = _FilterEngine()
+
+
+def _memoize_by_hash(func):
+    """
+    LRU-кэш результата фильтра по хэшу содержимого: в кэше хранятся короткие
+    дайджесты, а не исходные тексты сообщений
+    """
+    cache = OrderedDict()
+    lock = threading.Lock()
+
+    @wraps(func)
+    def wrapper(text):
+        if not text:
+            return func(text)
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return Markup(cache[key])
+        result = func(text)
+        with lock:
+            cache[key] = str(result)
+            if len(cache) > RENDER_CACHE_SIZE:
+                cache.popitem(last=False)
+        return result
+
+    wrapper.cache_clear = cache.clear
+    return wrapper
 
 
 def safe_html(text):
@@ -14,34 +141,9 @@ def safe_html(text):
     """
     if not text:
         return ""
-    
-    allowed_tags = [
-        'p', 'br', 'strong', 'b', 'em', 'i', 'u', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'ul', 'ol', 'li', 'blockquote', 'code', 'pre', 'a', 'img', 'hr',
-        'div', 'span', 'table', 'thead', 'tbody', 'tr', 'th', 'td'
-    ]
-    
-    allowed_attributes = {
-        'a': ['href', 'title', 'target'],
-        'img': ['src', 'alt', 'title', 'width', 'height'],
-        'code': ['class'],
-        'div': ['class'],
-        'span': ['class'],
-        'pre': ['class'],
-        'table': ['class'],
-        'th': ['class'],
-        'td': ['class']
-    }
-    
+
     # Очищаем HTML, оставляя только разрешенные теги
-    clean_html = bleach.clean(
-        text, 
-        tags=allowed_tags, 
-        attributes=allowed_attributes,
-        strip=True
-    )
-    
-    return Markup(clean_html)
+    return Markup(_engine.safe_cleaner.clean(text))
 
 
 def nl2br(text):
@@ -56,68 +158,19 @@ def nl2br(text):
     return Markup(html_text)
 
 
+@_memoize_by_hash
 def markdown_to_html(text):
     """
     Преобразует Markdown в HTML с поддержкой подсветки кода
     """
     if not text:
         return ""
-    
-    # Настройки Markdown с расширениями
-    md = markdown.Markdown(
-        extensions=[
-            'nl2br',           # Автоматические переносы строк
-            'codehilite',      # Подсветка кода
-            'fenced_code',     # Блоки кода с ```
-            'tables',          # Поддержка таблиц
-            'toc',             # Оглавление
-            'abbr',            # Аббревиатуры
-        ],
-        extension_configs={
-            'codehilite': {
-                'css_class': 'highlight',
-                'use_pygments': True,
-            }
-        }
-    )
-    
-    # Преобразуем Markdown в HTML
-    html = md.convert(text)
-    
+
+    # Преобразуем Markdown в HTML переиспользуемым экземпляром потока
+    html = _engine.markdown.reset().convert(text)
+
     # Очищаем HTML для безопасности
-    allowed_tags = [
-        'p', 'br', 'strong', 'b', 'em', 'i', 'u', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'ul', 'ol', 'li', 'blockquote', 'code', 'pre', 'a', 'img', 'hr',
-        'div', 'span', 'table', 'thead', 'tbody', 'tr', 'th', 'td',
-        'del', 'ins'  # Для зачеркнутого и подчеркнутого текста
-    ]
-    
-    allowed_attributes = {
-        'a': ['href', 'title', 'target'],
-        'img': ['src', 'alt', 'title', 'width', 'height'],
-        'code': ['class'],
-        'div': ['class', 'id'],
-        'span': ['class'],
-        'pre': ['class'],
-        'table': ['class'],
-        'th': ['class'],
-        'td': ['class'],
-        'h1': ['id'],
-        'h2': ['id'],
-        'h3': ['id'],
-        'h4': ['id'],
-        'h5': ['id'],
-        'h6': ['id']
-    }
-    
-    clean_html = bleach.clean(
-        html, 
-        tags=allowed_tags, 
-        attributes=allowed_attributes,
-        strip=True
-    )
-    
-    return Markup(clean_html)
+    return Markup(_engine.markdown_cleaner.clean(html))
 
 
 def auto_link(text):
@@ -127,16 +180,11 @@ def auto_link(text):
     if not text:
         return ""
     
-    # Регулярное выражение для поиска URL
-    url_pattern = re.compile(
-        r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    )
-    
     def replace_url(match):
         url = match.group(0)
         return f'<a href="{url}" target="_blank" rel="noopener">{url}</a>'
     
-    linked_text = url_pattern.sub(replace_url, text)
+    linked_text = URL_PATTERN.sub(replace_url, text)
     return Markup(linked_text)
 
 
@@ -154,6 +202,12 @@ def truncate_words(text, length=50, suffix='...'):
     return ' '.join(words[:length]) + suffix
 
 
+@lru_cache(maxsize=256)
+def _search_pattern(query):
+    """Скомпилированный шаблон подсветки (спецсимволы запроса экранируются)"""
+    return re.compile(f'({re.escape(query)})', re.IGNORECASE)
+
+
 def highlight_search(text, query):
     """
     Подсвечивает поисковые запросы в тексте
@@ -161,12 +215,8 @@ def highlight_search(text, query):
     if not text or not query:
         return text
     
-    # Экранируем специальные символы в запросе
-    escaped_query = re.escape(query)
-    
     # Подсвечиваем совпадения (регистронезависимо)
-    pattern = re.compile(f'({escaped_query})', re.IGNORECASE)
-    highlighted = pattern.sub(r'<mark>\1</mark>', text)
+    highlighted = _search_pattern(query).sub(r'<mark>\1</mark>', text)
     
     return Markup(highlighted)
 
@@ -186,24 +236,23 @@ def format_file_size(size_bytes):
     return f"{size_bytes:.1f} PB"
 
 
+@_memoize_by_hash
 def smart_content(text):
     """
     Умная обработка контента:
-    1. Автоматические ссылки
-    2. Переносы строк
-    3. Безопасная очистка HTML
+    1. Переносы строк
+    2. Безопасная очистка HTML и автоматические ссылки за один проход bleach
     """
     if not text:
         return ""
-    
-    # Сначала делаем автоссылки
-    text_with_links = auto_link(text)
-    
-    # Затем переносы строк
-    text_with_breaks = nl2br(text_with_links)
-    
-    # И наконец безопасная очистка
-    return safe_html(text_with_breaks)
+
+    text_with_breaks = text.replace('\n', '<br>')
+    return Markup(_engine.linkify_cleaner.clean(text_with_breaks))
+
+
+@lru_cache(maxsize=128)
+def _compile_pattern(pattern):
+    return re.compile(pattern)
 
 
 def regex_replace(text, pattern, replacement=''):
@@ -214,7 +263,15 @@ def regex_replace(text, pattern, replacement=''):
         return ""
     
     try:
-        return re.sub(pattern, replacement, text)
+        return _compile_pattern(pattern).sub(replacement, text)
     except re.error:
         # Если регулярное выражение невалидно, возвращаем исходный текст
         return text
+
+
+def render_message_html(text):
+    """
+    Рендеринг сообщения для хранения в messages.content_html (render-on-write).
+    Возвращает тот же HTML, что и фильтр smart_content в шаблонах
+    """
+    return str(smart_content(text))
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional, Union
 from app.database import get_db
-from app.managers.db_manager import user_crud, topic_crud, message_crud
+from app.managers.db_manager import user_crud, topic_crud, message_crud, TopicOrder, topic_sort_attr
 from shared_models.schemas import (
     TopicCreate,
     TopicResponse,
@@ -12,6 +12,15 @@ from shared_models.schemas import (
     MessageUpdate,
 )
 from app.models.pydantic_models import UserBaseModel, GetUserModel
+from app.schemas.pagination import CursorPage
+from app.utils.pagination import PaginationMode, cursor_page
+from app.utils.page_cache import page_cache
+from app.utils.embedding_cache import query_embedding_cache
+from app.utils.embedding_indexer import message_indexer
+from app.utils.embedders import query_embedder
+from app.utils.http_clients import http_clients
+from app.utils.ai_stream import ai_stream_relay
+from app.utils.topic_vector_store import topic_vector_store
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -21,11 +30,22 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 # =============================================================================
 
 
-@router.get("/users", response_model=List[GetUserModel])
-async def get_all_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Получить список всех пользователей"""
-    users = await user_crud.get_users_list(db, skip=skip, limit=limit)
-    return users
+@router.get("/users", response_model=Union[List[GetUserModel], CursorPage[GetUserModel]])
+async def get_all_users(
+    skip: int = 0,
+    limit: int = 100,
+    pagination: PaginationMode = "offset",
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Получить список всех пользователей (pagination=cursor - keyset-пагинация)"""
+    try:
+        users = await user_crud.get_users_list(db, skip=skip, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if pagination == "offset" and not cursor:
+        return users
+    return cursor_page(users, limit, "created_at")
 
 
 @router.get("/users/{user_id}", response_model=GetUserModel)
@@ -101,11 +121,23 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
 # =============================================================================
 
 
-@router.get("/topics", response_model=List[TopicResponse])
-async def get_all_topics(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Получить все темы (включая неактивные)"""
-    topics = await topic_crud.get_all_topics(db, skip=skip, limit=limit)
-    return topics
+@router.get("/topics", response_model=Union[List[TopicResponse], CursorPage[TopicResponse]])
+async def get_all_topics(
+    skip: int = 0,
+    limit: int = 100,
+    order_by: TopicOrder = "updated",
+    pagination: PaginationMode = "offset",
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Получить все темы (включая неактивные, pagination=cursor - keyset-пагинация)"""
+    try:
+        topics = await topic_crud.get_all_topics(db, skip=skip, limit=limit, order_by=order_by, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if pagination == "offset" and not cursor:
+        return topics
+    return cursor_page(topics, limit, topic_sort_attr(order_by))
 
 
 @router.get("/topics/{topic_id}", response_model=TopicResponse)
@@ -154,11 +186,22 @@ async def delete_topic(topic_id: int, db: AsyncSession = Depends(get_db)):
 # =============================================================================
 
 
-@router.get("/messages", response_model=List[MessageResponse])
-async def get_all_messages(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Получить все сообщения"""
-    messages = await message_crud.get_all_messages(db, skip=skip, limit=limit)
-    return messages
+@router.get("/messages", response_model=Union[List[MessageResponse], CursorPage[MessageResponse]])
+async def get_all_messages(
+    skip: int = 0,
+    limit: int = 100,
+    pagination: PaginationMode = "offset",
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Получить все сообщения (pagination=cursor - keyset-пагинация)"""
+    try:
+        messages = await message_crud.get_all_messages(db, skip=skip, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if pagination == "offset" and not cursor:
+        return messages
+    return cursor_page(messages, limit, "created_at")
 
 
 @router.get("/messages/{message_id}", response_model=MessageResponse)
@@ -243,3 +286,22 @@ async def create_ai_message(topic_id: int, user_id: int, db: AsyncSession = Depe
     message = await message_crud.create_ai_message(db, {"topic_id": topic_id, "user_id": user_id})
 
     return message
+
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Метрики кэшей и фоновых процессов форума"""
+    return {
+        "page_cache": page_cache.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "query_embedder": query_embedder.stats(),
+        "embedding_indexer": await message_indexer.stats(),
+        "topic_vector_store": topic_vector_store.stats() if topic_vector_store is not None else None,
+        "http_clients": http_clients.stats(),
+        "ai_stream": ai_stream_relay.stats(),
+    }
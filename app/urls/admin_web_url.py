@@ -4,7 +4,7 @@ from app.templates_config import templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from app.database import get_db
-from app.managers.db_manager import user_crud, topic_crud, message_crud, category_crud, subcategory_crud
+from app.managers.db_manager import user_crud, topic_crud, message_crud, category_crud, subcategory_crud, stats_crud
 # from app.models.pydantic_models import UserRole, Status
 from app.models.pydantic_models import UserBaseModel
 from shared_models.schemas import UserRole, Status
@@ -12,9 +12,10 @@ from shared_models.schemas import MessageCreate, TopicCreate, TopicUpdate, Messa
 import json
 from app.database import async_session_maker
 import logging
-from sqlalchemy import insert, select, func
+from sqlalchemy import insert, select
 from shared_models.models import Task  # используем модель из shared_models (таблица "tasks")
 from app.celery_tasks import celery_app
+from app.utils.ai_stream import ai_stream_relay
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -35,25 +36,8 @@ async def admin_dashboard(request: Request, db: AsyncSession = Depends(get_db)):
     topics = await topic_crud.get_all_topics(db, limit=5)
     messages = await message_crud.get_all_messages(db, limit=5)
 
-    # Подсчитываем общее количество
-    all_users = await user_crud.get_users_list(db, limit=1000)
-    all_topics = await topic_crud.get_all_topics(db, limit=1000)
-    all_messages = await message_crud.get_all_messages(db, limit=1000)
-
-    # Количество задач
-    tasks_count = 0
-    try:
-        res = await db.execute(select(func.count()).select_from(Task))
-        tasks_count = int(res.scalar() or 0)
-    except Exception as e:
-        logger.warning(f"Не удалось получить количество задач: {e}")
-
-    stats = {
-        "users_count": len(all_users),
-        "topics_count": len(all_topics),
-        "messages_count": len(all_messages),
-        "tasks_count": tasks_count,
-    }
+    # Общее количество - агрегаты/оценки из кэшируемого StatsApi
+    stats = await stats_crud.get_counts(db)
 
     return templates.TemplateResponse(
         "admin/dashboard.html",
@@ -461,6 +445,7 @@ async def generate_and_save_ai_message(topic_id: str, user_id: str):
             result = await db.execute(stmt)
             task_id_db = result.scalar_one()
             await db.commit()
+        stats_crud.adjust("tasks_count", 1)
 
         # Отправляем задачу воркеру Celery по id записи
         celery_app.send_task("process_task", args=[task_id_db])
@@ -477,6 +462,20 @@ async def generate_and_save_ai_message(topic_id: str, user_id: str):
         logger.error(f"Traceback: {traceback.format_exc()}")
 
 
+async def start_ai_stream(topic_id: int, user_id: int):
+    """Запуск потоковой генерации AI сообщения в ответ на последнее сообщение темы"""
+    async with async_session_maker() as db:
+        topic = await topic_crud.get_topic_by_id(db, topic_id)
+        if not topic:
+            raise HTTPException(status_code=404, detail="Тема не найдена")
+        last_messages = await message_crud.get_topic_messages(db, topic_id, limit=1)
+    if last_messages:
+        last_message = last_messages[-1]
+        ai_stream_relay.start(topic_id, user_id, last_message.content, last_message.content, last_message.id)
+    else:
+        ai_stream_relay.start(topic_id, user_id, topic.title)
+
+
 @router.post("/messages/ai/create")
 async def admin_ai_messages_create(
     topic_id: str = Form(...),
@@ -491,6 +490,10 @@ async def admin_ai_messages_create(
         # Создаём запись в tasks и отправляем в Celery
         await generate_and_save_ai_message(topic_id, user_id)
 
+        # Потоковая генерация ответа на последнее сообщение темы: страница темы
+        # показывает токены по мере генерации (GET /topics/{id}/ai-stream)
+        await start_ai_stream(int(topic_id), int(user_id))
+
         logger.info(f"🚀 Задача добавлена в очередь для topic_id={topic_id}, user_id={user_id}")
         return RedirectResponse(
             url=f"/topics/{topic_id}?generating=true&ai_user={user_id}",
@@ -500,6 +503,8 @@ async def admin_ai_messages_create(
     except ValueError:
         logger.error(f"❌ Неверные параметры: topic_id={topic_id}, user_id={user_id}")
         raise HTTPException(status_code=400, detail="Неверные параметры запроса")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка обработки запроса: {e}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
@@ -1,8 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import List, Optional, Union
 from app.database import get_db
-from app.managers.db_manager import topic_crud, message_crud, category_crud, subcategory_crud
+from app.managers.db_manager import (
+    topic_crud,
+    message_crud,
+    category_crud,
+    subcategory_crud,
+    search_crud,
+    TopicOrder,
+    topic_sort_attr,
+)
 from shared_models.schemas import (
     TopicResponse,
     TopicWithMessages,
@@ -11,15 +19,33 @@ from shared_models.schemas import (
     TopicList,
 )
 from app.schemas.categories import TopicCreateWithCategories, CategoryResponse, SubcategoryResponse
+from app.schemas.pagination import CursorPage, ThreadPage
+from app.schemas.search import SearchResponse
+from app.utils.pagination import PaginationMode, cursor_page
 
 router = APIRouter()
 
 
-@router.get("/topics", response_model=List[TopicList])
-async def get_topics(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Получить список тем"""
-    topics = await topic_crud.get_topics_list(db, skip=skip, limit=limit)
-    return topics
+@router.get("/topics", response_model=Union[List[TopicList], CursorPage[TopicList]])
+async def get_topics(
+    skip: int = 0,
+    limit: int = 100,
+    order_by: TopicOrder = "updated",
+    pagination: PaginationMode = "offset",
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Получить список тем (order_by=activity - по последнему сообщению).
+    pagination=cursor или переданный cursor включают keyset-пагинацию с next_cursor в ответе.
+    """
+    try:
+        topics = await topic_crud.get_topics_list(db, skip=skip, limit=limit, order_by=order_by, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if pagination == "offset" and not cursor:
+        return topics
+    return cursor_page(topics, limit, topic_sort_attr(order_by))
 
 
 @router.post("/topics", response_model=TopicResponse)
@@ -101,6 +127,46 @@ async def get_topic_messages(topic_id: int, limit: int = 20, db: AsyncSession =
     return messages
 
 
+@router.get("/topics/{topic_id}/thread", response_model=ThreadPage[MessageResponse])
+async def get_topic_thread(
+    topic_id: int,
+    message_id: Optional[int] = None,
+    max_depth: int = 10,
+    limit: int = 500,
+    root_limit: int = 50,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Получить дерево ответов темы (или поддерево сообщения message_id).
+    Дерево темы строится под страницей из root_limit корневых сообщений, новые первыми;
+    next_cursor - следующая страница корней. Если деревья не уместились в limit узлов,
+    страница содержит меньше корней, а truncated сообщает, что не уместилось дерево одного корня.
+    """
+    topic = await topic_crud.get_topic_by_id(db, topic_id)
+    if not topic:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Тема не найдена")
+
+    if message_id is not None:
+        message = await message_crud.get_message_by_id(db, message_id)
+        if not message or message.topic_id != topic_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Сообщение не найдено")
+
+    try:
+        thread = await message_crud.get_topic_thread(
+            db,
+            topic_id,
+            root_message_id=message_id,
+            max_depth=min(max_depth, 50),
+            limit=min(max(limit, 1), 2000),
+            root_limit=min(max(root_limit, 1), 200),
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"items": thread.roots, "next_cursor": thread.next_cursor, "truncated": thread.truncated}
+
+
 @router.post("/messages", response_model=MessageResponse)
 async def create_message(message: MessageCreate, db: AsyncSession = Depends(get_db)):
     """Создать новое сообщение"""
@@ -126,6 +192,34 @@ async def create_message(message: MessageCreate, db: AsyncSession = Depends(get_
     return await message_crud.create_message(db, message)
 
 
+# =============================================================================
+# SEARCH API
+# =============================================================================
+
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str,
+    topic_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Поиск по темам и сообщениям (синтаксис веб-поиска: "фраза", -исключение, or).
+    Сообщения ищутся гибридно - по тексту и по смыслу (SEARCH_MODE=hybrid).
+    С topic_id поиск ведется только по сообщениям этой темы.
+    """
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Пустой поисковый запрос")
+    limit = min(max(limit, 1), 100)
+    offset = max(offset, 0)
+
+    topics = [] if topic_id else await search_crud.search_topics(db, query, limit=limit, offset=offset)
+    messages = await search_crud.search_messages_hybrid(db, query, topic_id=topic_id, limit=limit, offset=offset)
+    return {"query": query, "topics": topics, "messages": messages}
+
+
 # =============================================================================
 # CATEGORY API
 # =============================================================================
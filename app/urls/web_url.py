@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from app.templates_config import templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
-from app.managers.db_manager import topic_crud, message_crud, category_crud, subcategory_crud
+from app.managers.db_manager import topic_crud, message_crud, category_crud, subcategory_crud, search_crud
+from app.utils.page_cache import page_cache, INDEX_SCOPE, topic_scope
+from app.utils.ai_stream import ai_stream_relay
 
 router = APIRouter()
 
@@ -11,71 +13,82 @@ router = APIRouter()
 @router.get("/", response_class=HTMLResponse)
 async def index(request: Request, db: AsyncSession = Depends(get_db)):
     """Главная страница со списком тем, сгруппированных по категориям"""
-    # Получаем категории с количеством топиков
-    categories_with_topics = await category_crud.get_categories_with_topic_count(db)
-    
-    # Получаем все активные топики с предзагруженными связями
-    all_topics = await topic_crud.get_topics_list(db, limit=1000)
-    
-    # Для каждой категории получаем топики
-    categories_data = []
-    for item in categories_with_topics:
-        category = item["category"]
-        
-        # Фильтруем топики этой категории
-        category_topics = [t for t in all_topics if t.category_id == category.id]
-        
-        # Добавляем количество сообщений для каждой темы
-        topics_with_counts = []
-        for topic in category_topics[:10]:  # Показываем максимум 10 топиков на категорию
-            messages = await message_crud.get_topic_messages(db, topic.id)
-            topic_data = {
-                "topic": topic,
-                "message_count": len(messages)
-            }
-            topics_with_counts.append(topic_data)
-        
-        if topics_with_counts:  # Показываем только категории с топиками
-            categories_data.append({
-                "category": category,
-                "topics": topics_with_counts,
-                "total_topics": len(category_topics)
-            })
-    
-    # Добавляем топики без категории
-    uncategorized_topics = [t for t in all_topics if not t.category_id]
-    
-    uncategorized_with_counts = []
-    for topic in uncategorized_topics[:10]:  # Показываем максимум 10 топиков
-        messages = await message_crud.get_topic_messages(db, topic.id)
-        topic_data = {
-            "topic": topic,
-            "message_count": len(messages)
-        }
-        uncategorized_with_counts.append(topic_data)
+    cache_key = await page_cache.page_key("index", INDEX_SCOPE)
+    cached_page = await page_cache.get(cache_key)
+    if cached_page is not None:
+        return HTMLResponse(cached_page)
+
+    # Категории, топ-10 тем в каждой и количество сообщений - одним запросом
+    overview = await topic_crud.get_index_overview(db, per_category=10)
+    uncategorized = overview["uncategorized"]
 
     # Получаем 10 последних сообщений из всех топиков
     recent_messages = await message_crud.get_recent_messages_with_topics(db, limit=5)
 
-    return templates.TemplateResponse("index.html", {
+    response = templates.TemplateResponse("index.html", {
         "request": request, 
-        "categories_data": categories_data,
-        "uncategorized_topics": uncategorized_with_counts,
-        "total_uncategorized": len(uncategorized_topics),
+        "categories_data": overview["categories_data"],
+        "uncategorized_topics": uncategorized["topics"],
+        "total_uncategorized": uncategorized["total_topics"],
         "recent_messages": recent_messages
     })
+    await page_cache.set(cache_key, response.body.decode())
+    return response
 
 
 @router.get("/topics/{topic_id}", response_class=HTMLResponse)
 async def topic_detail(request: Request, topic_id: int, db: AsyncSession = Depends(get_db)):
     """Страница темы с сообщениями"""
+    cache_key = await page_cache.page_key("topic", topic_scope(topic_id))
+    cached_page = await page_cache.get(cache_key)
+    if cached_page is not None:
+        return HTMLResponse(cached_page)
+
     topic = await topic_crud.get_topic_by_id(db, topic_id)
     if not topic:
         raise HTTPException(status_code=404, detail="Тема не найдена")
 
     messages = await message_crud.get_topic_messages(db, topic_id, limit=20)
 
-    return templates.TemplateResponse("topic.html", {"request": request, "topic": topic, "messages": messages})
+    response = templates.TemplateResponse("topic.html", {"request": request, "topic": topic, "messages": messages})
+    await page_cache.set(cache_key, response.body.decode())
+    return response
+
+
+@router.get("/topics/{topic_id}/ai-stream")
+async def topic_ai_stream(topic_id: int, ai_user: int):
+    """Поток генерируемого AI сообщения темы (Server-Sent Events)"""
+    generation = ai_stream_relay.get(topic_id, ai_user)
+    if generation is None:
+        raise HTTPException(status_code=404, detail="Генерация не найдена")
+    return StreamingResponse(
+        generation.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/search", response_class=HTMLResponse)
+async def search_page(request: Request, q: str = "", page: int = 1, db: AsyncSession = Depends(get_db)):
+    """Страница результатов поиска"""
+    query = q.strip()
+    page = max(page, 1)
+    per_page = 20
+    topics, messages = [], []
+    if query:
+        offset = (page - 1) * per_page
+        if page == 1:
+            topics = await search_crud.search_topics(db, query, limit=10)
+        messages = await search_crud.search_messages_hybrid(db, query, limit=per_page, offset=offset)
+
+    return templates.TemplateResponse("search.html", {
+        "request": request,
+        "query": query,
+        "page": page,
+        "per_page": per_page,
+        "topics": topics,
+        "messages": messages
+    })
 
 
 @router.get("/create-topic", response_class=HTMLResponse)
@@ -0,0 +1,172 @@
+"""
+Ретрансляция потоковой генерации AI сообщений на страницу темы
+
+Генерация идет фоновой задачей процесса форума: токены из потока AI Manager
+(/generate/stream) накапливаются в AIGeneration, а страница темы подписывается
+на них через Server-Sent Events и видит ответ по мере генерации. Подписчик,
+пришедший позже (перезагрузка страницы), сначала получает уже накопленный текст.
+Готовое сообщение сохраняется один раз, по завершении потока, независимо от
+числа подписчиков и от того, остался ли кто-то на странице.
+
+Состояние живет в памяти процесса: при нескольких воркерах uvicorn подписка
+возможна только в том процессе, который запустил генерацию; в остальных
+страница получает 404 и просто ждет сохраненного сообщения.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.managers.ai_manager import AIManager
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(payload: dict) -> str:
+    """Событие Server-Sent Events с JSON-данными"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class AIGeneration:
+    """Одна потоковая генерация: накопленные токены и итог (id сообщения или ошибка)"""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.finished = False
+        self.message_id: Optional[int] = None
+        self.error: Optional[str] = None
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._condition = asyncio.Condition()
+
+    async def publish(self, token: str) -> None:
+        async with self._condition:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            self.tokens.append(token)
+            self._condition.notify_all()
+
+    async def finish(self, message_id: Optional[int] = None, error: Optional[str] = None) -> None:
+        async with self._condition:
+            self.finished = True
+            self.message_id = message_id
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._condition.notify_all()
+
+    async def events(self) -> AsyncIterator[str]:
+        """SSE-события подписчика: накопленный текст, новые токены и итоговое событие"""
+        position = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: len(self.tokens) > position or self.finished)
+                chunk = "".join(self.tokens[position:])
+                position = len(self.tokens)
+                finished = self.finished
+            if chunk:
+                yield sse_event({"token": chunk})
+            if finished:
+                if self.error is not None:
+                    yield sse_event({"error": self.error})
+                else:
+                    yield sse_event({"done": True, "message_id": self.message_id})
+                return
+
+
+class AIStreamRelay:
+    """Потоковые генерации по (тема, AI пользователь)"""
+
+    def __init__(self, manager_factory: Callable[[], AIManager] = AIManager, keep_finished: float = 60.0):
+        self.manager_factory = manager_factory
+        self.keep_finished = keep_finished
+        self._generations: Dict[Tuple[int, int], AIGeneration] = {}
+        self._metrics = {"started": 0, "completed": 0, "failed": 0}
+        self._last_ttft: Optional[float] = None
+
+    def start(
+        self,
+        topic_id: int,
+        user_id: int,
+        question: str,
+        last_message_content: str = "",
+        reply_message_id: Optional[int] = None,
+    ) -> AIGeneration:
+        """Запустить генерацию (если для темы и пользователя она уже идет - вернуть текущую)"""
+        self._prune()
+        generation = self._generations.get((topic_id, user_id))
+        if generation is not None and not generation.finished:
+            return generation
+        generation = AIGeneration()
+        generation.task = asyncio.get_running_loop().create_task(
+            self._run(generation, topic_id, user_id, question, last_message_content, reply_message_id)
+        )
+        self._generations[(topic_id, user_id)] = generation
+        self._metrics["started"] += 1
+        return generation
+
+    def get(self, topic_id: int, user_id: int) -> Optional[AIGeneration]:
+        """Идущая или недавно завершенная генерация"""
+        self._prune()
+        return self._generations.get((topic_id, user_id))
+
+    async def close(self) -> None:
+        """Прервать идущие генерации (завершение приложения)"""
+        for generation in self._generations.values():
+            if generation.task is not None and not generation.task.done():
+                generation.task.cancel()
+                try:
+                    await generation.task
+                except asyncio.CancelledError:
+                    pass
+        self._generations = {}
+
+    def stats(self) -> dict:
+        return {
+            **self._metrics,
+            "active": sum(1 for generation in self._generations.values() if not generation.finished),
+            "last_time_to_first_token_seconds": round(self._last_ttft, 3) if self._last_ttft is not None else None,
+        }
+
+    async def _run(
+        self,
+        generation: AIGeneration,
+        topic_id: int,
+        user_id: int,
+        question: str,
+        last_message_content: str,
+        reply_message_id: Optional[int],
+    ) -> None:
+        try:
+            manager = self.manager_factory()
+            prompt = await manager.get_prompt(str(topic_id), str(user_id), question)
+            async for token in manager.stream_ai_message(prompt):
+                await generation.publish(token)
+                if len(generation.tokens) == 1:
+                    self._last_ttft = generation.first_token_at - generation.started_at
+            message = await manager.save_ai_message(
+                topic_id, user_id, "".join(generation.tokens), last_message_content, reply_message_id
+            )
+            await generation.finish(message_id=message.id)
+            self._metrics["completed"] += 1
+        except asyncio.CancelledError:
+            await generation.finish(error="Генерация прервана")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка потоковой генерации AI сообщения для темы {topic_id}: {e}")
+            await generation.finish(error="Ошибка генерации AI сообщения")
+            self._metrics["failed"] += 1
+
+    def _prune(self) -> None:
+        """Забыть генерации, завершившиеся больше keep_finished секунд назад"""
+        now = time.monotonic()
+        self._generations = {
+            key: generation
+            for key, generation in self._generations.items()
+            if not generation.finished or now - generation.finished_at < self.keep_finished
+        }
+
+
+ai_stream_relay = AIStreamRelay()
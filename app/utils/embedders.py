@@ -0,0 +1,311 @@
+"""
+Провайдеры эмбеддингов
+
+Embedder - общий интерфейс получения векторов для батча текстов с метриками
+пропускной способности и согласованием размерности с колонкой vector(N) таблицы.
+Бэкенды: OllamaEmbedder (/api/embed) и HashingEmbedder - детерминированный
+feature hashing на CPU для тестов и офлайн-режима. BatchingEmbedder объединяет
+одновременные запросы разных вызывающих в батчи (до max_batch_size текстов или
+max_wait секунд ожидания), так что каждый вызывающий получает батчинг бесплатно.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from app.config import get_settings
+from app.utils.embedding_cache import query_embedding_cache
+
+if TYPE_CHECKING:
+    from app.utils.embedding_manager import EmbeddingSpace
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("ollama", "hashing")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class Embedder(ABC):
+    """Интерфейс провайдера эмбеддингов"""
+
+    def __init__(self, dimensions: Optional[int] = None):
+        # None - размерность еще неизвестна и определится по первому ответу
+        self.dimensions = dimensions
+        self._metrics = {"batches": 0, "texts": 0, "errors": 0, "seconds": 0.0}
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """Имя бэкенда и модели (различает эмбеддинги разных моделей, например в кэше)"""
+
+    @abstractmethod
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Эмбеддинги батча текстов одним обращением к модели"""
+
+    async def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Эмбеддинги текстов в порядке texts"""
+        if not texts:
+            return []
+        started = time.perf_counter()
+        try:
+            embeddings = await self._embed_batch(list(texts))
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"{self.name} вернул {len(embeddings)} эмбеддингов на {len(texts)} текстов")
+            self._check_dimensions(embeddings)
+        except Exception:
+            self._metrics["errors"] += 1
+            raise
+        self._metrics["batches"] += 1
+        self._metrics["texts"] += len(texts)
+        self._metrics["seconds"] += time.perf_counter() - started
+        return embeddings
+
+    async def embed_one(self, text: str) -> List[float]:
+        """Эмбеддинг одного текста"""
+        return (await self.embed([text]))[0]
+
+    async def negotiate_dimensions(self, table_dimensions: int) -> int:
+        """
+        Согласовать размерность с колонкой vector(N) таблицы. Модель с фиксированной
+        размерностью проверяется пробным запросом, при несовпадении - ValueError
+        """
+        if self.dimensions is None:
+            await self.embed_one("dimension probe")
+        if self.dimensions != table_dimensions:
+            raise ValueError(
+                f"Размерность {self.name} ({self.dimensions}) не совпадает с колонкой vector({table_dimensions})"
+            )
+        return self.dimensions
+
+    async def close(self) -> None:
+        """Освободить ресурсы бэкенда"""
+
+    def stats(self) -> dict:
+        """Метрики пропускной способности"""
+        seconds = self._metrics["seconds"]
+        batches = self._metrics["batches"]
+        return {
+            "name": self.name,
+            "dimensions": self.dimensions,
+            **self._metrics,
+            "seconds": round(seconds, 3),
+            "avg_batch_size": round(self._metrics["texts"] / batches, 1) if batches else 0.0,
+            "texts_per_second": round(self._metrics["texts"] / seconds, 1) if seconds else 0.0,
+        }
+
+    def _check_dimensions(self, embeddings: List[List[float]]) -> None:
+        if self.dimensions is None:
+            self.dimensions = len(embeddings[0])
+        if any(len(embedding) != self.dimensions for embedding in embeddings):
+            raise RuntimeError(f"{self.name} вернул эмбеддинги размерности, отличной от {self.dimensions}")
+
+
+class OllamaEmbedder(Embedder):
+    """Эмбеддинги модели Ollama (POST /api/embed, батч в поле input)"""
+
+    def __init__(self, base_url: str, model: str, client: Optional[httpx.AsyncClient] = None, timeout: float = 120.0):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self._client = client
+        self._owns_client = client is None
+
+    @property
+    def name(self) -> str:
+        return f"ollama:{self.model}"
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        response = await self._client.post(f"{self.base_url}/api/embed", json={"model": self.model, "input": texts})
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    async def close(self) -> None:
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+
+class HashingEmbedder(Embedder):
+    """
+    Детерминированные эмбеддинги без модели: слова хэшируются в координаты
+    со знаком (feature hashing), вектор нормируется. Тексты с общими словами
+    получают близкие векторы, чего достаточно для тестов и офлайн-разработки
+    """
+
+    def __init__(self, dimensions: int = 1536):
+        super().__init__(dimensions)
+
+    @property
+    def name(self) -> str:
+        return f"hashing:{self.dimensions}"
+
+    async def negotiate_dimensions(self, table_dimensions: int) -> int:
+        # Размерность хэширования произвольная - подстраиваемся под таблицу
+        self.dimensions = table_dimensions
+        return table_dimensions
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_text(text) for text in texts]
+
+    def _embed_text(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in TOKEN_PATTERN.findall(text.casefold()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        if not norm:
+            # Нулевой вектор не имеет косинусного расстояния
+            vector[0] = 1.0
+            return vector
+        return [value / norm for value in vector]
+
+
+class BatchingEmbedder(Embedder):
+    """Очередь над бэкендом: одновременные вызовы объединяются в общие батчи"""
+
+    def __init__(self, backend: Embedder, max_batch_size: int = 32, max_wait: float = 0.01):
+        super().__init__(backend.dimensions)
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    async def negotiate_dimensions(self, table_dimensions: int) -> int:
+        self.dimensions = await self.backend.negotiate_dimensions(table_dimensions)
+        return self.dimensions
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self._ensure_consumer()
+        futures = []
+        for text in texts:
+            future = self._loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def close(self) -> None:
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        """Метрики вызывающих (requests) и фактических батчей бэкенда (backend)"""
+        return {
+            **super().stats(),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "backend": self.backend.stats(),
+        }
+
+    def _ensure_consumer(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._consumer = None
+        if self._consumer is None or self._consumer.done():
+            self._consumer = loop.create_task(self._consume())
+
+    async def _consume(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                embeddings = await self.backend.embed([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.dimensions = self.backend.dimensions
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    async def _next_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Ждать первый текст, затем добирать батч до max_batch_size или истечения max_wait"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+
+def create_embedder(
+    backend: Optional[str] = None,
+    model: Optional[str] = None,
+    dimensions: Optional[int] = None
+) -> Embedder:
+    """Бэкенд эмбеддингов по настройкам EMBEDDING_* (или явно заданным параметрам)"""
+    settings = get_settings
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "ollama":
+        return OllamaEmbedder(settings.OLLAMA_URL, model or settings.EMBEDDING_MODEL)
+    if backend == "hashing":
+        return HashingEmbedder(dimensions or settings.EMBEDDING_DIMENSIONS)
+    raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}, допустимы {EMBEDDING_BACKENDS}")
+
+
+async def embed_query(
+    text: str, space: Optional["EmbeddingSpace"] = None, dimensions: Optional[int] = None
+) -> List[float]:
+    """
+    Эмбеддинг поискового запроса; повторные и почти одинаковые запросы берутся из кэша.
+    space - пространство, в котором ищем (EmbeddingManager.space): вектор запроса
+    должен быть получен той же моделью, что и векторы колонки; dimensions - размерность
+    колонки, с которой согласуется эмбеддер запроса
+    """
+    embedder = query_embedder if space is None else _space_query_embedder(space)
+    if dimensions and embedder.dimensions != dimensions:
+        await embedder.negotiate_dimensions(dimensions)
+    return await query_embedding_cache.get_or_compute(embedder.name, text, embedder.embed_one)
+
+
+async def close_query_embedders() -> None:
+    """Остановить батчинг запросов и закрыть клиенты бэкендов (завершение процесса)"""
+    for embedder in [query_embedder, *_space_query_embedders.values()]:
+        await embedder.close()
+    _space_query_embedders.clear()
+
+
+def _space_query_embedder(space: "EmbeddingSpace") -> Embedder:
+    if space.name not in _space_query_embedders:
+        backend = create_embedder(space.backend, space.model, space.dimensions)
+        _space_query_embedders[space.name] = BatchingEmbedder(
+            backend, max_batch_size=get_settings.EMBEDDING_BATCH_SIZE, max_wait=get_settings.EMBEDDING_QUERY_BATCH_WAIT
+        )
+    return _space_query_embedders[space.name]
+
+
+settings = get_settings
+query_embedder = BatchingEmbedder(
+    create_embedder(),
+    max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+    max_wait=settings.EMBEDDING_QUERY_BATCH_WAIT,
+)
+_space_query_embedders: Dict[str, Embedder] = {}
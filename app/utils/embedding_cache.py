@@ -0,0 +1,150 @@
+"""
+Кэш эмбеддингов поисковых запросов
+
+Ключ - хэш модели и нормализованного текста запроса (Unicode NFKC, регистр,
+пробелы), поэтому почти одинаковые вопросы не отправляются в модель повторно.
+Векторы хранятся компактно - буфером float32 (4 байта на компоненту), вытесняются
+по LRU и устаревают через QUERY_EMBEDDING_CACHE_TTL. С QUERY_EMBEDDING_CACHE_BACKEND=redis
+Redis служит общим вторым уровнем для всех воркеров.
+"""
+import hashlib
+import logging
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from app.config import get_settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis - опциональная зависимость (extras "cache")
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Нормализация текста запроса для ключа кэша"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def pack_embedding(embedding: Sequence[float]) -> bytes:
+    """Вектор в буфер float32"""
+    return array("f", embedding).tobytes()
+
+
+def unpack_embedding(buffer: bytes) -> List[float]:
+    """Буфер float32 в список чисел"""
+    values = array("f")
+    values.frombytes(buffer)
+    return values.tolist()
+
+
+class QueryEmbeddingCache:
+    """In-process LRU эмбеддингов запросов с TTL и опциональным Redis вторым уровнем"""
+
+    KEY_PREFIX = "forum:query_embedding:"
+
+    def __init__(self, max_entries: int = 10000, ttl: int = 3600, redis_url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, bytes]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._redis = None
+        if redis_url:
+            if aioredis is None:
+                logger.warning(
+                    "QUERY_EMBEDDING_CACHE_BACKEND=redis, но пакет redis не установлен - используется память"
+                )
+            else:
+                self._redis = aioredis.from_url(redis_url)
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        """Ключ кэша: хэш модели и нормализованного текста"""
+        return hashlib.blake2b(f"{model}\0{normalize_query(text)}".encode("utf-8"), digest_size=16).digest()
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Эмбеддинг запроса из кэша или None"""
+        key = self.key(model, text)
+        buffer = self._get_local(key)
+        if buffer is None and self._redis is not None:
+            try:
+                buffer = await self._redis.get(self.KEY_PREFIX + key.hex())
+            except Exception as e:
+                logger.warning(f"Ошибка чтения кэша эмбеддингов из Redis: {e}")
+            if buffer is not None:
+                self._set_local(key, buffer)
+
+        if buffer is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return unpack_embedding(buffer)
+
+    async def set(self, model: str, text: str, embedding: Sequence[float]) -> None:
+        """Сохранить эмбеддинг запроса"""
+        key, buffer = self.key(model, text), pack_embedding(embedding)
+        self._set_local(key, buffer)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self.KEY_PREFIX + key.hex(), buffer, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Ошибка записи кэша эмбеддингов в Redis: {e}")
+
+    async def get_or_compute(
+        self, model: str, text: str, compute: Callable[[str], Awaitable[Sequence[float]]]
+    ) -> List[float]:
+        """Эмбеддинг из кэша, а при промахе - вычисленный compute(text) и сохраненный"""
+        embedding = await self.get(model, text)
+        if embedding is None:
+            computed = await compute(text)
+            await self.set(model, text, computed)
+            # Возвращаем значение в том же виде (float32), что и при попадании
+            embedding = unpack_embedding(pack_embedding(computed))
+        return embedding
+
+    def clear(self) -> None:
+        """Очистить локальный уровень кэша"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Метрики попаданий/промахов и размер кэша"""
+        requests = self._hits + self._misses
+        return {
+            "backend": "redis" if self._redis is not None else "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": sum(len(buffer) for _, buffer in self._entries.values()),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / requests, 3) if requests else 0.0,
+        }
+
+    def _get_local(self, key: bytes) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, buffer = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return buffer
+
+    def _set_local(self, key: bytes, buffer: bytes) -> None:
+        self._entries[key] = (time.monotonic(), buffer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+settings = get_settings
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+    ttl=settings.QUERY_EMBEDDING_CACHE_TTL,
+    redis_url=settings.REDIS_URL if settings.QUERY_EMBEDDING_CACHE_BACKEND == "redis" else None,
+)
@@ -0,0 +1,371 @@
+"""
+Фоновая индексация эмбеддингов сообщений форума
+
+Создание сообщения ставит его id в очередь индексатора. Потребитель собирает id
+в микро-батчи (до EMBEDDING_BATCH_SIZE штук или EMBEDDING_BATCH_WAIT секунд
+ожидания), получает эмбеддинги всего батча одним вызовом Embedder и записывает
+их через COPY. Очередь живет в памяти процесса: то, что не успело проиндексироваться
+(переполнение, ошибка, перезапуск), подбирает догоняющий режим catch_up, который
+ищет сообщения без эмбеддингов (Celery-задача index_missing_embeddings).
+
+При смене модели (пространства эмбеддингов в состоянии backfill) новые сообщения
+дополнительно получают векторы нового пространства, а backfill_space дозаполняет
+историю порциями с паузами между ними.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+from app.config import get_settings
+from app.utils.embedders import Embedder, create_embedder
+from app.utils.embedding_manager import (  # noqa: F401
+    SPACE_REFRESH_SECONDS,
+    EmbeddingManager,
+    EmbeddingSpace,
+    asyncpg_database_url,
+    content_hash,
+)
+from app.utils.topic_vector_store import topic_vector_store
+
+logger = logging.getLogger(__name__)
+
+
+class MessageEmbeddingIndexer:
+    """Очередь сообщений на индексацию с микро-батчингом по размеру и времени"""
+
+    TABLE = "message_embeddings"
+
+    def __init__(
+        self,
+        batch_size: int = 32,
+        max_wait: float = 0.5,
+        max_queue: int = 10000,
+        embedder: Optional[Embedder] = None,
+    ):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._manager: Optional[EmbeddingManager] = None
+        self._embedder = embedder
+        self._owns_embedder = embedder is None
+        self._dimensions_checked = False
+        self._space_embedders: Dict[str, Embedder] = {}
+        self._backfill_spaces: List[EmbeddingSpace] = []
+        self._spaces_checked_at = 0.0
+        self._manager_lock: Optional[asyncio.Lock] = None
+        self._metrics = {
+            "enqueued": 0,
+            "dropped": 0,
+            "indexed": 0,
+            "deduplicated": 0,
+            "changes_applied": 0,
+            "dual_writes": 0,
+            "dual_write_errors": 0,
+            "backfilled": 0,
+            "batches": 0,
+            "failed_batches": 0,
+        }
+        self._last_lag: Optional[float] = None
+        self._max_lag = 0.0
+
+    def enqueue(self, message_id: int) -> None:
+        """Поставить сообщение в очередь (не блокирует; при переполнении его подберет catch_up)"""
+        self._ensure_consumer()
+        try:
+            self._queue.put_nowait((message_id, time.monotonic()))
+            self._metrics["enqueued"] += 1
+        except asyncio.QueueFull:
+            self._metrics["dropped"] += 1
+
+    async def catch_up(self, batch_size: Optional[int] = None) -> int:
+        """
+        Применить все накопленные изменения сообщений и проиндексировать сообщения
+        без эмбеддингов, возвращает количество проиндексированных
+        """
+        batch_size = batch_size or self.batch_size
+        manager = await self.get_manager()
+        total, after_id = 0, 0
+        while (written := await self._apply_changes(manager, batch_size)) is not None:
+            total += written
+        while rows := await manager.fetch_unindexed_messages(after_id, batch_size):
+            after_id = rows[-1][0]
+            total += await self._write(rows)
+        return total
+
+    async def backfill_space(self, name: str, batch_size: Optional[int] = None, pause: float = 0.0) -> int:
+        """
+        Дозаполнить векторы пространства name для уже проиндексированных сообщений.
+        pause - пауза между порциями в секундах, ограничивает нагрузку на модель и базу.
+        Повторный запуск продолжает с еще не заполненных строк
+
+        Returns:
+            Количество дозаполненных строк
+        """
+        batch_size = batch_size or self.batch_size
+        manager = await self.get_manager()
+        space = await manager.get_space(name)
+        embedder = await self._get_space_embedder(space)
+        total, after_id = 0, 0
+        while rows := await manager.fetch_space_backfill(space, after_id, batch_size):
+            after_id = rows[-1][0]
+            embeddings = await embedder.embed([content for _, content in rows])
+            await manager.write_space_embeddings(space, [row_id for row_id, _ in rows], embeddings)
+            total += len(rows)
+            self._metrics["backfilled"] += len(rows)
+            if pause:
+                await asyncio.sleep(pause)
+        return total
+
+    async def close(self) -> None:
+        """Остановить потребителя и закрыть соединения"""
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+        await self._close_resources(*self._detach_resources())
+        self._reset()
+
+    async def stats(self) -> dict:
+        """Метрики индексатора и отставание индексации по данным базы"""
+        stats = {
+            **self._metrics,
+            "dedup_ratio": round(self._metrics["deduplicated"] / self._metrics["indexed"], 3)
+            if self._metrics["indexed"] else 0.0,
+            "embedder": self._embedder.stats() if self._embedder is not None else None,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "last_lag_seconds": round(self._last_lag, 3) if self._last_lag is not None else None,
+            "max_lag_seconds": round(self._max_lag, 3),
+        }
+        try:
+            pending, oldest_age = await (await self.get_manager()).indexing_backlog()
+            stats.update(pending_messages=pending, oldest_pending_age_seconds=oldest_age)
+        except Exception as e:
+            logger.warning(f"Не удалось получить отставание индексации: {e}")
+        return stats
+
+    def _ensure_consumer(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (например, asyncio.run в Celery-задаче): соединения
+            # старого цикла использовать нельзя, недоделанную очередь подберет catch_up
+            if self._loop is not None:
+                self._release_stale_resources(self._loop)
+            self._reset()
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if self._consumer is None or self._consumer.done():
+            self._consumer = loop.create_task(self._consume())
+
+    def _detach_resources(self) -> Tuple[Optional[EmbeddingManager], List[Embedder]]:
+        """Забрать пул соединений и собственные эмбеддеры для закрытия"""
+        manager, self._manager = self._manager, None
+        embedders = list(self._space_embedders.values())
+        self._space_embedders = {}
+        if self._embedder is not None and self._owns_embedder:
+            embedders.append(self._embedder)
+            self._embedder = None
+        return manager, embedders
+
+    @staticmethod
+    async def _close_resources(manager: Optional[EmbeddingManager], embedders: List[Embedder]) -> None:
+        for embedder in embedders:
+            try:
+                await embedder.close()
+            except Exception as e:
+                logger.warning(f"Не удалось закрыть эмбеддер {embedder.name}: {e}")
+        if manager is not None:
+            await manager.close()
+
+    def _release_stale_resources(self, old_loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Ресурсы привязаны к циклу, в котором созданы: закрываем их в нем же, если он
+        еще работает (в другом потоке). Завершившийся цикл закрыть соединения уже не
+        даст - пул asyncpg обрывается синхронно, остальное освободит сборщик мусора.
+        Штатно индексатор закрывается до завершения цикла (lifespan, run_async в Celery)
+        """
+        manager, embedders = self._detach_resources()
+        if manager is None and not embedders:
+            return
+        if old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._close_resources(manager, embedders), old_loop)
+            return
+        logger.warning("Индексатор эмбеддингов не был закрыт до завершения цикла событий")
+        if manager is not None and manager.pool is not None:
+            try:
+                manager.pool.terminate()
+            except RuntimeError as e:
+                logger.warning(f"Не удалось оборвать соединения пула индексатора: {e}")
+
+    def _reset(self) -> None:
+        self._queue = None
+        self._consumer = None
+        self._loop = None
+        self._manager_lock = None
+        self._dimensions_checked = False
+        self._spaces_checked_at = 0.0
+
+    async def _consume(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._index(batch)
+            except Exception as e:
+                self._metrics["failed_batches"] += 1
+                logger.error(f"Ошибка индексации батча из {len(batch)} сообщений: {e}")
+
+    async def _next_batch(self) -> List[Tuple[int, float]]:
+        """Ждать первое сообщение, затем добирать батч до batch_size или истечения max_wait"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _index(self, batch: List[Tuple[int, float]]) -> None:
+        manager = await self.get_manager()
+        # Измененные и удаленные сообщения тоже приходят в очередь: их изменения из
+        # outbox применяются отдельной транзакцией, затем индексируются новые
+        try:
+            await self._apply_changes(manager, self.batch_size)
+        except Exception as e:
+            logger.warning(f"Изменения сообщений не применены и остались в outbox: {e}")
+        rows = await manager.fetch_messages_for_indexing(sorted({message_id for message_id, _ in batch}))
+        await self._write(rows)
+
+        now = time.monotonic()
+        self._last_lag = now - min(enqueued_at for _, enqueued_at in batch)
+        self._max_lag = max(self._max_lag, self._last_lag)
+
+    async def _apply_changes(self, manager: EmbeddingManager, limit: int) -> Optional[int]:
+        """
+        Переиндексировать порцию изменений из outbox: снятие устаревших эмбеддингов,
+        запись новых и удаление строк outbox фиксируются вместе (claim_embedding_changes).
+        При ошибке изменения остаются в outbox
+
+        Returns:
+            Количество записанных эмбеддингов, None - outbox пуст
+        """
+        async with manager.claim_embedding_changes(limit) as changes:
+            if changes is None:
+                return None
+            rows = await manager.fetch_messages_for_indexing(changes.message_ids, connection=changes.connection)
+            written = await self._write(rows, connection=changes.connection)
+        self._metrics["changes_applied"] += len(changes.message_ids)
+        return written
+
+    async def _write(
+        self,
+        rows: List[Tuple[int, int, str]],
+        connection: Optional[asyncpg.Connection] = None
+    ) -> int:
+        """
+        Эмбеддинги батча одним запросом и запись через COPY. Содержимое, уже
+        встречавшееся в message_embeddings или в этом же батче, в модель не отправляется.
+        connection - транзакция, в которой идет запись (применение изменений из outbox)
+        """
+        if not rows:
+            return 0
+        manager = await self.get_manager()
+        await self._refresh_spaces(manager)
+        if manager.space is not None:
+            embedder = await self._get_space_embedder(manager.space)
+        else:
+            embedder = self._get_embedder()
+            if not self._dimensions_checked:
+                table_dimensions = await manager.vector_dimensions(self.TABLE)
+                if table_dimensions:
+                    await embedder.negotiate_dimensions(table_dimensions)
+                self._dimensions_checked = True
+        hashes = [content_hash(content) for _, _, content in rows]
+        known = await manager.find_embeddings_by_hash(hashes)
+        missing = {key: content for key, (_, _, content) in zip(hashes, rows) if key not in known}
+        if missing:
+            known.update(zip(missing, await embedder.embed(list(missing.values()))))
+        ids = await manager.insert_message_embeddings_bulk(
+            [
+                (message_id, topic_id, content, known[key], None)
+                for (message_id, topic_id, content), key in zip(rows, hashes)
+            ],
+            connection=connection
+        )
+        for space in self._backfill_spaces:
+            await self._dual_write(manager, space, ids, [content for _, _, content in rows], connection)
+        self._metrics["batches"] += 1
+        self._metrics["indexed"] += len(rows)
+        self._metrics["deduplicated"] += len(rows) - len(missing)
+        return len(rows)
+
+    async def _dual_write(
+        self,
+        manager: EmbeddingManager,
+        space: EmbeddingSpace,
+        ids: List[int],
+        contents: List[str],
+        connection: Optional[asyncpg.Connection] = None
+    ) -> None:
+        """Векторы дозаполняемого пространства для только что записанных строк"""
+        try:
+            embedder = await self._get_space_embedder(space)
+            unique = list(dict.fromkeys(contents))
+            vectors = dict(zip(unique, await embedder.embed(unique)))
+            await manager.write_space_embeddings(
+                space, ids, [vectors[content] for content in contents], connection=connection
+            )
+            self._metrics["dual_writes"] += len(ids)
+        except Exception as e:
+            # Строки останутся без вектора пространства - их подберет backfill_space
+            self._metrics["dual_write_errors"] += 1
+            logger.warning(f"Не удалось записать векторы пространства {space.name}: {e}")
+
+    async def _refresh_spaces(self, manager: EmbeddingManager) -> None:
+        """Не чаще раза в SPACE_REFRESH_SECONDS: активное пространство и пространства для двойной записи"""
+        if time.monotonic() - self._spaces_checked_at < SPACE_REFRESH_SECONDS:
+            return
+        self._spaces_checked_at = time.monotonic()
+        await manager.refresh_space()
+        self._backfill_spaces = [space for space in await manager.list_spaces() if space.state == "backfill"]
+
+    async def _get_space_embedder(self, space: EmbeddingSpace) -> Embedder:
+        if space.name not in self._space_embedders:
+            embedder = create_embedder(space.backend, space.model, space.dimensions)
+            await embedder.negotiate_dimensions(space.dimensions)
+            self._space_embedders[space.name] = embedder
+        return self._space_embedders[space.name]
+
+    async def get_manager(self) -> EmbeddingManager:
+        """Менеджер эмбеддингов процесса: общий пул для индексации и поиска (SearchApi)"""
+        if self._manager_lock is None:
+            self._manager_lock = asyncio.Lock()
+        async with self._manager_lock:
+            if self._manager is None:
+                manager = EmbeddingManager.from_settings(vector_store=topic_vector_store)
+                await manager.initialize()
+                self._manager = manager
+        return self._manager
+
+    def _get_embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = create_embedder()
+        return self._embedder
+
+
+settings = get_settings
+message_indexer = MessageEmbeddingIndexer(
+    batch_size=settings.EMBEDDING_BATCH_SIZE,
+    max_wait=settings.EMBEDDING_BATCH_WAIT,
+    max_queue=settings.EMBEDDING_QUEUE_SIZE,
+)
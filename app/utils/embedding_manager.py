@@ -2,19 +2,166 @@
 Модуль для работы с pgvector и эмбеддингами в PostgreSQL
 """
 import asyncio
+import hashlib
+import html
+import itertools
 import json
-from typing import List, Optional, Tuple
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
 import asyncpg
 from pgvector.asyncpg import register_vector
 
+from app.config import get_settings
+from app.utils.topic_vector_store import StoredVector, TopicVectorStore
+
+
+# Таблицы с векторной колонкой embedding, для которых строятся ANN-индексы
+VECTOR_TABLES = ("embeddings", "message_embeddings")
+VECTOR_INDEX_TYPES = ("ivfflat", "hnsw")
+
+# Формат хранения векторов: тип pgvector -> колонка. halfvec (float16, pgvector >= 0.7)
+# вдвое компактнее; существующие строки переносит convert_to_halfvec
+STORAGE_COLUMNS = {"vector": "embedding", "halfvec": "embedding_half"}
+VECTOR_QUANTIZATIONS = ("none", "binary")
+
+# Пространства эмбеддингов (модель + размерность + колонка message_embeddings).
+# Активное пространство читается из embedding_spaces и перепроверяется не чаще раза
+# в SPACE_REFRESH_SECONDS, так что переключение чтения подхватывается без перезапуска
+SPACE_STATES = ("backfill", "active", "retired")
+SPACE_NAME_PATTERN = re.compile(r"^[a-z][a-z0-9_]{0,19}$")
+SPACE_REFRESH_SECONDS = 30.0
+
+# Бинарная квантизация: сколько кандидатов на один результат отбирается по расстоянию
+# Хэмминга перед точным косинусным переранжированием
+BINARY_RERANK_FACTOR = 10
+
+# Во сколько раз больше соседей берется из ANN-индекса, чтобы после порога
+# схожести и фильтров осталось limit результатов
+SEARCH_OVERSAMPLE = 4
+
+# Секционирование message_embeddings по topic_id (partition_message_embeddings)
+PARTITION_STRATEGIES = ("hash", "range")
+
+# Итеративные сканы индексов (pgvector >= 0.8): индекс продолжает выдавать кандидатов,
+# пока фильтр не наберет LIMIT строк
+ITERATIVE_SCAN_VERSION = (0, 8, 0)
+
+# Размер порции по умолчанию для bulk-вставки эмбеддингов через COPY
+COPY_CHUNK_SIZE = 1000
+
+# Уникальное ограничение "один эмбеддинг на сообщение" (миграция 010): запись
+# эмбеддингов сообщений идемпотентна - повторная запись обновляет строку
+MESSAGE_EMBEDDING_KEY = "message_embeddings_message_id_key"
+
+# Текст сообщения для эмбеддинга: HTML-разметка заменяется пробелами, как в search_vector
+# Обертка цитаты, которую create_message добавляет перед текстом ответа: в эмбеддинг
+# не попадает, иначе ответы на одно сообщение похожи друг на друга цитатой
+QUOTE_BLOCK_PATTERN = re.compile(
+    r"^\s*<div class='quote-message'[^>]*>\s*(?:<i>.*?</i><br></div>)?", re.DOTALL
+)
+HTML_TAG_PATTERN = re.compile(r"<[^>]*>")
+
+# Константа сглаживания reciprocal rank fusion: score = sum(1 / (RRF_K + rank))
+RRF_K = 60
+
+
+class HybridSearchResult(NamedTuple):
+    """Результат гибридного поиска сообщений"""
+    message_id: int
+    topic_id: int
+    content: str
+    author_name: Optional[str]
+    score: float                    # суммарный RRF-скор
+    vector_rank: Optional[int]      # место в векторной выдаче (None - не найдено)
+    lexical_rank: Optional[int]     # место в полнотекстовой выдаче (None - не найдено)
+    similarity: Optional[float]     # косинусная близость к запросу
+
+
+class VectorQuery(NamedTuple):
+    """Один запрос пакетного поиска search_many"""
+    embedding: Sequence[float]
+    topic_id: Optional[int] = None
+    limit: int = 10
+    similarity_threshold: float = 0.8
+
+
+class EmbeddingChanges(NamedTuple):
+    """Порция изменений из message_embedding_outbox, захваченная claim_embedding_changes"""
+    connection: asyncpg.Connection  # соединение с открытой транзакцией порции
+    message_ids: List[int]          # кандидаты на переиндексацию (удаленные отсеет fetch_messages_for_indexing)
+
+
+class EmbeddingSpace(NamedTuple):
+    """Пространство эмбеддингов: какой моделью и в какую колонку message_embeddings пишутся векторы"""
+    name: str
+    backend: str                    # ollama | hashing
+    model: str
+    dimensions: int
+    column: str
+    state: str                      # backfill (двойная запись + дозаполнение) | active | retired
+
 
 class EmbeddingManager:
     """Менеджер для работы с эмбеддингами в PostgreSQL с pgvector"""
     
-    def __init__(self, database_url: str):
+    def __init__(
+        self,
+        database_url: str,
+        probes: int = 0,
+        ef_search: int = 0,
+        vector_store: Optional[TopicVectorStore] = None,
+        storage: str = "vector",
+        quantization: str = "none"
+    ):
+        """
+        Args:
+            database_url: DSN PostgreSQL в формате asyncpg
+            probes: ivfflat.probes для поиска по умолчанию (0 - значение сервера)
+            ef_search: hnsw.ef_search для поиска по умолчанию (0 - значение сервера)
+            vector_store: Локальное хранилище векторов тем - быстрый путь поиска по топику
+            storage: Формат хранения векторов: vector (float32) или halfvec (float16)
+            quantization: none или binary - предварительный отбор по бинарно
+                квантизованным векторам с точным переранжированием
+        """
+        if storage not in STORAGE_COLUMNS:
+            raise ValueError(f"Неизвестный формат хранения: {storage}, допустимы {tuple(STORAGE_COLUMNS)}")
+        if quantization not in VECTOR_QUANTIZATIONS:
+            raise ValueError(f"Неизвестная квантизация: {quantization}, допустимы {VECTOR_QUANTIZATIONS}")
         self.database_url = database_url
+        self.probes = probes
+        self.ef_search = ef_search
+        self.vector_store = vector_store
+        self.storage = storage
+        self.quantization = quantization
+        # Колонка хранения и ее тип pgvector по таблицам; для message_embeddings
+        # их может переопределить активное пространство эмбеддингов
+        self.columns = {table: STORAGE_COLUMNS[storage] for table in VECTOR_TABLES}
+        self.vector_types = {table: storage for table in VECTOR_TABLES}
+        self.space: Optional[EmbeddingSpace] = None
+        self._space_checked_at = 0.0
+        self.iterative_scan = False
+        self.dimensions: dict = {}
+        self.partitioned = False
+        self._topic_partitions: dict = {}
+        # Изменения локального хранилища, ждущие фиксации внешней транзакции (по id соединения)
+        self._pending_vector_updates: Dict[int, Tuple[dict, set]] = {}
         self.pool = None
+
+    @classmethod
+    def from_settings(cls, **overrides) -> "EmbeddingManager":
+        """Менеджер с подключением и параметрами поиска из настроек приложения"""
+        settings = get_settings
+        options = {
+            "probes": settings.VECTOR_SEARCH_PROBES,
+            "ef_search": settings.VECTOR_SEARCH_EF_SEARCH,
+            "storage": settings.VECTOR_STORAGE,
+            "quantization": settings.VECTOR_QUANTIZATION,
+            **overrides,
+        }
+        return cls(asyncpg_database_url(settings.DATABASE_URL), **options)
     
     async def initialize(self):
         """Инициализация пула соединений"""
@@ -22,6 +169,14 @@ class EmbeddingManager:
             self.database_url,
             init=self._init_connection
         )
+        version = await self.pool.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        self.iterative_scan = _parse_version(version) >= ITERATIVE_SCAN_VERSION
+        self.partitioned = await self.pool.fetchval(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('message_embeddings')"
+        ) or False
+        for table in VECTOR_TABLES:
+            self.dimensions[table] = await self.vector_dimensions(table)
+        await self.refresh_space()
     
     async def _init_connection(self, connection):
         """Инициализация каждого соединения для работы с pgvector"""
@@ -31,6 +186,594 @@ class EmbeddingManager:
         """Закрытие пула соединений"""
         if self.pool:
             await self.pool.close()
+
+    @asynccontextmanager
+    async def _connection(self, connection: Optional[asyncpg.Connection] = None) -> AsyncIterator[asyncpg.Connection]:
+        """Переданное соединение (запись внутри чужой транзакции) или соединение из пула"""
+        if connection is not None:
+            yield connection
+        else:
+            async with self.pool.acquire() as acquired:
+                yield acquired
+
+    @asynccontextmanager
+    async def search_connection(
+        self,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> AsyncIterator[asyncpg.Connection]:
+        """
+        Соединение для векторного поиска внутри транзакции: ivfflat.probes и
+        hnsw.ef_search задаются как SET LOCAL и не протекают в другие запросы пула
+
+        Args:
+            probes: Количество просматриваемых списков IVFFlat (None - значение менеджера)
+            ef_search: Размер кандидатов HNSW (None - значение менеджера)
+        """
+        probes = self.probes if probes is None else probes
+        ef_search = self.ef_search if ef_search is None else ef_search
+        if time.monotonic() - self._space_checked_at > SPACE_REFRESH_SECONDS:
+            await self.refresh_space()
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                # set_config(..., is_local => true) - параметризуемый аналог SET LOCAL
+                if probes:
+                    await connection.execute("SELECT set_config('ivfflat.probes', $1, true)", str(probes))
+                if ef_search:
+                    await connection.execute("SELECT set_config('hnsw.ef_search', $1, true)", str(ef_search))
+                if self.iterative_scan:
+                    # Порядок внутри выдачи индекса может немного нарушаться - запросы
+                    # поиска всегда досортировывают кандидатов по расстоянию
+                    await connection.execute(
+                        "SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true),"
+                        " set_config('ivfflat.iterative_scan', 'relaxed_order', true)"
+                    )
+                yield connection
+
+    def _nearest_sql(
+        self,
+        table: str,
+        columns: str,
+        query_param: str,
+        limit_sql: str,
+        scan_filter: str = "",
+        alias: str = "",
+        relation: Optional[str] = None
+    ) -> str:
+        """
+        Подзапрос ближайших соседей: columns и distance, упорядоченные по расстоянию
+        через ANN-индекс колонки хранения. С бинарной квантизацией кандидаты сначала
+        отбираются по расстоянию Хэмминга (индекс по binary_quantize), затем
+        переранжируются точным косинусным расстоянием. relation - конкретная секция
+        таблицы table, если поиск идет только по ней
+        """
+        column = f"{alias}.{self.columns[table]}" if alias else self.columns[table]
+        query_vector = f"{query_param}::{self.vector_types[table]}"
+        distance = f"{column} <=> {query_vector}"
+        source = f"{relation or table} {alias}".strip()
+        if self.quantization == "binary" and self.dimensions.get(table):
+            return f"""
+                SELECT * FROM (
+                    SELECT {columns}, {distance} AS distance
+                    FROM {source}
+                    {scan_filter}
+                    ORDER BY binary_quantize({column})::bit({self.dimensions[table]})
+                        <~> binary_quantize({query_vector})
+                    LIMIT ({limit_sql}) * {BINARY_RERANK_FACTOR}
+                ) quantized
+                ORDER BY distance
+                LIMIT {limit_sql}
+            """
+        return f"""
+            SELECT {columns}, {distance} AS distance
+            FROM {source}
+            {scan_filter}
+            ORDER BY {distance}
+            LIMIT {limit_sql}
+        """
+
+    async def create_vector_indexes(
+        self,
+        index_type: str = "ivfflat",
+        lists: int = 100,
+        m: int = 16,
+        ef_construction: int = 64,
+        tables: Sequence[str] = VECTOR_TABLES
+    ) -> None:
+        """
+        Перестроение ANN-индексов по embedding (cosine) для embeddings и message_embeddings.
+        Новый индекс строится CONCURRENTLY под временным именем и затем подменяет старый,
+        так что поиск не остается без индекса во время построения. У секционированной
+        таблицы индексы строятся по каждой секции, списки IVFFlat делятся между секциями
+
+        Args:
+            index_type: ivfflat или hnsw
+            lists: Количество списков IVFFlat на всю таблицу (обычно rows / 1000, для > 1M строк - sqrt(rows))
+            m: Количество связей на узел HNSW
+            ef_construction: Размер списка кандидатов при построении HNSW
+            tables: Таблицы, индексы которых перестраиваются
+        """
+        if index_type not in VECTOR_INDEX_TYPES:
+            raise ValueError(f"Неизвестный тип индекса: {index_type}, допустимы {VECTOR_INDEX_TYPES}")
+
+        async with self.pool.acquire() as connection:
+            for table in tables:
+                column = self.columns[table]
+                # CREATE INDEX CONCURRENTLY недоступен для секционированной таблицы целиком
+                relations = await connection.fetch(
+                    "SELECT inhrelid::regclass::text AS name FROM pg_inherits"
+                    " WHERE inhparent = to_regclass($1) ORDER BY 1",
+                    table
+                )
+                relations = [row['name'] for row in relations] or [table]
+                if index_type == "ivfflat":
+                    options = f"lists = {max(1, int(lists) // len(relations))}"
+                else:
+                    options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+                for relation in relations:
+                    index_prefix = vector_index_prefix(relation, column)
+                    indexes = [(f"{index_prefix}_idx", f"{column} {self.vector_types[table]}_cosine_ops")]
+                    if self.quantization == "binary" and self.dimensions.get(table):
+                        indexes.append((
+                            f"{index_prefix}_bq_idx",
+                            f"(binary_quantize({column})::bit({self.dimensions[table]})) bit_hamming_ops",
+                        ))
+                    for index_name, definition in indexes:
+                        new_index_name = f"{index_name}_new"
+                        # Остаток прерванного построения (невалидный индекс)
+                        await connection.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_index_name}")
+                        await connection.execute(
+                            f"CREATE INDEX CONCURRENTLY {new_index_name} ON {relation} "
+                            f"USING {index_type} ({definition}) WITH ({options})"
+                        )
+                        async with connection.transaction():
+                            await connection.execute(f"DROP INDEX IF EXISTS {index_name}")
+                            await connection.execute(f"ALTER INDEX {new_index_name} RENAME TO {index_name}")
+
+    async def partition_message_embeddings(
+        self,
+        strategy: str = "hash",
+        partitions: int = 16,
+        range_size: int = 1000,
+        batch_size: int = 10000
+    ) -> int:
+        """
+        Перевести message_embeddings на секционирование по topic_id. Данные копируются
+        порциями по id в новую секционированную таблицу. Строки, вставленные, измененные
+        или удаленные за это время, триггер записывает в журнал, и журнал применяется
+        порциями до блокировки, пока не останется меньше batch_size записей. Под
+        эксклюзивной блокировкой переносится только этот остаток, и таблицы меняются
+        местами. Так не теряются ни новые строки, ни изменения уже скопированных:
+        переиндексация через outbox, дозаполнение пространств. Старая таблица остается как
+        message_embeddings_unpartitioned (для отката), ANN-индексы секций строит
+        create_vector_indexes. На время переноса нужно остановить изменения схемы
+        таблицы: создание пространств (manage_embedding_spaces.py) и миграцию halfvec
+
+        Args:
+            strategy: hash - partitions секций по хэшу topic_id;
+                range - секции по range_size тем и секция по умолчанию для новых тем
+            partitions: Количество секций для hash
+            range_size: Тем в одной секции для range
+            batch_size: Строк в одной порции копирования
+
+        Returns:
+            Количество перенесенных строк
+        """
+        if strategy not in PARTITION_STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия: {strategy}, допустимы {PARTITION_STRATEGIES}")
+        table, staging = "message_embeddings", "message_embeddings_partitioned"
+        changes = f"{staging}_changes"
+        async with self.pool.acquire() as connection:
+            if self.partitioned:
+                raise RuntimeError(f"Таблица {table} уже секционирована")
+            # Остаток прерванного переноса удаляется вместе с секциями и журналом
+            await self._drop_partition_capture(connection, table, changes)
+            await connection.execute(f"DROP TABLE IF EXISTS {staging}")
+            key = "HASH (topic_id)" if strategy == "hash" else "RANGE (topic_id)"
+            await connection.execute(
+                f"CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY {key}"
+            )
+            await connection.execute(f"ALTER TABLE {staging} ADD PRIMARY KEY (id, topic_id)")
+            if strategy == "hash":
+                for remainder in range(partitions):
+                    await connection.execute(
+                        f"CREATE TABLE {table}_p{remainder} PARTITION OF {staging} "
+                        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                    )
+            else:
+                max_topic = await connection.fetchval("SELECT coalesce(max(id), 0) FROM topics")
+                # Одна секция про запас, темы дальше попадают в секцию по умолчанию
+                for start in range(0, max_topic + 2 * range_size, range_size):
+                    await connection.execute(
+                        f"CREATE TABLE {table}_r{start // range_size} PARTITION OF {staging} "
+                        f"FOR VALUES FROM ({start}) TO ({start + range_size})"
+                    )
+                await connection.execute(f"CREATE TABLE {table}_default PARTITION OF {staging} DEFAULT")
+            # Уникальность сообщения: ключ секционирования обязан входить в ограничение
+            await connection.execute(
+                f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_message_id_key UNIQUE (message_id, topic_id)"
+            )
+            for columns in ("topic_id", "content_hash"):
+                await connection.execute(f"CREATE INDEX ON {staging} ({columns})")
+
+            await self._start_partition_capture(connection, table, changes)
+
+            total, last_id = 0, 0
+            while True:
+                row = await connection.fetchrow(
+                    f"""
+                    WITH batch AS (
+                        INSERT INTO {staging}
+                        SELECT * FROM {table} WHERE id > $1 ORDER BY id LIMIT $2
+                        RETURNING id
+                    )
+                    SELECT max(id) AS last_id, count(*) AS copied FROM batch
+                    """,
+                    last_id,
+                    batch_size
+                )
+                if row['last_id'] is None:
+                    break
+                last_id = row['last_id']
+                total += row['copied']
+
+            # Журнал догоняется без блокировки, пока порция не окажется неполной
+            total += await self._catch_up_partition(connection, table, staging, changes, batch_size, drain=False)
+
+            sequence = await connection.fetchval("SELECT pg_get_serial_sequence($1, 'id')", table)
+            async with connection.transaction():
+                await connection.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+                # Под блокировкой - только остаток журнала, записанный за последнюю порцию
+                total += await self._catch_up_partition(connection, table, staging, changes, batch_size, drain=True)
+                await self._drop_partition_capture(connection, table, changes)
+                await connection.execute(f"ALTER SEQUENCE {sequence} OWNED BY {staging}.id")
+                await connection.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+                await connection.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+                # Запись эмбеддингов ссылается на ограничение по имени (ON CONFLICT ON CONSTRAINT)
+                await connection.execute(
+                    f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {MESSAGE_EMBEDDING_KEY}"
+                    f" TO {table}_unpartitioned_message_id_key"
+                )
+                await connection.execute(
+                    f"ALTER TABLE {table} RENAME CONSTRAINT {staging}_message_id_key TO {MESSAGE_EMBEDDING_KEY}"
+                )
+        self.partitioned = True
+        self._topic_partitions.clear()
+        return total
+
+    @staticmethod
+    async def _start_partition_capture(connection: asyncpg.Connection, table: str, changes: str) -> None:
+        """
+        Журнал изменений table (id вставленных, измененных и удаленных строк). CREATE TRIGGER
+        дожидается завершения уже идущих записей, поэтому все изменения после него попадают в журнал
+        """
+        await connection.execute(
+            f"CREATE UNLOGGED TABLE {changes} (seq bigserial PRIMARY KEY, row_id integer NOT NULL)"
+        )
+        await connection.execute(
+            f"""
+            CREATE FUNCTION {changes}_capture() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO {changes} (row_id) VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END);
+                RETURN NULL;
+            END $$
+            """
+        )
+        await connection.execute(
+            f"CREATE TRIGGER {changes}_capture AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {changes}_capture()"
+        )
+
+    @classmethod
+    async def _catch_up_partition(
+        cls,
+        connection: asyncpg.Connection,
+        table: str,
+        staging: str,
+        changes: str,
+        batch_size: int,
+        drain: bool
+    ) -> int:
+        """
+        Применять журнал порциями: до неполной порции (drain=False, пока идут записи) или
+        до пустого журнала (drain=True, под блокировкой). Возвращает изменение числа строк staging
+        """
+        total = 0
+        while True:
+            applied, moved = await cls._apply_partition_changes(connection, table, staging, changes, batch_size)
+            total += moved
+            if not applied or (not drain and applied < batch_size):
+                return total
+
+    @staticmethod
+    async def _apply_partition_changes(
+        connection: asyncpg.Connection,
+        table: str,
+        staging: str,
+        changes: str,
+        limit: int
+    ) -> Tuple[int, int]:
+        """
+        Применить к staging порцию журнала изменений table: строки из журнала заменяются
+        их текущими версиями, удаленные удаляются. Порция журнала удаляется в той же
+        транзакции. Возвращает (записей журнала, изменение числа строк staging)
+        """
+        async with connection.transaction():
+            ids = await connection.fetchval(
+                f"""
+                WITH claimed AS (
+                    DELETE FROM {changes}
+                    WHERE seq IN (SELECT seq FROM {changes} ORDER BY seq LIMIT $1)
+                    RETURNING row_id
+                )
+                SELECT array_agg(row_id) FROM claimed
+                """,
+                limit
+            )
+            if not ids:
+                return 0, 0
+            # Сообщение могло перейти к строке с другим id - освобождаем его ключ
+            deleted = await connection.execute(
+                f"""
+                DELETE FROM {staging} s
+                WHERE s.id = ANY($1::int[])
+                   OR (s.message_id, s.topic_id) IN (
+                       SELECT message_id, topic_id FROM {table} WHERE id = ANY($1::int[])
+                   )
+                """,
+                ids
+            )
+            inserted = await connection.execute(
+                f"INSERT INTO {staging} SELECT * FROM {table} WHERE id = ANY($1::int[])", ids
+            )
+        return len(ids), int(inserted.split()[-1]) - int(deleted.split()[-1])
+
+    @staticmethod
+    async def _drop_partition_capture(connection: asyncpg.Connection, table: str, changes: str) -> None:
+        """Удалить триггер и журнал изменений переноса"""
+        await connection.execute(f"DROP TRIGGER IF EXISTS {changes}_capture ON {table}")
+        await connection.execute(f"DROP FUNCTION IF EXISTS {changes}_capture()")
+        await connection.execute(f"DROP TABLE IF EXISTS {changes}")
+
+    async def _topic_partition(self, topic_id: int) -> Optional[str]:
+        """
+        Секция message_embeddings со строками топика (None - у топика нет эмбеддингов).
+        Секции не меняются, поэтому соответствие кэшируется
+        """
+        if topic_id not in self._topic_partitions:
+            async with self.pool.acquire() as connection:
+                partition = await connection.fetchval(
+                    "SELECT tableoid::regclass::text FROM message_embeddings WHERE topic_id = $1 LIMIT 1",
+                    topic_id
+                )
+            if partition is None:
+                return None
+            self._topic_partitions[topic_id] = partition
+        return self._topic_partitions[topic_id]
+
+    async def convert_to_halfvec(self, table: str, batch_size: int = 1000) -> int:
+        """
+        Заполнить embedding_half из embedding порциями по id (каждая порция - своя
+        короткая транзакция, запись в таблицу не блокируется надолго). Повторный
+        запуск дописывает только еще не сконвертированные строки
+
+        Returns:
+            Количество сконвертированных строк
+        """
+        if table not in VECTOR_TABLES:
+            raise ValueError(f"Неизвестная таблица: {table}, допустимы {VECTOR_TABLES}")
+        total, last_id = 0, 0
+        async with self.pool.acquire() as connection:
+            while True:
+                row = await connection.fetchrow(
+                    f"""
+                    WITH batch AS (
+                        SELECT id FROM {table} WHERE id > $1 ORDER BY id LIMIT $2
+                    ),
+                    converted AS (
+                        UPDATE {table} t SET embedding_half = t.embedding::halfvec
+                        FROM batch
+                        WHERE t.id = batch.id AND t.embedding_half IS NULL AND t.embedding IS NOT NULL
+                        RETURNING t.id
+                    )
+                    SELECT (SELECT max(id) FROM batch) AS last_id, (SELECT count(*) FROM converted) AS converted
+                    """,
+                    last_id,
+                    batch_size
+                )
+                if row['last_id'] is None:
+                    return total
+                last_id = row['last_id']
+                total += row['converted']
+
+    async def drop_float_storage(self, table: str) -> None:
+        """
+        Удалить колонку embedding (float32) после перехода на halfvec. Место на диске
+        освобождается только после VACUUM FULL / pg_repack таблицы
+        """
+        if table not in VECTOR_TABLES:
+            raise ValueError(f"Неизвестная таблица: {table}, допустимы {VECTOR_TABLES}")
+        async with self.pool.acquire() as connection:
+            missing = await connection.fetchval(
+                f"SELECT count(*) FROM {table} WHERE embedding IS NOT NULL AND embedding_half IS NULL"
+            )
+            if missing:
+                raise RuntimeError(f"В {table} {missing} строк еще не сконвертированы в halfvec")
+            await connection.execute(f"ALTER TABLE {table} DROP COLUMN embedding")
+
+    async def refresh_space(self) -> Optional[EmbeddingSpace]:
+        """
+        Перечитать активное пространство эмбеддингов. Без реестра или активного
+        пространства message_embeddings использует колонку формата хранения storage.
+        При смене пространства локальное хранилище векторов тем очищается
+        """
+        self._space_checked_at = time.monotonic()
+        spaces = await self.list_spaces()
+        active = next((space for space in spaces if space.state == "active"), None)
+        if active == self.space:
+            return active
+        table = "message_embeddings"
+        if active is None:
+            column, vector_type = STORAGE_COLUMNS[self.storage], self.storage
+        else:
+            column, vector_type = active.column, await self._column_type(table, active.column)
+        previous_column = self.columns[table]
+        self.space = active
+        self.columns[table], self.vector_types[table] = column, vector_type
+        self.dimensions[table] = await self.vector_dimensions(table)
+        if column != previous_column and self.vector_store is not None:
+            self.vector_store.clear()
+        return active
+
+    async def use_space(self, space: EmbeddingSpace) -> None:
+        """
+        Привязать менеджер к пространству (например, еще дозаполняемому - для
+        построения его индекса); автоматическое перечитывание активного отключается
+        """
+        self.space = space
+        self.columns["message_embeddings"] = space.column
+        self.vector_types["message_embeddings"] = await self._column_type("message_embeddings", space.column)
+        self.dimensions["message_embeddings"] = space.dimensions
+        self._space_checked_at = float("inf")
+
+    async def list_spaces(self) -> List[EmbeddingSpace]:
+        """Пространства эмбеддингов из реестра (пустой список - реестр не создан)"""
+        async with self.pool.acquire() as connection:
+            if await connection.fetchval("SELECT to_regclass('embedding_spaces')") is None:
+                return []
+            rows = await connection.fetch(
+                "SELECT name, backend, model, dimensions, column_name, state FROM embedding_spaces ORDER BY created_at"
+            )
+            return [
+                EmbeddingSpace(
+                    row['name'], row['backend'], row['model'], row['dimensions'], row['column_name'], row['state']
+                )
+                for row in rows
+            ]
+
+    async def get_space(self, name: str) -> EmbeddingSpace:
+        """Пространство по имени (ValueError - не зарегистрировано)"""
+        for space in await self.list_spaces():
+            if space.name == name:
+                return space
+        raise ValueError(f"Пространство эмбеддингов {name} не зарегистрировано")
+
+    async def create_space(self, name: str, backend: str, model: str, dimensions: int) -> EmbeddingSpace:
+        """
+        Зарегистрировать пространство и добавить его колонку embedding_<name> в
+        message_embeddings (тип - формат хранения менеджера). Новое пространство
+        начинает в состоянии backfill: индексатор пишет в него параллельно с активным
+        """
+        if not SPACE_NAME_PATTERN.match(name):
+            raise ValueError(f"Недопустимое имя пространства: {name} (латиница в нижнем регистре, цифры, _)")
+        space = EmbeddingSpace(name, backend, model, int(dimensions), f"embedding_{name}", "backfill")
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(
+                    f"ALTER TABLE message_embeddings ADD COLUMN IF NOT EXISTS {space.column} "
+                    f"{self.storage}({space.dimensions})"
+                )
+                await connection.execute(
+                    """
+                    INSERT INTO embedding_spaces (name, backend, model, dimensions, column_name, state)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    """,
+                    *space
+                )
+        return space
+
+    async def fetch_space_backfill(
+        self,
+        space: EmbeddingSpace,
+        after_id: int = 0,
+        limit: int = 100
+    ) -> List[Tuple[int, str]]:
+        """Порция строк message_embeddings с id > after_id без вектора в колонке пространства"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(
+                f"""
+                SELECT id, content FROM message_embeddings
+                WHERE id > $1 AND {space.column} IS NULL
+                ORDER BY id
+                LIMIT $2
+                """,
+                after_id,
+                limit
+            )
+            return [(row['id'], row['content']) for row in rows]
+
+    async def write_space_embeddings(
+        self,
+        space: EmbeddingSpace,
+        ids: Sequence[int],
+        embeddings: Sequence[Sequence[float]],
+        connection: Optional[asyncpg.Connection] = None
+    ) -> None:
+        """
+        Записать векторы пространства в уже существующие строки message_embeddings.
+        С connection запись идет в точке сохранения его транзакции: ошибка не прерывает ее
+        """
+        vector_type = await self._column_type("message_embeddings", space.column)
+        async with self._connection(connection) as connection, connection.transaction():
+            await connection.execute(
+                f"""
+                UPDATE message_embeddings me SET {space.column} = v.embedding::{vector_type}
+                FROM unnest($1::int[], $2::text[]) AS v(id, embedding)
+                WHERE me.id = v.id
+                """,
+                list(ids),
+                [_vector_literal(embedding) for embedding in embeddings]
+            )
+
+    async def space_backlog(self, space: EmbeddingSpace) -> int:
+        """Сколько строк message_embeddings еще без вектора пространства"""
+        async with self.pool.acquire() as connection:
+            return await connection.fetchval(f"SELECT count(*) FROM message_embeddings WHERE {space.column} IS NULL")
+
+    async def activate_space(self, name: str, force: bool = False) -> EmbeddingSpace:
+        """
+        Переключить чтение на пространство: одной транзакцией текущее активное
+        становится retired, выбранное - active. Без force переключение отклоняется,
+        пока дозаполнение не завершено
+        """
+        space = await self.get_space(name)
+        if not force and (missing := await self.space_backlog(space)):
+            raise RuntimeError(f"В пространстве {name} еще {missing} строк без векторов")
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute("LOCK TABLE embedding_spaces IN EXCLUSIVE MODE")
+                await connection.execute(
+                    "UPDATE embedding_spaces SET state = 'retired' WHERE state = 'active' AND name <> $1", name
+                )
+                await connection.execute(
+                    "UPDATE embedding_spaces SET state = 'active', activated_at = now() WHERE name = $1", name
+                )
+        return space._replace(state="active")
+
+    async def drop_space(self, name: str) -> None:
+        """Удалить выведенное из чтения пространство вместе с его колонкой"""
+        space = await self.get_space(name)
+        if space.state == "active":
+            raise RuntimeError(f"Пространство {name} активно - сначала переключите чтение на другое")
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute("DELETE FROM embedding_spaces WHERE name = $1", name)
+                await connection.execute(f"ALTER TABLE message_embeddings DROP COLUMN IF EXISTS {space.column}")
+
+    async def _column_type(self, table: str, column: str) -> str:
+        """Тип pgvector колонки (vector / halfvec) по системному каталогу"""
+        async with self.pool.acquire() as connection:
+            vector_type = await connection.fetchval(
+                """
+                SELECT t.typname FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+                WHERE a.attrelid = to_regclass($1) AND a.attname = $2 AND NOT a.attisdropped
+                """,
+                table,
+                column
+            )
+        if vector_type is None:
+            raise RuntimeError(f"В таблице {table} нет колонки {column}")
+        return vector_type
     
     async def insert_embedding(
         self, 
@@ -51,8 +794,8 @@ class EmbeddingManager:
         """
         async with self.pool.acquire() as connection:
             result = await connection.fetchval(
-                """
-                INSERT INTO embeddings (content, embedding, metadata)
+                f"""
+                INSERT INTO embeddings (content, {self.columns['embeddings']}, metadata)
                 VALUES ($1, $2, $3)
                 RETURNING id
                 """,
@@ -62,11 +805,37 @@ class EmbeddingManager:
             )
             return result
     
+    async def insert_embeddings_bulk(
+        self,
+        rows: Iterable[Tuple[str, Sequence[float], Optional[dict]]],
+        chunk_size: int = COPY_CHUNK_SIZE
+    ) -> List[int]:
+        """
+        Массовая вставка эмбеддингов бинарным COPY
+
+        Args:
+            rows: Кортежи (content, embedding, metadata); embedding - список чисел
+                или строка NumPy-массива, итерируемый объект читается порциями
+            chunk_size: Количество строк в одном COPY (одна транзакция на порцию)
+
+        Returns:
+            ID вставленных записей в порядке rows
+        """
+        return await self._copy_with_ids(
+            "embeddings",
+            ("content", self.columns["embeddings"], "metadata"),
+            ((content, embedding, json.dumps(metadata) if metadata else None)
+             for content, embedding, metadata in rows),
+            chunk_size
+        )
+
     async def search_similar(
         self, 
         query_embedding: List[float], 
         limit: int = 10,
-        similarity_threshold: float = 0.8
+        similarity_threshold: float = 0.8,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
     ) -> List[Tuple[int, str, float, dict]]:
         """
         Поиск похожих эмбеддингов
@@ -75,26 +844,28 @@ class EmbeddingManager:
             query_embedding: Вектор запроса
             limit: Максимальное количество результатов
             similarity_threshold: Порог схожести (cosine similarity)
+            probes: ivfflat.probes для этого запроса (больше - точнее и медленнее)
+            ef_search: hnsw.ef_search для этого запроса (больше - точнее и медленнее)
             
         Returns:
             Список кортежей (id, content, similarity, metadata)
         """
-        async with self.pool.acquire() as connection:
+        async with self.search_connection(probes, ef_search) as connection:
+            # Порог применяется к уже отобранным соседям: условие на вычисленное
+            # расстояние в WHERE не дает планировщику использовать ANN-индекс
+            nearest = self._nearest_sql("embeddings", "id, content, metadata", "$1", "$3 * $4")
             results = await connection.fetch(
-                """
-                SELECT 
-                    id, 
-                    content, 
-                    1 - (embedding <=> $1) as similarity,
-                    metadata
-                FROM embeddings
-                WHERE 1 - (embedding <=> $1) > $2
-                ORDER BY embedding <=> $1
+                f"""
+                SELECT id, content, 1 - distance AS similarity, metadata
+                FROM ({nearest}) nearest
+                WHERE distance < 1 - $2
+                ORDER BY distance
                 LIMIT $3
                 """,
                 query_embedding,
                 similarity_threshold,
-                limit
+                limit,
+                SEARCH_OVERSAMPLE
             )
             
             return [
@@ -128,27 +899,379 @@ class EmbeddingManager:
         Returns:
             ID вставленной записи
         """
+        column = self.columns['message_embeddings']
         async with self.pool.acquire() as connection:
-            result = await connection.fetchval(
-                """
-                INSERT INTO message_embeddings (message_id, topic_id, content, embedding, metadata)
-                VALUES ($1, $2, $3, $4, $5)
-                RETURNING id
+            # id берется из последовательности заранее: если сообщение уже проиндексировано
+            # (ON CONFLICT), RETURNING вернет id существующей строки
+            row = await connection.fetchrow(
+                f"""
+                WITH new AS (SELECT nextval(pg_get_serial_sequence('message_embeddings', 'id')) AS id)
+                INSERT INTO message_embeddings
+                    (id, message_id, topic_id, content, content_hash, {column}, metadata)
+                SELECT new.id, $1, $2, $3, $4, $5, $6 FROM new
+                ON CONFLICT ON CONSTRAINT {MESSAGE_EMBEDDING_KEY} DO UPDATE SET
+                    content = EXCLUDED.content,
+                    content_hash = EXCLUDED.content_hash,
+                    {column} = EXCLUDED.{column},
+                    metadata = EXCLUDED.metadata
+                RETURNING id, id = (SELECT id FROM new) AS inserted
                 """,
                 message_id,
                 topic_id,
                 content,
+                content_hash(content),
                 embedding,
                 json.dumps(metadata) if metadata else None
             )
-            return result
+        if row['inserted']:
+            self._append_to_vector_store([row['id']], [(message_id, topic_id, content, embedding, metadata)])
+        elif self.vector_store is not None:
+            self.vector_store.invalidate(topic_id)
+        return row['id']
     
+    async def insert_message_embeddings_bulk(
+        self,
+        rows: Iterable[Tuple[int, int, str, Sequence[float], Optional[dict]]],
+        chunk_size: int = COPY_CHUNK_SIZE,
+        connection: Optional[asyncpg.Connection] = None
+    ) -> List[int]:
+        """
+        Массовая запись эмбеддингов сообщений: бинарный COPY во временную таблицу и
+        INSERT ... ON CONFLICT из нее. Уже проиндексированные сообщения (параллельный
+        индексатор, догоняющая индексация) обновляются, а не дублируются
+
+        Args:
+            rows: Кортежи (message_id, topic_id, content, embedding, metadata)
+            chunk_size: Количество строк в одном COPY (одна транзакция на порцию)
+            connection: Соединение с открытой транзакцией, в которой идет запись
+                (порции - точки сохранения, фиксация - вместе с ней)
+
+        Returns:
+            ID записей в порядке rows (для уже проиндексированного сообщения - ID существующей строки)
+        """
+        column = self.columns["message_embeddings"]
+        staging = "message_embeddings_staging"
+        ids: List[int] = []
+        async with self._connection(connection) as connection:
+            for chunk in _chunked(rows, chunk_size):
+                async with connection.transaction():
+                    # id новых строк проставляет DEFAULT временной таблицы (последовательность
+                    # message_embeddings): по совпадению id видно, вставлена строка или обновлена
+                    await connection.execute(f"DROP TABLE IF EXISTS pg_temp.{staging}")
+                    await connection.execute(
+                        f"CREATE TEMP TABLE {staging} (LIKE message_embeddings INCLUDING DEFAULTS) ON COMMIT DROP"
+                    )
+                    await connection.copy_records_to_table(
+                        staging,
+                        records=[
+                            (message_id, topic_id, content, content_hash(content), embedding,
+                             json.dumps(metadata) if metadata else None)
+                            for message_id, topic_id, content, embedding, metadata in chunk
+                        ],
+                        columns=("message_id", "topic_id", "content", "content_hash", column, "metadata")
+                    )
+                    # Строки вставляются в порядке message_id - конкурентные порции блокируют
+                    # одни и те же сообщения в одном порядке и не взаимоблокируются
+                    result = await connection.fetch(
+                        f"""
+                        WITH latest AS (
+                            SELECT DISTINCT ON (message_id) * FROM {staging} ORDER BY message_id, id DESC
+                        ),
+                        upserted AS (
+                            INSERT INTO message_embeddings
+                                (id, message_id, topic_id, content, content_hash, {column}, metadata)
+                            SELECT id, message_id, topic_id, content, content_hash, {column}, metadata
+                            FROM latest
+                            ORDER BY message_id
+                            ON CONFLICT ON CONSTRAINT {MESSAGE_EMBEDDING_KEY} DO UPDATE SET
+                                content = EXCLUDED.content,
+                                content_hash = EXCLUDED.content_hash,
+                                {column} = EXCLUDED.{column},
+                                metadata = EXCLUDED.metadata
+                            RETURNING id, message_id
+                        )
+                        SELECT u.message_id, u.id, u.id = l.id AS inserted
+                        FROM upserted u JOIN latest l USING (message_id)
+                        """
+                    )
+                by_message = {row['message_id']: row for row in result}
+                ids.extend(by_message[message_id]['id'] for message_id, *_ in chunk)
+                if self.vector_store is not None:
+                    # Повтор сообщения внутри порции: записана последняя строка (DISTINCT ON)
+                    inserted = {by_message[row[0]]['id']: row for row in chunk if by_message[row[0]]['inserted']}
+                    updated_topics = {row[1] for row in chunk if not by_message[row[0]]['inserted']}
+                    self._update_vector_store(connection, inserted, updated_topics)
+        return ids
+
+    def _update_vector_store(self, connection: asyncpg.Connection, inserted: dict, updated_topics: set) -> None:
+        """
+        Дописать новые строки (id -> (message_id, topic_id, content, embedding, metadata)) в
+        локальное хранилище и сбросить темы обновленных. Внутри еще не зафиксированной
+        внешней транзакции изменения откладываются до _finish_vector_store_updates:
+        после отката в файлах не должно остаться векторов несуществующих строк
+        """
+        if connection.is_in_transaction():
+            pending_inserted, pending_topics = self._pending_vector_updates.setdefault(id(connection), ({}, set()))
+            pending_inserted.update(inserted)
+            pending_topics.update(updated_topics)
+            return
+        self._append_to_vector_store(list(inserted), list(inserted.values()))
+        for topic_id in updated_topics:
+            self.vector_store.invalidate(topic_id)
+
+    def _finish_vector_store_updates(self, connection: asyncpg.Connection, committed: bool) -> None:
+        """Применить (фиксация) или отбросить (откат) отложенные изменения хранилища"""
+        pending = self._pending_vector_updates.pop(id(connection), None)
+        if pending is None or not committed or self.vector_store is None:
+            return
+        inserted, updated_topics = pending
+        self._append_to_vector_store(list(inserted), list(inserted.values()))
+        for topic_id in updated_topics:
+            self.vector_store.invalidate(topic_id)
+
+    def _append_to_vector_store(
+        self,
+        ids: Sequence[int],
+        rows: Sequence[Tuple[int, int, str, Sequence[float], Optional[dict]]]
+    ) -> None:
+        """Дописать новые векторы в уже материализованные темы локального хранилища"""
+        if self.vector_store is None:
+            return
+        by_topic: dict = {}
+        for row_id, (message_id, topic_id, content, embedding, metadata) in zip(ids, rows):
+            by_topic.setdefault(topic_id, []).append(StoredVector(row_id, message_id, content, embedding, metadata))
+        for topic_id, vectors in by_topic.items():
+            self.vector_store.append(topic_id, vectors)
+
+    async def materialize_topic(self, topic_id: int) -> int:
+        """Загрузить все векторы топика из message_embeddings в локальное хранилище"""
+        dimensions = await self.vector_dimensions("message_embeddings")
+        if not dimensions:
+            return 0
+        column = self.columns["message_embeddings"]
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(
+                f"""
+                SELECT id, message_id, content, {column} AS embedding, metadata
+                FROM message_embeddings
+                WHERE topic_id = $1 AND {column} IS NOT NULL
+                ORDER BY id
+                """,
+                topic_id
+            )
+        return self.vector_store.write_topic(
+            topic_id,
+            dimensions,
+            (
+                StoredVector(
+                    row['id'],
+                    row['message_id'],
+                    row['content'],
+                    _to_list(row['embedding']),
+                    json.loads(row['metadata']) if row['metadata'] else None
+                )
+                for row in rows
+            )
+        )
+
+    async def _copy_with_ids(
+        self,
+        table: str,
+        columns: Tuple[str, ...],
+        records: Iterable[Tuple[Any, ...]],
+        chunk_size: int
+    ) -> List[int]:
+        """
+        COPY не умеет RETURNING, поэтому ID порции заранее берутся из последовательности
+        таблицы и передаются в COPY явно - так порядок ID совпадает с порядком строк
+        """
+        inserted: List[int] = []
+        async with self.pool.acquire() as connection:
+            for chunk in _chunked(records, chunk_size):
+                async with connection.transaction():
+                    ids = [
+                        row[0] for row in await connection.fetch(
+                            "SELECT nextval(pg_get_serial_sequence($1, 'id')) FROM generate_series(1, $2)",
+                            table,
+                            len(chunk)
+                        )
+                    ]
+                    await connection.copy_records_to_table(
+                        table,
+                        records=[(row_id, *record) for row_id, record in zip(ids, chunk)],
+                        columns=("id", *columns)
+                    )
+                inserted.extend(ids)
+        return inserted
+
+    async def vector_dimensions(self, table: str = "message_embeddings") -> Optional[int]:
+        """Размерность колонки хранения vector(N) / halfvec(N) таблицы (None - размерность не задана)"""
+        async with self.pool.acquire() as connection:
+            typmod = await connection.fetchval(
+                "SELECT atttypmod FROM pg_attribute"
+                " WHERE attrelid = to_regclass($1) AND attname = $2 AND NOT attisdropped",
+                table,
+                self.columns.get(table, STORAGE_COLUMNS[self.storage])
+            )
+            return typmod if typmod and typmod > 0 else None
+
+    async def find_embeddings_by_hash(self, hashes: Iterable[bytes]) -> dict:
+        """
+        Уже посчитанные эмбеддинги сообщений с таким же содержимым (индекс по content_hash)
+
+        Returns:
+            Словарь content_hash -> вектор
+        """
+        column = self.columns["message_embeddings"]
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(
+                f"""
+                SELECT DISTINCT ON (content_hash) content_hash, {column} AS embedding
+                FROM message_embeddings
+                WHERE content_hash = ANY($1::bytea[]) AND {column} IS NOT NULL
+                ORDER BY content_hash, id
+                """,
+                list(set(hashes))
+            )
+            return {row['content_hash']: _to_list(row['embedding']) for row in rows}
+
+    @asynccontextmanager
+    async def claim_embedding_changes(self, limit: int = 100) -> AsyncIterator[Optional[EmbeddingChanges]]:
+        """
+        Захватить порцию изменений из message_embedding_outbox (FOR UPDATE SKIP LOCKED -
+        несколько потребителей не мешают друг другу) и снять устаревшие эмбеддинги
+        затронутых сообщений. Все идет в одной транзакции с записью новых эмбеддингов
+        внутри блока: строки outbox удаляются при ее фиксации, а при ошибке переиндексации
+        (модель недоступна) откатываются вместе со снятием - старый эмбеддинг остается,
+        изменение будет обработано повторно. Параллельная догоняющая индексация до
+        фиксации видит старый эмбеддинг и сообщение не трогает
+
+        Yields:
+            EmbeddingChanges или None, если outbox пуст
+        """
+        topics: set = set()
+        connection, committed = None, False
+        try:
+            async with self.pool.acquire() as connection:
+                async with connection.transaction():
+                    rows = await connection.fetch(
+                        """
+                        SELECT id, message_id, topic_id, operation
+                        FROM message_embedding_outbox
+                        ORDER BY id
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                        """,
+                        limit
+                    )
+                    if not rows:
+                        yield None
+                        return
+                    topics = {row['topic_id'] for row in rows}
+                    message_ids = sorted({row['message_id'] for row in rows})
+                    await connection.execute(
+                        "DELETE FROM message_embeddings WHERE message_id = ANY($1::int[])", message_ids
+                    )
+                    deleted_topics = sorted({row['topic_id'] for row in rows if row['operation'] == "delete"})
+                    if deleted_topics:
+                        # Ответы удаляются вместе с сообщением каскадно, без своих записей в outbox
+                        await connection.execute(
+                            """
+                            DELETE FROM message_embeddings me
+                            WHERE me.topic_id = ANY($1::int[])
+                              AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.id = me.message_id)
+                            """,
+                            deleted_topics
+                        )
+                    yield EmbeddingChanges(connection, message_ids)
+                    await connection.execute(
+                        "DELETE FROM message_embedding_outbox WHERE id = ANY($1::bigint[])",
+                        [row['id'] for row in rows]
+                    )
+                committed = True
+        finally:
+            # Новые векторы попадают в локальное хранилище только после фиксации
+            if connection is not None:
+                self._finish_vector_store_updates(connection, committed)
+            # И после фиксации, и после отката локальные копии тем устарели
+            if self.vector_store is not None:
+                for topic_id in topics:
+                    self.vector_store.invalidate(topic_id)
+
+    async def fetch_messages_for_indexing(
+        self,
+        message_ids: Sequence[int],
+        connection: Optional[asyncpg.Connection] = None
+    ) -> List[Tuple[int, int, str]]:
+        """
+        Сообщения из списка, у которых еще нет эмбеддинга (удаленные и уже
+        проиндексированные пропускаются). connection - соединение транзакции
+        claim_embedding_changes, в которой устаревшие эмбеддинги уже сняты
+
+        Returns:
+            Список кортежей (message_id, topic_id, текст после message_plain_text)
+        """
+        async with self._connection(connection) as connection:
+            rows = await connection.fetch(
+                """
+                SELECT m.id, m.topic_id, m.content
+                FROM messages m
+                WHERE m.id = ANY($1::int[])
+                  AND NOT EXISTS (SELECT 1 FROM message_embeddings me WHERE me.message_id = m.id)
+                ORDER BY m.id
+                """,
+                list(message_ids)
+            )
+            return [(row['id'], row['topic_id'], message_plain_text(row['content'])) for row in rows]
+
+    async def fetch_unindexed_messages(self, after_id: int = 0, limit: int = 100) -> List[Tuple[int, int, str]]:
+        """
+        Порция сообщений без эмбеддингов с id > after_id (режим догоняющей индексации)
+
+        Returns:
+            Список кортежей (message_id, topic_id, текст после message_plain_text)
+        """
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(
+                """
+                SELECT m.id, m.topic_id, m.content
+                FROM messages m
+                WHERE m.id > $1
+                  AND NOT EXISTS (SELECT 1 FROM message_embeddings me WHERE me.message_id = m.id)
+                ORDER BY m.id
+                LIMIT $2
+                """,
+                after_id,
+                limit
+            )
+            return [(row['id'], row['topic_id'], message_plain_text(row['content'])) for row in rows]
+
+    async def indexing_backlog(self) -> Tuple[int, Optional[float]]:
+        """
+        Отставание индексации сообщений
+
+        Returns:
+            (количество сообщений без эмбеддинга, возраст самого старого из них в секундах)
+        """
+        async with self.pool.acquire() as connection:
+            row = await connection.fetchrow(
+                """
+                SELECT count(*) AS pending,
+                       extract(epoch FROM now() - min(m.created_at)) AS oldest_age
+                FROM messages m
+                WHERE NOT EXISTS (SELECT 1 FROM message_embeddings me WHERE me.message_id = m.id)
+                """
+            )
+            return row['pending'], float(row['oldest_age']) if row['oldest_age'] is not None else None
+
     async def search_similar_messages(
         self,
         query_embedding: List[float],
         topic_id: Optional[int] = None,
         limit: int = 10,
-        similarity_threshold: float = 0.8
+        similarity_threshold: float = 0.8,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
     ) -> List[Tuple[int, int, int, str, float, dict]]:
         """
         Поиск похожих сообщений форума
@@ -158,36 +1281,32 @@ class EmbeddingManager:
             topic_id: ID топика для фильтрации (опционально)
             limit: Максимальное количество результатов
             similarity_threshold: Порог схожести
+            probes: ivfflat.probes для этого запроса
+            ef_search: hnsw.ef_search для этого запроса
             
         Returns:
             Список кортежей (id, message_id, topic_id, content, similarity, metadata)
         """
-        if topic_id:
-            query = """
-                SELECT 
-                    id, message_id, topic_id, content,
-                    1 - (embedding <=> $1) as similarity,
-                    metadata
-                FROM message_embeddings
-                WHERE topic_id = $2 AND 1 - (embedding <=> $1) > $3
-                ORDER BY embedding <=> $1
-                LIMIT $4
-            """
-            params = [query_embedding, topic_id, similarity_threshold, limit]
-        else:
-            query = """
-                SELECT 
-                    id, message_id, topic_id, content,
-                    1 - (embedding <=> $1) as similarity,
-                    metadata
-                FROM message_embeddings
-                WHERE 1 - (embedding <=> $1) > $2
-                ORDER BY embedding <=> $1
-                LIMIT $3
-            """
-            params = [query_embedding, similarity_threshold, limit]
-        
-        async with self.pool.acquire() as connection:
+        if topic_id and self.vector_store is not None:
+            # Быстрый путь: векторы топика в памяти процесса, без обращения к PostgreSQL
+            results = self.vector_store.search(topic_id, query_embedding, limit, similarity_threshold)
+            if results is None:
+                await self.materialize_topic(topic_id)
+                results = self.vector_store.search(topic_id, query_embedding, limit, similarity_threshold)
+            if results is not None:
+                return results
+
+        relation = None
+        if topic_id and self.partitioned:
+            # Поиск сразу в секции топика: ее ANN-индекс не содержит векторов чужих секций
+            relation = await self._topic_partition(topic_id)
+            if relation is None:
+                return []
+        query, params = self._similar_messages_query(
+            query_embedding, topic_id, limit, similarity_threshold, relation
+        )
+
+        async with self.search_connection(probes, ef_search) as connection:
             results = await connection.fetch(query, *params)
             
             return [
@@ -202,6 +1321,318 @@ class EmbeddingManager:
                 for row in results
             ]
 
+    def _similar_messages_query(
+        self,
+        query_embedding: List[float],
+        topic_id: Optional[int],
+        limit: int,
+        similarity_threshold: float,
+        relation: Optional[str] = None
+    ) -> Tuple[str, list]:
+        """
+        Запрос поиска похожих сообщений: ANN-индекс отдает соседей упорядоченными по
+        расстоянию с запасом (LIMIT * SEARCH_OVERSAMPLE), порог и фильтр по топику
+        применяются к ним снаружи. При итеративных сканах фильтр по топику проверяется
+        прямо во время обхода индекса, и тот выдает кандидатов, пока их не хватит.
+        relation - секция message_embeddings, в которой лежит топик
+        """
+        params = [query_embedding, similarity_threshold, limit, SEARCH_OVERSAMPLE]
+        scan_filter = outer_filter = ""
+        if topic_id:
+            params.append(topic_id)
+            if self.iterative_scan:
+                scan_filter = f"WHERE topic_id = ${len(params)}"
+            else:
+                outer_filter = f"AND topic_id = ${len(params)}"
+        nearest = self._nearest_sql(
+            "message_embeddings",
+            "id, message_id, topic_id, content, metadata",
+            "$1",
+            "$3 * $4",
+            scan_filter,
+            relation=relation
+        )
+        query = f"""
+            SELECT id, message_id, topic_id, content, 1 - distance AS similarity, metadata
+            FROM ({nearest}) nearest
+            WHERE distance < 1 - $2 {outer_filter}
+            ORDER BY distance
+            LIMIT $3
+        """
+        return query, params
+
+    async def search_many(
+        self,
+        queries: Sequence[VectorQuery],
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Tuple[int, int, int, str, float, dict]]]:
+        """
+        Пакетный поиск похожих сообщений: N векторов запроса - один SQL-запрос
+        (unnest + LATERAL), у каждого запроса свои limit, порог и фильтр по топику.
+        Локальное хранилище векторов тем не используется - выборка всегда из PostgreSQL
+
+        Args:
+            queries: Запросы VectorQuery
+            probes: ivfflat.probes для всех запросов пакета
+            ef_search: hnsw.ef_search для всех запросов пакета
+
+        Returns:
+            Списки результатов в порядке queries, кортежи как у search_similar_messages
+        """
+        results: List[list] = [[] for _ in queries]
+        if not queries:
+            return results
+        query, params = self._search_many_query(queries)
+
+        async with self.search_connection(probes, ef_search) as connection:
+            for row in await connection.fetch(query, *params):
+                results[row['ord'] - 1].append(
+                    (
+                        row['id'],
+                        row['message_id'],
+                        row['topic_id'],
+                        row['content'],
+                        float(row['similarity']),
+                        json.loads(row['metadata']) if row['metadata'] else {}
+                    )
+                )
+        return results
+
+    def _search_many_query(self, queries: Sequence[VectorQuery]) -> Tuple[str, list]:
+        """
+        Запрос пакетного поиска: векторы передаются текстовым массивом и приводятся
+        к типу хранения внутри LATERAL, где для каждого запроса выполняется тот же
+        индексный обход, что и в _similar_messages_query
+        """
+        params = [
+            [_vector_literal(query.embedding) for query in queries],
+            [query.topic_id for query in queries],
+            [query.limit for query in queries],
+            [query.similarity_threshold for query in queries],
+        ]
+        topic_filter = "(q.topic_id IS NULL OR topic_id = q.topic_id)"
+        nearest = self._nearest_sql(
+            "message_embeddings",
+            "id, message_id, topic_id, content, metadata",
+            "q.embedding",
+            f"q.lim * {SEARCH_OVERSAMPLE}",
+            f"WHERE {topic_filter}" if self.iterative_scan else ""
+        )
+        query = f"""
+            SELECT q.ord, hit.*
+            FROM unnest($1::text[], $2::int[], $3::int[], $4::float8[])
+                WITH ORDINALITY AS q(embedding, topic_id, lim, threshold, ord)
+            CROSS JOIN LATERAL (
+                SELECT id, message_id, topic_id, content, 1 - distance AS similarity, metadata
+                FROM ({nearest}) nearest
+                WHERE distance < 1 - q.threshold AND {topic_filter}
+                ORDER BY distance
+                LIMIT q.lim
+            ) hit
+            ORDER BY q.ord, hit.similarity DESC
+        """
+        return query, params
+
+    async def hybrid_search_messages(
+        self,
+        query_text: str,
+        query_embedding: Optional[List[float]] = None,
+        topic_id: Optional[int] = None,
+        category_id: Optional[int] = None,
+        limit: int = 10,
+        offset: int = 0,
+        candidates: int = 50,
+        rrf_k: int = RRF_K,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> List[HybridSearchResult]:
+        """
+        Гибридный поиск сообщений: векторная близость (message_embeddings) и
+        полнотекстовый поиск (messages.search_vector) объединяются reciprocal rank fusion.
+        Обе выборки и слияние выполняются одним SQL-запросом, без двух обращений к базе.
+
+        Args:
+            query_text: Текст запроса (синтаксис websearch_to_tsquery)
+            query_embedding: Вектор запроса; без него поиск только полнотекстовый
+            topic_id: Фильтр по топику (опционально)
+            category_id: Фильтр по категории топика (опционально)
+            limit: Максимальное количество результатов
+            offset: Смещение в объединенной выдаче (постраничный вывод)
+            candidates: Размер выборки каждого из методов до слияния
+                (не меньше offset + limit)
+            rrf_k: Константа сглаживания RRF
+            probes: ivfflat.probes для векторной части
+            ef_search: hnsw.ef_search для векторной части
+
+        Returns:
+            Список HybridSearchResult по убыванию score (только активные топики)
+        """
+        query, params = self._hybrid_messages_query(
+            query_text, query_embedding, topic_id, category_id, limit, offset, candidates, rrf_k
+        )
+
+        async with self.search_connection(probes, ef_search) as connection:
+            results = await connection.fetch(query, *params)
+
+            return [
+                HybridSearchResult(
+                    message_id=row['message_id'],
+                    topic_id=row['topic_id'],
+                    content=row['content'],
+                    author_name=row['author_name'],
+                    score=float(row['score']),
+                    vector_rank=row['vector_rank'],
+                    lexical_rank=row['lexical_rank'],
+                    similarity=float(row['similarity']) if row['similarity'] is not None else None
+                )
+                for row in results
+            ]
+
+    def _hybrid_messages_query(
+        self,
+        query_text: str,
+        query_embedding: Optional[List[float]],
+        topic_id: Optional[int],
+        category_id: Optional[int],
+        limit: int,
+        offset: int,
+        candidates: int,
+        rrf_k: int
+    ) -> Tuple[str, list]:
+        """
+        Запрос гибридного поиска: по candidates лучших из ANN-индекса и из полнотекстового
+        поиска, слитых FULL OUTER JOIN со скором sum(1 / (rrf_k + rank)). Каждая выдача
+        берется не короче offset + limit, иначе дальние страницы теряли бы результаты
+        """
+        params: list = [query_text, max(candidates, offset + limit), rrf_k, limit, offset]
+        filters = []
+        topic_param = None
+        if topic_id:
+            params.append(topic_id)
+            topic_param = f"${len(params)}"
+            filters.append(f"t.id = {topic_param}")
+        if category_id:
+            params.append(category_id)
+            filters.append(f"t.category_id = ${len(params)}")
+        topic_filter = "".join(f" AND {condition}" for condition in filters)
+
+        if query_embedding is not None:
+            params.append(query_embedding)
+            # Соседи из ANN-индекса с запасом, фильтры по топику/категории - снаружи
+            scan_filter = f"WHERE me.topic_id = {topic_param}" if topic_param and self.iterative_scan else ""
+            nearest = self._nearest_sql(
+                "message_embeddings",
+                "me.message_id, me.topic_id",
+                f"${len(params)}",
+                f"$2 * {SEARCH_OVERSAMPLE}",
+                scan_filter,
+                alias="me"
+            )
+            vector_hits = f"""
+                SELECT nearest.message_id, min(nearest.distance) AS distance,
+                       row_number() OVER (ORDER BY min(nearest.distance)) AS rank
+                FROM ({nearest}) nearest
+                JOIN topics t ON t.id = nearest.topic_id AND t.is_active{topic_filter}
+                GROUP BY nearest.message_id
+                ORDER BY min(nearest.distance)
+                LIMIT $2
+            """
+        else:
+            vector_hits = """
+                SELECT NULL::integer AS message_id, NULL::float8 AS distance, NULL::bigint AS rank
+                WHERE false
+            """
+
+        query = f"""
+            WITH search_query AS (
+                SELECT websearch_to_tsquery('russian', $1) || websearch_to_tsquery('simple', $1) AS tsquery
+            ),
+            vector_hits AS ({vector_hits}),
+            lexical_hits AS (
+                SELECT message_id, row_number() OVER (ORDER BY text_rank DESC, message_id DESC) AS rank
+                FROM (
+                    SELECT m.id AS message_id, ts_rank_cd(m.search_vector, q.tsquery) AS text_rank
+                    FROM messages m
+                    JOIN topics t ON t.id = m.topic_id AND t.is_active{topic_filter}
+                    CROSS JOIN search_query q
+                    WHERE m.search_vector @@ q.tsquery
+                    ORDER BY text_rank DESC, m.id DESC
+                    LIMIT $2
+                ) matched
+            ),
+            fused AS (
+                SELECT
+                    coalesce(v.message_id, l.message_id) AS message_id,
+                    coalesce(1.0 / ($3 + v.rank), 0) + coalesce(1.0 / ($3 + l.rank), 0) AS score,
+                    v.rank AS vector_rank,
+                    l.rank AS lexical_rank,
+                    1 - v.distance AS similarity
+                FROM vector_hits v
+                FULL OUTER JOIN lexical_hits l ON l.message_id = v.message_id
+            )
+            SELECT f.message_id, m.topic_id, m.content, m.author_name,
+                   f.score, f.vector_rank, f.lexical_rank, f.similarity
+            FROM fused f
+            JOIN messages m ON m.id = f.message_id
+            ORDER BY f.score DESC, f.message_id DESC
+            LIMIT $4 OFFSET $5
+        """
+        return query, params
+
+
+def message_plain_text(content: Optional[str]) -> str:
+    """Текст сообщения для эмбеддинга: без цитаты create_message, HTML-разметки и лишних пробелов"""
+    text = QUOTE_BLOCK_PATTERN.sub("", content or "", count=1)
+    return " ".join(html.unescape(HTML_TAG_PATTERN.sub(" ", text)).split())
+
+
+def content_hash(content: str) -> bytes:
+    """
+    Ключ переиспользования эмбеддинга одинакового содержимого. md5 (не криптостойкость,
+    а совпадение с md5() PostgreSQL) позволяет заполнить хэши существующих строк в SQL
+    """
+    return hashlib.md5(content.encode("utf-8")).digest()
+
+
+def asyncpg_database_url(database_url: str) -> str:
+    """DSN SQLAlchemy (postgresql+asyncpg://) в формате asyncpg"""
+    return database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def vector_index_prefix(table: str, column: str) -> str:
+    """
+    Префикс имен ANN-индексов колонки: у основных колонок (embedding / embedding_half)
+    индекс один и тот же {table}_embedding_idx, у колонок пространств - свой
+    """
+    if column in STORAGE_COLUMNS.values():
+        return f"{table}_embedding"
+    return f"{table}_{column}"
+
+
+def _vector_literal(embedding: Sequence[float]) -> str:
+    """Текстовое представление вектора pgvector ('[1.0,2.0]'), приводимое и к halfvec"""
+    return "[" + ",".join(str(float(value)) for value in _to_list(embedding)) + "]"
+
+
+def _to_list(embedding: Any) -> Sequence[float]:
+    """Значение vector/halfvec из pgvector (ndarray, HalfVector) в последовательность чисел"""
+    return embedding.to_list() if hasattr(embedding, "to_list") else embedding
+
+
+def _parse_version(version: Optional[str]) -> Tuple[int, ...]:
+    """Версия расширения '0.8.0' в кортеж для сравнения"""
+    if not version:
+        return ()
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
+def _chunked(records: Iterable[Any], size: int) -> Iterator[list]:
+    """Разбить итерируемый объект на списки не длиннее size"""
+    iterator = iter(records)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
 
 # Пример использования
 async def example_usage():
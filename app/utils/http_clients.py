@@ -0,0 +1,131 @@
+"""
+Долгоживущие HTTP-клиенты внешних сервисов (RAG Manager, AI Manager)
+
+Вместо клиента на каждый запрос на каждый апстрим держится один httpx.AsyncClient
+с пулом keep-alive соединений: TCP/TLS-рукопожатие выполняется один раз, число
+одновременных соединений ограничено HTTP_MAX_CONNECTIONS. Таймауты разделены:
+короткий на установку соединения и ожидание свободного соединения в пуле, длинный
+на чтение ответа (генерация может идти минутами).
+
+HTTP/2 включается при HTTP2_ENABLED и установленном h2 (extras "http2") и
+действует только для https-апстримов; по http httpx всегда говорит HTTP/1.1.
+
+Клиенты привязаны к циклу событий, в котором созданы. Форум закрывает их в
+lifespan приложения, Celery-воркер - при завершении процесса (см. celery_tasks).
+"""
+import asyncio
+import logging
+from typing import Dict, NamedTuple, Optional
+
+import httpx
+
+from app.config import get_settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # h2 - опциональная зависимость (extras "http2")
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class Upstream(NamedTuple):
+    """Внешний сервис: базовый адрес, ключ API и таймаут чтения ответа"""
+
+    base_url: str
+    api_key: Optional[str]
+    read_timeout: float
+
+
+class HTTPClientPool:
+    """Реестр общих httpx.AsyncClient по имени апстрима"""
+
+    def __init__(
+        self,
+        upstreams: Dict[str, Upstream],
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        http2: bool = False,
+    ):
+        self.upstreams = upstreams
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_timeout = connect_timeout
+        self.http2 = http2 and HTTP2_AVAILABLE
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP2_ENABLED включен, но пакет h2 не установлен - используется HTTP/1.1")
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._metrics = {"created": 0, "discarded": 0}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Клиент апстрима name (создается при первом обращении в текущем цикле событий)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Соединения клиентов другого цикла событий (например, прежнего asyncio.run)
+            # использовать нельзя, а закрыть их из нового цикла - тоже
+            self._metrics["discarded"] += len(self._clients)
+            self._clients = {}
+            self._loop = loop
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._create(name)
+        return client
+
+    async def aclose(self) -> None:
+        """Закрыть все клиенты текущего цикла событий"""
+        clients, self._clients, self._loop = self._clients, {}, None
+        for name, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Не удалось закрыть HTTP-клиент {name}: {e}")
+
+    def stats(self) -> dict:
+        """Открытые клиенты и настройки пула"""
+        return {
+            **self._metrics,
+            "clients": sorted(self._clients),
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+        }
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        try:
+            upstream = self.upstreams[name]
+        except KeyError:
+            raise ValueError(f"Неизвестный апстрим: {name}")
+        if not upstream.base_url:
+            raise ValueError(f"Не задан адрес апстрима {name}")
+        headers = {"Accept": "*/*"}
+        if upstream.api_key:
+            headers["Authorization"] = f"Bearer {upstream.api_key}"
+        self._metrics["created"] += 1
+        return httpx.AsyncClient(
+            base_url=upstream.base_url.rstrip("/"),
+            headers=headers,
+            timeout=httpx.Timeout(upstream.read_timeout, connect=self.connect_timeout, pool=self.connect_timeout),
+            limits=self.limits,
+            http2=self.http2,
+        )
+
+
+settings = get_settings
+http_clients = HTTPClientPool(
+    upstreams={
+        "rag": Upstream(settings.RAG_MANAGER_URL, settings.RAG_SERVICE_API_KEY, settings.RAG_READ_TIMEOUT),
+        "ai_manager": Upstream(settings.AI_MANAGER_URL, settings.AI_MANAGER_API_KEY, settings.AI_MANAGER_READ_TIMEOUT),
+    },
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    http2=settings.HTTP2_ENABLED,
+)
@@ -0,0 +1,189 @@
+"""
+Кэш отрендеренных страниц форума с инвалидацией по версиям
+
+Ключ страницы включает версии "областей" (index, topic:<id>), от которых она зависит.
+Запись в форум увеличивает версию области, и старые страницы просто перестают
+находиться, а затем вытесняются из LRU. С PAGE_CACHE_BACKEND=redis версии и
+страницы общие для всех воркеров (включая Celery). В режиме memory версии живут
+в памяти процесса, и записи из Celery или других воркеров uvicorn их не увеличивают,
+поэтому memory годится только для одного процесса-писателя: при WEB_CONCURRENCY > 1
+кэш выключается. Если версии из Redis прочитать не удалось, запрос идет мимо кэша.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.config import get_settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis - опциональная зависимость (extras "cache")
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """In-process LRU с опциональным Redis вторым уровнем"""
+
+    VERSION_PREFIX = "forum:page_version:"
+    PAGE_PREFIX = "forum:page:"
+
+    def __init__(self, max_entries: int = 512, ttl: int = 300, redis_url: Optional[str] = None, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._metrics: Dict[str, Dict[str, int]] = {}
+        self._invalidations = 0
+        self._bypassed = 0
+        self._redis = None
+        if redis_url and enabled:
+            if aioredis is None:
+                # Локальные версии не видят записей других процессов - без Redis не кэшируем
+                logger.warning("PAGE_CACHE_BACKEND=redis, но пакет redis не установлен - кэш страниц выключен")
+                self.enabled = False
+            else:
+                self._redis = aioredis.from_url(redis_url)
+
+    async def page_key(self, route: str, *scopes: str) -> Optional[str]:
+        """
+        Ключ страницы маршрута route с текущими версиями областей scopes.
+        None - кэш выключен или версии недоступны: страница рендерится без кэша
+        """
+        versions = await self._get_versions(scopes) if self.enabled else None
+        if versions is None:
+            self._bypassed += 1
+            return None
+        suffix = ",".join(f"{scope}@{version}" for scope, version in zip(scopes, versions))
+        return f"{route}:{suffix}"
+
+    async def get(self, key: Optional[str]) -> Optional[str]:
+        """Получить страницу по ключу из page_key"""
+        if key is None:
+            return None
+        body = self._get_local(key)
+        if body is None and self._redis is not None:
+            try:
+                raw = await self._redis.get(self.PAGE_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"Ошибка чтения кэша страниц из Redis: {e}")
+                raw = None
+            if raw is not None:
+                body = raw.decode()
+                self._set_local(key, body)
+
+        self._count(key, "hits" if body is not None else "misses")
+        return body
+
+    async def set(self, key: Optional[str], body: str) -> None:
+        """Сохранить отрендеренную страницу"""
+        if key is None:
+            return
+        self._set_local(key, body)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self.PAGE_PREFIX + key, body, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Ошибка записи кэша страниц в Redis: {e}")
+
+    async def invalidate(self, *scopes: str) -> None:
+        """Увеличить версии областей - все зависящие от них страницы становятся неактуальными"""
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+        if self._redis is not None:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for scope in scopes:
+                        pipe.incr(self.VERSION_PREFIX + scope)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Ошибка инвалидации кэша страниц в Redis: {e}")
+        self._invalidations += len(scopes)
+
+    def clear(self) -> None:
+        """Очистить локальный уровень кэша"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Метрики попаданий/промахов по маршрутам"""
+        routes = {}
+        for route, counters in self._metrics.items():
+            requests = counters["hits"] + counters["misses"]
+            routes[route] = {**counters, "hit_rate": round(counters["hits"] / requests, 3) if requests else 0.0}
+        if not self.enabled:
+            backend = "off"
+        else:
+            backend = "redis" if self._redis is not None else "memory"
+        return {
+            "backend": backend,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "invalidations": self._invalidations,
+            "bypassed": self._bypassed,
+            "routes": routes,
+        }
+
+    async def _get_versions(self, scopes: Tuple[str, ...]) -> Optional[list]:
+        if self._redis is None:
+            return [self._versions.get(scope, 0) for scope in scopes]
+        try:
+            values = await self._redis.mget([self.VERSION_PREFIX + scope for scope in scopes])
+        except Exception as e:
+            # Локальные версии могли отстать от записей других процессов
+            logger.warning(f"Ошибка чтения версий кэша страниц из Redis: {e}")
+            return None
+        return [int(value) if value is not None else 0 for value in values]
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, body = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    def _set_local(self, key: str, body: str) -> None:
+        self._entries[key] = (time.monotonic(), body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _count(self, key: str, counter: str) -> None:
+        route = key.split(":", 1)[0]
+        counters = self._metrics.setdefault(route, {"hits": 0, "misses": 0})
+        counters[counter] += 1
+
+
+# Область главной страницы: темы, счетчики, последние сообщения, категории
+INDEX_SCOPE = "index"
+
+
+def topic_scope(topic_id: int) -> str:
+    """Область кэша страницы темы"""
+    return f"topic:{topic_id}"
+
+
+def _page_cache_enabled(backend: str, web_concurrency: int) -> bool:
+    """memory - только для одного процесса uvicorn; off и неизвестные значения выключают кэш"""
+    if backend == "memory" and web_concurrency > 1:
+        logger.warning(
+            "PAGE_CACHE_BACKEND=memory при WEB_CONCURRENCY > 1: инвалидации других воркеров "
+            "не видны - кэш страниц выключен, используйте PAGE_CACHE_BACKEND=redis"
+        )
+        return False
+    return backend in ("memory", "redis")
+
+
+settings = get_settings
+page_cache = PageCache(
+    max_entries=settings.PAGE_CACHE_MAX_ENTRIES,
+    ttl=settings.PAGE_CACHE_TTL,
+    redis_url=settings.REDIS_URL if settings.PAGE_CACHE_BACKEND == "redis" else None,
+    enabled=_page_cache_enabled(settings.PAGE_CACHE_BACKEND, settings.WEB_CONCURRENCY),
+)
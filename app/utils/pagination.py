@@ -0,0 +1,58 @@
+"""
+Keyset (cursor) пагинация для списков, отсортированных по (sort_value DESC, id DESC)
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Literal, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, tuple_
+
+PaginationMode = Literal["offset", "cursor"]
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    """Упаковать позицию последней строки страницы в непрозрачный курсор"""
+    payload = {"v": sort_value.isoformat() if sort_value is not None else None, "id": row_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Распаковать курсор. Бросает ValueError, если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        sort_value = datetime.fromisoformat(payload["v"]) if payload["v"] is not None else None
+        return sort_value, int(payload["id"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Некорректный курсор пагинации") from e
+
+
+def keyset_after(sort_column, id_column, cursor: str, nullable: bool = False):
+    """
+    Условие "строки после курсора" для сортировки (sort_column DESC NULLS LAST, id DESC).
+    Для NOT NULL колонок сводится к сравнению кортежей, которое обслуживается
+    составным индексом (sort_column DESC, id DESC); nullable=True добавляет хвост
+    строк с NULL в сортировочной колонке.
+    """
+    sort_value, row_id = decode_cursor(cursor)
+    if sort_value is None:
+        return and_(sort_column.is_(None), id_column < row_id)
+    after = tuple_(sort_column, id_column) < tuple_(sort_value, row_id)
+    if nullable:
+        return or_(after, sort_column.is_(None))
+    return after
+
+
+def next_cursor(rows: Sequence[Any], limit: int, sort_attr: str) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница последняя"""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(getattr(last, sort_attr), last.id)
+
+
+def cursor_page(rows: Sequence[Any], limit: int, sort_attr: str) -> dict:
+    """Ответ в формате CursorPage: элементы страницы и курсор следующей"""
+    return {"items": list(rows), "next_cursor": next_cursor(rows, limit, sort_attr)}
@@ -0,0 +1,227 @@
+"""
+Локальное хранилище векторов тем для быстрого поиска внутри темы
+
+Векторы каждой темы лежат в отдельном файле-матрице (float32 или float16,
+нормированные строки) и читаются через np.memmap, метаданные строк - в соседнем
+JSON Lines файле. Поиск top-k - одно матричное умножение и argpartition, без
+обращения к PostgreSQL. Тема материализуется из message_embeddings при первом
+поиске, дальше индексатор дописывает новые векторы в конец файлов, а правка или
+удаление сообщения удаляет файлы темы (следующий поиск загрузит ее заново).
+Строки и векторы сопоставляются по позиции, поэтому запись и чтение темы идут под
+блокировкой файла topic_N.lock (flock): индексаторы нескольких процессов дописывают
+одну тему по очереди, а читатель не видит половину дозаписи.
+Включается настройкой VECTOR_STORE_DIR; источником истины остается pgvector.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class StoredVector(NamedTuple):
+    """Строка хранилища: запись message_embeddings"""
+    id: int
+    message_id: int
+    content: str
+    embedding: Sequence[float]
+    metadata: Optional[dict]
+
+
+class _TopicMatrix(NamedTuple):
+    file_state: Tuple[int, int, int, int]  # (inode, размер) файлов векторов и строк
+    vectors: np.ndarray
+    rows: List[dict]
+
+
+class TopicVectorStore:
+    """Файлы векторов по темам с косинусным top-k поиском в процессе"""
+
+    def __init__(self, directory: str, dtype: str = "float32"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self._topics: Dict[int, _TopicMatrix] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "appends": 0, "invalidations": 0}
+
+    def has_topic(self, topic_id: int) -> bool:
+        """Материализована ли тема"""
+        return self._rows_path(topic_id).exists()
+
+    def write_topic(self, topic_id: int, dimensions: int, rows: Iterable[StoredVector]) -> int:
+        """Полностью записать векторы темы (файлы подменяются атомарно)"""
+        rows = list(rows)
+        vectors_path, rows_path = self._vectors_path(topic_id), self._rows_path(topic_id)
+        with self._topic_lock(topic_id):
+            self._normalize([row.embedding for row in rows], dimensions).tofile(f"{vectors_path}.tmp")
+            with open(f"{rows_path}.tmp", "w", encoding="utf-8") as file:
+                file.write(json.dumps({"dimensions": dimensions, "dtype": self.dtype.name}) + "\n")
+                file.writelines(self._row_line(row) for row in rows)
+            # Сначала векторы: строки без векторов при чтении отбрасываются
+            os.replace(f"{vectors_path}.tmp", vectors_path)
+            os.replace(f"{rows_path}.tmp", rows_path)
+            self._topics.pop(topic_id, None)
+        return len(rows)
+
+    def append(self, topic_id: int, rows: Sequence[StoredVector]) -> bool:
+        """Дописать векторы в материализованную тему (False - тема не материализована)"""
+        if not rows:
+            return False
+        with self._topic_lock(topic_id):
+            # Тему мог сбросить другой процесс - дозапись создала бы файлы без заголовка
+            if not self.has_topic(topic_id):
+                return False
+            header = self._read_header(topic_id)
+            with open(self._vectors_path(topic_id), "ab") as file:
+                self._normalize([row.embedding for row in rows], header["dimensions"]).tofile(file)
+            with open(self._rows_path(topic_id), "a", encoding="utf-8") as file:
+                file.writelines(self._row_line(row) for row in rows)
+            self._metrics["appends"] += len(rows)
+        return True
+
+    def invalidate(self, topic_id: int) -> None:
+        """Удалить векторы темы - следующий поиск загрузит ее из PostgreSQL"""
+        with self._topic_lock(topic_id):
+            self._topics.pop(topic_id, None)
+            for path in (self._rows_path(topic_id), self._vectors_path(topic_id)):
+                path.unlink(missing_ok=True)
+            self._metrics["invalidations"] += 1
+
+    def clear(self) -> None:
+        """Удалить векторы всех тем (смена пространства эмбеддингов)"""
+        with self._lock:
+            self._topics.clear()
+            for pattern in ("topic_*.vectors", "topic_*.jsonl"):
+                for path in self.directory.glob(pattern):
+                    path.unlink(missing_ok=True)
+            self._metrics["invalidations"] += 1
+
+    def search(
+        self,
+        topic_id: int,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        similarity_threshold: float = 0.8
+    ) -> Optional[List[Tuple[int, int, int, str, float, dict]]]:
+        """
+        Top-k похожих сообщений темы в формате EmbeddingManager.search_similar_messages:
+        (id, message_id, topic_id, content, similarity, metadata). None - тема не материализована
+        """
+        topic = self._load(topic_id)
+        if topic is None:
+            self._metrics["misses"] += 1
+            return None
+        self._metrics["hits"] += 1
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not len(topic.rows) or not norm:
+            return []
+        scores = topic.vectors @ (query / norm)
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = []
+        for index in top:
+            if scores[index] <= similarity_threshold:
+                break
+            row = topic.rows[index]
+            results.append(
+                (row["id"], row["message_id"], topic_id, row["content"], float(scores[index]), row["metadata"] or {})
+            )
+        return results
+
+    def stats(self) -> dict:
+        """Метрики попаданий и размер загруженных тем"""
+        return {
+            **self._metrics,
+            "dtype": self.dtype.name,
+            "loaded_topics": len(self._topics),
+            "loaded_vectors": sum(len(topic.rows) for topic in self._topics.values()),
+        }
+
+    def _load(self, topic_id: int) -> Optional[_TopicMatrix]:
+        """Матрица темы; перечитывается, если файлы изменил другой процесс"""
+        vectors_path, rows_path = self._vectors_path(topic_id), self._rows_path(topic_id)
+        if not rows_path.exists():
+            self._topics.pop(topic_id, None)
+            return None
+        with self._topic_lock(topic_id, shared=True):
+            try:
+                vectors_stat, rows_stat = vectors_path.stat(), rows_path.stat()
+            except FileNotFoundError:
+                self._topics.pop(topic_id, None)
+                return None
+            file_state = (vectors_stat.st_ino, vectors_stat.st_size, rows_stat.st_ino, rows_stat.st_size)
+            cached = self._topics.get(topic_id)
+            if cached is not None and cached.file_state == file_state:
+                return cached
+
+            with open(rows_path, encoding="utf-8") as file:
+                header = json.loads(file.readline())
+                rows = [json.loads(line) for line in file if line.strip()]
+            dtype = np.dtype(header["dtype"])
+            dimensions = header["dimensions"]
+            count = min(len(rows), vectors_stat.st_size // (dtype.itemsize * dimensions))
+            if count:
+                vectors = np.memmap(vectors_path, dtype=dtype, mode="r", shape=(count, dimensions))
+            else:
+                vectors = np.empty((0, dimensions), dtype=dtype)
+            topic = _TopicMatrix(file_state, vectors, rows[:count])
+            self._topics[topic_id] = topic
+            return topic
+
+    @contextmanager
+    def _topic_lock(self, topic_id: int, shared: bool = False) -> Iterator[None]:
+        """
+        Блокировка темы между потоками процесса и между процессами (flock на topic_N.lock).
+        Файл блокировки не удаляется: иначе процессы могли бы держать блокировки разных файлов
+        """
+        with self._lock, open(self._lock_path(topic_id), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    def _read_header(self, topic_id: int) -> dict:
+        with open(self._rows_path(topic_id), encoding="utf-8") as file:
+            return json.loads(file.readline())
+
+    def _normalize(self, embeddings: List[Sequence[float]], dimensions: int) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(-1, dimensions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(self.dtype)
+
+    @staticmethod
+    def _row_line(row: StoredVector) -> str:
+        return json.dumps(
+            {"id": row.id, "message_id": row.message_id, "content": row.content, "metadata": row.metadata},
+            ensure_ascii=False,
+        ) + "\n"
+
+    def _vectors_path(self, topic_id: int) -> Path:
+        return self.directory / f"topic_{topic_id}.vectors"
+
+    def _rows_path(self, topic_id: int) -> Path:
+        return self.directory / f"topic_{topic_id}.jsonl"
+
+    def _lock_path(self, topic_id: int) -> Path:
+        return self.directory / f"topic_{topic_id}.lock"
+
+
+settings = get_settings
+topic_vector_store = (
+    TopicVectorStore(settings.VECTOR_STORE_DIR, dtype=settings.VECTOR_STORE_DTYPE)
+    if settings.VECTOR_STORE_DIR
+    else None
+)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк загрузки эмбеддингов сообщений: построчный INSERT ... RETURNING
+(insert_message_embedding) против бинарного COPY порциями (insert_message_embeddings_bulk)
+
+Требует PostgreSQL с pgvector (make db-up). Вставленные строки удаляются после замера.
+Запуск: poetry run python benchmarks/bench_embedding_ingest.py --rows 5000 --chunk-size 1000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings  # noqa: E402
+from app.utils.embedding_manager import EmbeddingManager  # noqa: E402
+
+DIMENSIONS = 1536
+# message_id вне диапазона реальных сообщений, чтобы легко убрать за собой
+BENCH_MESSAGE_ID = -1
+
+
+def make_rows(count):
+    rng = random.Random(42)
+    return [
+        (BENCH_MESSAGE_ID, 0, f"Сообщение бенчмарка #{n}", [rng.random() for _ in range(DIMENSIONS)], {"bench": True})
+        for n in range(count)
+    ]
+
+
+async def per_row(manager, rows):
+    for message_id, topic_id, content, embedding, metadata in rows:
+        await manager.insert_message_embedding(message_id, topic_id, content, embedding, metadata)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк загрузки эмбеддингов")
+    parser.add_argument("--rows", type=int, default=2000, help="Количество эмбеддингов")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Размер порции COPY")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    manager = EmbeddingManager(get_settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"))
+    await manager.initialize()
+    try:
+        results = []
+        for name, load in (
+            ("INSERT построчно", lambda: per_row(manager, rows)),
+            (
+                f"COPY порциями по {args.chunk_size}",
+                lambda: manager.insert_message_embeddings_bulk(rows, args.chunk_size),
+            ),
+        ):
+            started = time.perf_counter()
+            await load()
+            elapsed = time.perf_counter() - started
+            results.append((name, elapsed, args.rows / elapsed))
+            await manager.pool.execute("DELETE FROM message_embeddings WHERE message_id = $1", BENCH_MESSAGE_ID)
+
+        print(f"{'вариант':<26} {'сек':>8} {'строк/сек':>12}")
+        for name, elapsed, throughput in results:
+            print(f"{name:<26} {elapsed:>8.2f} {throughput:>12.0f}")
+    finally:
+        await manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк рендеринга сообщений: стоимость одного сообщения
+до (новые Markdown/bleach на каждый вызов) и после (переиспользуемый движок фильтров)
+
+Запуск: poetry run python benchmarks/bench_template_filters.py --messages 2000
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+import bleach
+import markdown
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.template_filters import (  # noqa: E402
+    MARKDOWN_ATTRIBUTES, MARKDOWN_EXTENSIONS, MARKDOWN_EXTENSION_CONFIGS, MARKDOWN_TAGS,
+    SAFE_ATTRIBUTES, SAFE_TAGS, markdown_to_html, smart_content,
+)
+
+SAMPLE = """Сообщение #{n} со ссылкой https://example.com/page/{n} и немного **markdown**.
+
+```python
+def handler(request):
+    return {{"id": {n}, "status": "ok"}}
+```
+
+| колонка | значение |
+|---------|----------|
+| n       | {n}      |
+"""
+
+
+def legacy_markdown_to_html(text):
+    """Реализация до оптимизации: новый Markdown и списки разрешений на каждый вызов"""
+    md = markdown.Markdown(extensions=list(MARKDOWN_EXTENSIONS), extension_configs=MARKDOWN_EXTENSION_CONFIGS)
+    html = md.convert(text)
+    return bleach.clean(html, tags=list(MARKDOWN_TAGS), attributes=dict(MARKDOWN_ATTRIBUTES), strip=True)
+
+
+def legacy_smart_content(text):
+    """Реализация до оптимизации: regex автоссылок компилируется на каждый вызов"""
+    url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+    linked = url_pattern.sub(lambda m: f'<a href="{m.group(0)}" target="_blank" rel="noopener">{m.group(0)}</a>', text)
+    return bleach.clean(
+        linked.replace('\n', '<br>'), tags=list(SAFE_TAGS), attributes=dict(SAFE_ATTRIBUTES), strip=True
+    )
+
+
+def measure(func, messages):
+    """Среднее время рендеринга одного сообщения, мкс"""
+    started = time.perf_counter()
+    for text in messages:
+        func(text)
+    return (time.perf_counter() - started) / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк фильтров шаблонов")
+    parser.add_argument("--messages", type=int, default=1000, help="Количество уникальных сообщений")
+    args = parser.parse_args()
+
+    messages = [SAMPLE.format(n=n) for n in range(args.messages)]
+    # Прогрев импорта расширений и Pygments
+    legacy_markdown_to_html(messages[0])
+    markdown_to_html.cache_clear()
+    smart_content.cache_clear()
+
+    rows = [
+        ("markdown_to_html", "до", measure(legacy_markdown_to_html, messages)),
+        ("markdown_to_html", "после (холодный)", measure(markdown_to_html, messages)),
+        ("markdown_to_html", "после (LRU)", measure(markdown_to_html, messages)),
+        ("smart_content", "до", measure(legacy_smart_content, messages)),
+        ("smart_content", "после (холодный)", measure(smart_content, messages)),
+        ("smart_content", "после (LRU)", measure(smart_content, messages)),
+    ]
+    print(f"{'фильтр':<18} {'вариант':<18} {'мкс/сообщение':>14}")
+    for name, variant, cost in rows:
+        print(f"{name:<18} {variant:<18} {cost:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Recall@k и задержка приближенного векторного поиска на данных форума
+
+Запросами служат случайные векторы из самой таблицы. Для каждого считается точный
+top-k (индексные сканы выключены) и приближенный top-k при разных значениях
+ivfflat.probes или hnsw.ef_search (в зависимости от типа построенного индекса).
+
+Запуск: poetry run python benchmarks/bench_vector_recall.py --queries 50 --k 10 --values 1,5,10,20,40
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.embedding_manager import EmbeddingManager, VECTOR_TABLES, vector_index_prefix  # noqa: E402
+
+DEFAULT_VALUES = {"ivfflat": "1,5,10,20,40", "hnsw": "20,40,80,160,320"}
+
+
+async def index_type(manager, table):
+    index_name = f"{vector_index_prefix(table, manager.columns[table])}_idx"
+    indexdef = await manager.pool.fetchval(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = $1 AND indexname = $2", table, index_name
+    )
+    if indexdef is None:
+        raise SystemExit(f"У таблицы {table} нет векторного индекса {index_name}")
+    return "hnsw" if "USING hnsw" in indexdef else "ivfflat"
+
+
+async def top_k(connection, table, column, embedding, k):
+    rows = await connection.fetch(f"SELECT id FROM {table} ORDER BY {column} <=> $1 LIMIT $2", embedding, k)
+    return [row["id"] for row in rows]
+
+
+async def exact_top_k(manager, table, embedding, k):
+    async with manager.pool.acquire() as connection:
+        async with connection.transaction():
+            await connection.execute("SET LOCAL enable_indexscan = off")
+            return await top_k(connection, table, manager.columns[table], embedding, k)
+
+
+async def approximate_top_k(manager, table, embedding, k, kind, value):
+    knobs = {"probes": value} if kind == "ivfflat" else {"ef_search": value}
+    async with manager.search_connection(**knobs) as connection:
+        started = time.perf_counter()
+        ids = await top_k(connection, table, manager.columns[table], embedding, k)
+        return ids, (time.perf_counter() - started) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Recall@k и задержка векторного поиска")
+    parser.add_argument("--table", choices=VECTOR_TABLES, default="message_embeddings")
+    parser.add_argument("--queries", type=int, default=50, help="Количество запросов")
+    parser.add_argument("--k", type=int, default=10, help="Размер выдачи")
+    parser.add_argument("--values", help="Значения probes (IVFFlat) или ef_search (HNSW) через запятую")
+    args = parser.parse_args()
+
+    manager = EmbeddingManager.from_settings()
+    await manager.initialize()
+    try:
+        kind = await index_type(manager, args.table)
+        values = [int(value) for value in (args.values or DEFAULT_VALUES[kind]).split(",")]
+        queries = [
+            row["embedding"] for row in await manager.pool.fetch(
+                f"SELECT {manager.columns[args.table]} AS embedding FROM {args.table}"
+                f" WHERE {manager.columns[args.table]} IS NOT NULL ORDER BY random() LIMIT $1",
+                args.queries,
+            )
+        ]
+        if not queries:
+            raise SystemExit(f"Таблица {args.table} пуста")
+        exact = [set(await exact_top_k(manager, args.table, embedding, args.k)) for embedding in queries]
+
+        knob = "probes" if kind == "ivfflat" else "ef_search"
+        print(f"Индекс {kind}, {len(queries)} запросов, k={args.k}")
+        print(f"{knob:>10} {'recall@k':>10} {'p50, мс':>9} {'p95, мс':>9}")
+        for value in values:
+            recalls, latencies = [], []
+            for embedding, expected in zip(queries, exact):
+                ids, elapsed = await approximate_top_k(manager, args.table, embedding, args.k, kind, value)
+                recalls.append(len(expected & set(ids)) / len(expected) if expected else 1.0)
+                latencies.append(elapsed)
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            print(f"{value:>10} {statistics.mean(recalls):>10.3f} {statistics.median(latencies):>9.2f} {p95:>9.2f}")
+    finally:
+        await manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
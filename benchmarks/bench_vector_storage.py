@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Размер, recall@k и задержка поиска по message_embeddings при разных форматах хранения:
+vector (float32), halfvec (float16) и halfvec с бинарной квантизацией и переранжированием
+
+Требует миграцию docker/migrations/006_halfvec_storage.sql и заполненную колонку
+embedding_half (make convert-halfvec). Для честной задержки индексы нужно построить
+под каждый вариант (VECTOR_STORAGE / VECTOR_QUANTIZATION и make vector-index), иначе
+замер покажет последовательный скан. Эталон - точный top-k по float32 колонке.
+
+Запуск: poetry run python benchmarks/bench_vector_storage.py --queries 50 --k 10
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.embedding_manager import EmbeddingManager  # noqa: E402
+
+TABLE = "message_embeddings"
+VARIANTS = (("vector", "none"), ("halfvec", "none"), ("halfvec", "binary"))
+
+
+async def print_sizes(manager):
+    sizes = await manager.pool.fetchrow(
+        f"""
+        SELECT avg(pg_column_size(embedding)) AS vector_bytes,
+               avg(pg_column_size(embedding_half)) AS halfvec_bytes,
+               pg_table_size('{TABLE}') AS table_bytes
+        FROM {TABLE}
+        """
+    )
+    print(f"Средний размер значения: vector {sizes['vector_bytes'] or 0:.0f} Б, "
+          f"halfvec {sizes['halfvec_bytes'] or 0:.0f} Б; таблица {sizes['table_bytes'] / 2**20:.1f} МБ")
+    indexes = await manager.pool.fetch(
+        "SELECT indexname, pg_relation_size(indexname::regclass) AS bytes FROM pg_indexes WHERE tablename = $1",
+        TABLE,
+    )
+    for index in indexes:
+        print(f"  индекс {index['indexname']}: {index['bytes'] / 2**20:.1f} МБ")
+
+
+async def exact_top_k(manager, embedding, k):
+    async with manager.pool.acquire() as connection:
+        async with connection.transaction():
+            await connection.execute("SET LOCAL enable_indexscan = off")
+            rows = await connection.fetch(
+                f"SELECT id FROM {TABLE} ORDER BY embedding <=> $1 LIMIT $2", embedding, k
+            )
+            return {row["id"] for row in rows}
+
+
+async def measure(manager, queries, exact, k):
+    recalls, latencies = [], []
+    for embedding, expected in zip(queries, exact):
+        started = time.perf_counter()
+        results = await manager.search_similar_messages(embedding, limit=k, similarity_threshold=-1.0)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {row[0] for row in results}
+        recalls.append(len(expected & found) / len(expected) if expected else 1.0)
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    return statistics.mean(recalls), statistics.median(latencies), p95
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Сравнение форматов хранения эмбеддингов")
+    parser.add_argument("--queries", type=int, default=50, help="Количество запросов")
+    parser.add_argument("--k", type=int, default=10, help="Размер выдачи")
+    args = parser.parse_args()
+
+    reference = EmbeddingManager.from_settings(storage="vector", quantization="none")
+    await reference.initialize()
+    try:
+        await print_sizes(reference)
+        queries = [
+            row["embedding"] for row in await reference.pool.fetch(
+                f"SELECT embedding FROM {TABLE} WHERE embedding IS NOT NULL ORDER BY random() LIMIT $1",
+                args.queries,
+            )
+        ]
+        if not queries:
+            raise SystemExit(f"Таблица {TABLE} пуста")
+        exact = [await exact_top_k(reference, embedding, args.k) for embedding in queries]
+    finally:
+        await reference.close()
+
+    print(f"{len(queries)} запросов, k={args.k}")
+    print(f"{'вариант':<18} {'recall@k':>10} {'p50, мс':>9} {'p95, мс':>9}")
+    for storage, quantization in VARIANTS:
+        manager = EmbeddingManager.from_settings(storage=storage, quantization=quantization)
+        await manager.initialize()
+        try:
+            recall, p50, p95 = await measure(manager, queries, exact, args.k)
+        finally:
+            await manager.close()
+        name = storage if quantization == "none" else f"{storage}+{quantization}"
+        print(f"{name:<18} {recall:>10.3f} {p50:>9.2f} {p95:>9.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
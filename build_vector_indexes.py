@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Скрипт для перестроения векторных индексов embeddings / message_embeddings
+(IVFFlat или HNSW с параметрами из настроек)
+"""
+import argparse
+import asyncio
+from app.config import get_settings
+from app.utils.embedding_manager import EmbeddingManager, VECTOR_INDEX_TYPES
+
+
+async def build_vector_indexes(index_type: str, lists: int, m: int, ef_construction: int):
+    """Перестраивает ANN-индексы без блокировки записи (CREATE INDEX CONCURRENTLY)"""
+    manager = EmbeddingManager.from_settings()
+    await manager.initialize()
+    try:
+        print(f"Строим индексы {index_type}...")
+        await manager.create_vector_indexes(index_type, lists=lists, m=m, ef_construction=ef_construction)
+        print("✓ Индексы перестроены")
+    finally:
+        await manager.close()
+
+
+if __name__ == "__main__":
+    settings = get_settings
+    parser = argparse.ArgumentParser(description="Перестроение векторных индексов")
+    parser.add_argument("--type", choices=VECTOR_INDEX_TYPES, default=settings.VECTOR_INDEX_TYPE, help="Тип индекса")
+    parser.add_argument("--lists", type=int, default=settings.IVFFLAT_LISTS, help="IVFFlat: количество списков")
+    parser.add_argument("--m", type=int, default=settings.HNSW_M, help="HNSW: связей на узел")
+    parser.add_argument(
+        "--ef-construction", type=int, default=settings.HNSW_EF_CONSTRUCTION, help="HNSW: кандидатов при построении"
+    )
+    args = parser.parse_args()
+    asyncio.run(build_vector_indexes(args.type, args.lists, args.m, args.ef_construction))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Скрипт для переноса эмбеддингов embeddings / message_embeddings в halfvec
+(колонка embedding_half, миграция docker/migrations/006_halfvec_storage.sql)
+"""
+import argparse
+import asyncio
+from app.utils.embedding_manager import EmbeddingManager, VECTOR_TABLES
+
+
+async def convert_vector_storage(batch_size: int, drop_float: bool):
+    """Конвертирует строки порциями; повторный запуск дописывает только новые строки"""
+    manager = EmbeddingManager.from_settings()
+    await manager.initialize()
+    try:
+        for table in VECTOR_TABLES:
+            print(f"Конвертируем {table}...")
+            converted = await manager.convert_to_halfvec(table, batch_size=batch_size)
+            print(f"✓ {table}: сконвертировано строк: {converted}")
+            if drop_float:
+                await manager.drop_float_storage(table)
+                print(f"✓ {table}: колонка embedding удалена (место освободит VACUUM FULL / pg_repack)")
+    finally:
+        await manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос эмбеддингов в halfvec")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Строк в одной транзакции")
+    parser.add_argument(
+        "--drop-float", action="store_true", help="Удалить колонку embedding после конвертации (необратимо)"
+    )
+    args = parser.parse_args()
+    asyncio.run(convert_vector_storage(args.batch_size, args.drop_float))
@@ -23,7 +23,9 @@ CREATE TABLE IF NOT EXISTS message_embeddings (
     content TEXT NOT NULL,
     embedding vector(1536),
     metadata JSONB,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Один эмбеддинг на сообщение (запись индексатора - INSERT ... ON CONFLICT)
+    CONSTRAINT message_embeddings_message_id_key UNIQUE (message_id)
 );
 
 -- Индекс для поиска по эмбеддингам сообщений
@@ -31,10 +33,6 @@ CREATE INDEX IF NOT EXISTS message_embeddings_embedding_idx
 ON message_embeddings USING ivfflat (embedding vector_cosine_ops) 
 WITH (lists = 100);
 
--- Индекс для поиска по message_id
-CREATE INDEX IF NOT EXISTS message_embeddings_message_id_idx 
-ON message_embeddings (message_id);
-
 -- Индекс для поиска по topic_id
 CREATE INDEX IF NOT EXISTS message_embeddings_topic_id_idx 
 ON message_embeddings (topic_id);
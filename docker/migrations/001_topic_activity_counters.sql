@@ -0,0 +1,25 @@
+-- Денормализованные счетчики активности тем
+-- Поддерживаются MessageApi.create_message / delete_message_by_id,
+-- пересчитываются командой repair_topic_counters.py
+
+ALTER TABLE topics ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE topics ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP;
+ALTER TABLE topics ADD COLUMN IF NOT EXISTS last_message_id INTEGER;
+
+-- Сортировка списка тем "по активности"
+CREATE INDEX IF NOT EXISTS topics_active_last_message_at_idx
+ON topics (is_active, last_message_at DESC NULLS LAST, id DESC);
+
+-- Поиск последнего сообщения темы при удалении
+CREATE INDEX IF NOT EXISTS messages_topic_id_created_at_idx
+ON messages (topic_id, created_at DESC, id DESC);
+
+-- Первичное заполнение (для больших таблиц лучше repair_topic_counters.py - он идет пачками)
+UPDATE topics t
+SET message_count = (SELECT count(*) FROM messages m WHERE m.topic_id = t.id),
+    last_message_id = (
+        SELECT m.id FROM messages m WHERE m.topic_id = t.id ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+    ),
+    last_message_at = (
+        SELECT m.created_at FROM messages m WHERE m.topic_id = t.id ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+    );
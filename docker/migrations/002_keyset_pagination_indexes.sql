@@ -0,0 +1,14 @@
+-- Составные индексы под keyset-пагинацию (sort_value DESC, id DESC)
+
+CREATE INDEX IF NOT EXISTS users_created_at_id_idx
+ON users (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS topics_updated_at_id_idx
+ON topics (updated_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS topics_active_updated_at_id_idx
+ON topics (updated_at DESC, id DESC)
+WHERE is_active;
+
+CREATE INDEX IF NOT EXISTS messages_created_at_id_idx
+ON messages (created_at DESC, id DESC);
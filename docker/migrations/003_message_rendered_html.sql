@@ -0,0 +1,6 @@
+-- Render-on-write: очищенный HTML сообщения и версия рендерера, которым он получен.
+-- Заполняется MessageApi.create_message / update_message,
+-- существующие и устаревшие строки перерисовывает Celery-задача rerender_messages.
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_html TEXT;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS render_version INTEGER;
@@ -0,0 +1,3 @@
+-- Рекурсивная выборка дерева ответов (MessageApi.get_topic_thread)
+CREATE INDEX IF NOT EXISTS messages_parent_id_idx
+ON messages (parent_id);
@@ -0,0 +1,24 @@
+-- Полнотекстовый поиск по сообщениям и темам.
+-- tsvector объединяет конфигурации russian (стемминг) и simple (точные слова, код, имена);
+-- HTML-разметка (цитаты create_message) вырезается до индексации.
+-- Внимание: добавление STORED-колонки переписывает таблицу, выполнять в окно обслуживания.
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    to_tsvector('russian', regexp_replace(coalesce(content, ''), '<[^>]*>', ' ', 'g'))
+    || to_tsvector('simple', regexp_replace(coalesce(content, ''), '<[^>]*>', ' ', 'g'))
+) STORED;
+
+ALTER TABLE topics ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+    || setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS messages_search_vector_idx
+ON messages USING gin (search_vector);
+
+CREATE INDEX IF NOT EXISTS topics_search_vector_idx
+ON topics USING gin (search_vector);
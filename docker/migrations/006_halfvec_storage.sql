@@ -0,0 +1,8 @@
+-- Хранение эмбеддингов в halfvec (float16, pgvector >= 0.7): вдвое меньше места в строках и индексах.
+-- Колонка добавляется пустой; существующие строки переносит make convert-halfvec (порциями),
+-- после чего VECTOR_STORAGE=halfvec и make vector-index перестраивают индексы на embedding_half.
+-- С VECTOR_QUANTIZATION=binary make vector-index дополнительно строит индекс по binary_quantize.
+
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS embedding_half halfvec(1536);
+
+ALTER TABLE message_embeddings ADD COLUMN IF NOT EXISTS embedding_half halfvec(1536);
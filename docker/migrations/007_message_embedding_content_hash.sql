@@ -0,0 +1,11 @@
+-- Дедупликация эмбеддингов: хэш нормализованного текста (md5, см. content_hash в
+-- app/utils/embedding_manager.py). Индексатор берет готовый вектор строки с тем же хэшем
+-- вместо повторного вызова модели.
+-- Внимание: заполнение хэшей существующих строк обновляет всю таблицу, выполнять в окно обслуживания.
+
+ALTER TABLE message_embeddings ADD COLUMN IF NOT EXISTS content_hash bytea;
+
+UPDATE message_embeddings SET content_hash = decode(md5(content), 'hex') WHERE content_hash IS NULL;
+
+CREATE INDEX IF NOT EXISTS message_embeddings_content_hash_idx
+ON message_embeddings (content_hash);
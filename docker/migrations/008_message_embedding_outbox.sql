@@ -0,0 +1,12 @@
+-- Очередь изменений сообщений для переиндексации эмбеддингов (transactional outbox).
+-- Строки пишутся update_message / delete_message_by_id в той же транзакции, что и само
+-- изменение; индексатор забирает их порциями, удаляет устаревшие эмбеддинги и
+-- пересчитывает эмбеддинги измененных сообщений.
+
+CREATE TABLE IF NOT EXISTS message_embedding_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    message_id INTEGER NOT NULL,
+    topic_id INTEGER NOT NULL,
+    operation VARCHAR(10) NOT NULL CHECK (operation IN ('upsert', 'delete')),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
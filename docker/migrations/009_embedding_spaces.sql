@@ -0,0 +1,20 @@
+-- Реестр пространств эмбеддингов: модель, размерность и колонка message_embeddings.
+-- Смена модели без простоя: новое пространство (backfill) получает двойную запись от
+-- индексатора и дозаполняется в фоне, затем чтение переключается одной транзакцией
+-- (make embedding-spaces, manage_embedding_spaces.py). Пока активного пространства нет,
+-- поиск использует колонку из VECTOR_STORAGE.
+
+CREATE TABLE IF NOT EXISTS embedding_spaces (
+    name VARCHAR(20) PRIMARY KEY,
+    backend VARCHAR(20) NOT NULL,
+    model VARCHAR(200) NOT NULL,
+    dimensions INTEGER NOT NULL CHECK (dimensions > 0),
+    column_name VARCHAR(63) NOT NULL UNIQUE,
+    state VARCHAR(10) NOT NULL CHECK (state IN ('backfill', 'active', 'retired')),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    activated_at TIMESTAMP
+);
+
+-- Активным может быть только одно пространство
+CREATE UNIQUE INDEX IF NOT EXISTS embedding_spaces_single_active_idx
+ON embedding_spaces ((true)) WHERE state = 'active';
@@ -0,0 +1,32 @@
+-- Один эмбеддинг на сообщение. Индексатор веб-процесса, догоняющая индексация Celery
+-- и несколько процессов могут одновременно пройти проверку NOT EXISTS для одного
+-- сообщения; ограничение message_embeddings_message_id_key делает запись идемпотентной
+-- (INSERT ... ON CONFLICT ON CONSTRAINT, см. insert_message_embeddings_bulk в
+-- app/utils/embedding_manager.py).
+-- Уже накопившиеся дубликаты удаляются, остается самая ранняя строка сообщения.
+-- Секционированная таблица (partition_message_embeddings) требует ключ секционирования
+-- в уникальном ограничении - там оно по (message_id, topic_id); тема сообщения не меняется.
+
+DELETE FROM message_embeddings newer
+USING message_embeddings older
+WHERE newer.message_id = older.message_id
+  AND newer.id > older.id;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = to_regclass('message_embeddings') AND conname = 'message_embeddings_message_id_key'
+    ) THEN
+        IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('message_embeddings')) = 'p' THEN
+            ALTER TABLE message_embeddings
+            ADD CONSTRAINT message_embeddings_message_id_key UNIQUE (message_id, topic_id);
+        ELSE
+            ALTER TABLE message_embeddings
+            ADD CONSTRAINT message_embeddings_message_id_key UNIQUE (message_id);
+        END IF;
+    END IF;
+END $$;
+
+-- Обычный индекс по message_id теперь избыточен
+DROP INDEX IF EXISTS message_embeddings_message_id_idx;
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Скрипт для смены модели эмбеддингов без простоя (пространства эмбеддингов,
+миграция docker/migrations/009_embedding_spaces.sql)
+
+Порядок: create -> backfill (индексатор уже пишет новые сообщения в оба пространства)
+-> index -> activate (атомарное переключение чтения) -> drop старого пространства
+"""
+import argparse
+import asyncio
+from app.config import get_settings
+from app.utils.embedders import EMBEDDING_BACKENDS
+from app.utils.embedding_indexer import MessageEmbeddingIndexer
+from app.utils.embedding_manager import EmbeddingManager, VECTOR_INDEX_TYPES
+
+
+async def list_spaces(manager: EmbeddingManager, args):
+    spaces = await manager.list_spaces()
+    if not spaces:
+        print("Пространства не зарегистрированы, поиск использует колонку VECTOR_STORAGE")
+    for space in spaces:
+        backlog = await manager.space_backlog(space)
+        print(f"{space.name:<16} {space.state:<9} {space.backend}:{space.model} ({space.dimensions}) "
+              f"колонка {space.column}, без векторов: {backlog}")
+
+
+async def create_space(manager: EmbeddingManager, args):
+    space = await manager.create_space(args.name, args.backend, args.model, args.dimensions)
+    print(f"✓ Пространство {space.name} создано (колонка {space.column}), идет двойная запись")
+
+
+async def backfill_space(manager: EmbeddingManager, args):
+    indexer = MessageEmbeddingIndexer(batch_size=args.batch_size)
+    try:
+        backfilled = await indexer.backfill_space(args.name, pause=args.pause)
+    finally:
+        await indexer.close()
+    print(f"✓ {args.name}: дозаполнено строк: {backfilled}")
+
+
+async def index_space(manager: EmbeddingManager, args):
+    settings = get_settings
+    await manager.use_space(await manager.get_space(args.name))
+    await manager.create_vector_indexes(
+        args.type,
+        lists=settings.IVFFLAT_LISTS,
+        m=settings.HNSW_M,
+        ef_construction=settings.HNSW_EF_CONSTRUCTION,
+        tables=("message_embeddings",),
+    )
+    print(f"✓ Индекс {args.type} пространства {args.name} построен")
+
+
+async def activate_space(manager: EmbeddingManager, args):
+    await manager.activate_space(args.name, force=args.force)
+    print(f"✓ Чтение переключено на {args.name}")
+
+
+async def drop_space(manager: EmbeddingManager, args):
+    await manager.drop_space(args.name)
+    print(f"✓ Пространство {args.name} и его колонка удалены (место освободит VACUUM FULL / pg_repack)")
+
+
+async def main(args):
+    manager = EmbeddingManager.from_settings()
+    await manager.initialize()
+    try:
+        await args.handler(manager, args)
+    finally:
+        await manager.close()
+
+
+if __name__ == "__main__":
+    settings = get_settings
+    parser = argparse.ArgumentParser(description="Пространства эмбеддингов: смена модели без простоя")
+    commands = parser.add_subparsers(required=True)
+
+    command = commands.add_parser("list", help="Пространства и их заполненность")
+    command.set_defaults(handler=list_spaces)
+
+    command = commands.add_parser("create", help="Новое пространство (начинается двойная запись)")
+    command.add_argument("name")
+    command.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=settings.EMBEDDING_BACKEND)
+    command.add_argument("--model", required=True, help="Модель эмбеддингов")
+    command.add_argument("--dimensions", type=int, required=True, help="Размерность векторов модели")
+    command.set_defaults(handler=create_space)
+
+    command = commands.add_parser("backfill", help="Дозаполнить векторы по истории сообщений")
+    command.add_argument("name")
+    command.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    command.add_argument("--pause", type=float, default=0.5, help="Пауза между порциями, секунды")
+    command.set_defaults(handler=backfill_space)
+
+    command = commands.add_parser("index", help="Построить ANN-индекс колонки пространства")
+    command.add_argument("name")
+    command.add_argument("--type", choices=VECTOR_INDEX_TYPES, default=settings.VECTOR_INDEX_TYPE)
+    command.set_defaults(handler=index_space)
+
+    command = commands.add_parser("activate", help="Переключить чтение на пространство")
+    command.add_argument("name")
+    command.add_argument("--force", action="store_true", help="Не проверять завершение дозаполнения")
+    command.set_defaults(handler=activate_space)
+
+    command = commands.add_parser("drop", help="Удалить неактивное пространство и его колонку")
+    command.add_argument("name")
+    command.set_defaults(handler=drop_space)
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Скрипт для перевода message_embeddings на секционирование по topic_id
+(hash или range) с построением ANN-индексов каждой секции
+
+Индексатор, переиндексация через outbox и дозаполнение пространств могут работать
+во время переноса: их изменения попадают в журнал и догоняются. На это время нужно
+остановить изменения схемы: manage_embedding_spaces.py create и convert_vector_storage.py
+"""
+import argparse
+import asyncio
+from app.config import get_settings
+from app.utils.embedding_manager import EmbeddingManager, PARTITION_STRATEGIES
+
+
+async def partition_message_embeddings(strategy: str, partitions: int, range_size: int, batch_size: int):
+    """Переносит данные порциями, меняет таблицы местами и строит индексы секций"""
+    settings = get_settings
+    manager = EmbeddingManager.from_settings()
+    await manager.initialize()
+    try:
+        print(f"Секционируем message_embeddings ({strategy})...")
+        moved = await manager.partition_message_embeddings(
+            strategy, partitions=partitions, range_size=range_size, batch_size=batch_size
+        )
+        print(f"✓ Перенесено строк: {moved}, старая таблица - message_embeddings_unpartitioned")
+        print(f"Строим индексы {settings.VECTOR_INDEX_TYPE} секций...")
+        await manager.create_vector_indexes(
+            settings.VECTOR_INDEX_TYPE,
+            lists=settings.IVFFLAT_LISTS,
+            m=settings.HNSW_M,
+            ef_construction=settings.HNSW_EF_CONSTRUCTION,
+            tables=("message_embeddings",),
+        )
+        print("✓ Индексы секций построены")
+    finally:
+        await manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Секционирование message_embeddings по topic_id")
+    parser.add_argument("--strategy", choices=PARTITION_STRATEGIES, default="hash", help="Способ секционирования")
+    parser.add_argument("--partitions", type=int, default=16, help="hash: количество секций")
+    parser.add_argument("--range-size", type=int, default=1000, help="range: тем в одной секции")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Строк в одной порции копирования")
+    args = parser.parse_args()
+    asyncio.run(partition_message_embeddings(args.strategy, args.partitions, args.range_size, args.batch_size))
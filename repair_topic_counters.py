@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Скрипт для пересчета денормализованных счетчиков тем
+(message_count, last_message_at, last_message_id)
+"""
+import argparse
+import asyncio
+from app.database import async_session_maker
+from app.managers.db_manager import topic_crud
+
+
+async def repair_topic_counters(batch_size: int):
+    """Пересчитывает счетчики активности для всех тем"""
+    async with async_session_maker() as db:
+        print("Пересчитываем счетчики тем...")
+        processed = await topic_crud.rebuild_activity_counters(db, batch_size=batch_size)
+        print(f"✓ Обработано тем: {processed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчет счетчиков активности тем")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Количество тем в одной транзакции")
+    args = parser.parse_args()
+    asyncio.run(repair_topic_counters(args.batch_size))
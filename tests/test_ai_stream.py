@@ -0,0 +1,78 @@
+"""
+Тесты ретрансляции потоковой генерации AI сообщений
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from app.utils.ai_stream import AIStreamRelay
+
+
+class FakeAIManager:
+    """Отдает токены по одному по сигналу теста и запоминает сохраненные сообщения"""
+
+    def __init__(self, tokens, saved, fail=False):
+        self.tokens = tokens
+        self.saved = saved
+        self.fail = fail
+        self.release = asyncio.Event()
+
+    async def get_prompt(self, topic_id, user_id, question):
+        return json.dumps({"generated_prompt": question})
+
+    async def stream_ai_message(self, prompt):
+        for token in self.tokens:
+            yield token
+            await self.release.wait()
+        if self.fail:
+            raise RuntimeError("upstream closed")
+
+    async def save_ai_message(self, topic_id, user_id, content, last_message_content="", reply_message_id=None):
+        self.saved.append((topic_id, user_id, content, reply_message_id))
+        return SimpleNamespace(id=len(self.saved))
+
+
+def parse(events):
+    return [json.loads(event[len("data: "):]) for event in events]
+
+
+async def collect(generation):
+    return parse([event async for event in generation.events()])
+
+
+@pytest.mark.asyncio
+async def test_tokens_relayed_and_message_saved_once():
+    """Подписчики видят токены до завершения, сообщение сохраняется один раз"""
+    saved = []
+    manager = FakeAIManager(["При", "вет", "!"], saved)
+    relay = AIStreamRelay(manager_factory=lambda: manager)
+    generation = relay.start(1, 7, "вопрос", reply_message_id=3)
+
+    events = generation.events()
+    assert parse([await events.__anext__()]) == [{"token": "При"}]
+    assert relay.start(1, 7, "вопрос") is generation  # повторный запуск не дублирует генерацию
+
+    manager.release.set()
+    rest = parse([event async for event in events])
+    assert "".join(event.get("token", "") for event in rest) == "вет!"
+    assert rest[-1] == {"done": True, "message_id": 1}
+
+    # Поздний подписчик получает весь накопленный текст сразу
+    assert await collect(relay.get(1, 7)) == [{"token": "Привет!"}, {"done": True, "message_id": 1}]
+    assert saved == [(1, 7, "Привет!", 3)]
+    assert relay.stats()["completed"] == 1
+    assert relay.stats()["last_time_to_first_token_seconds"] is not None
+
+
+@pytest.mark.asyncio
+async def test_failed_stream_is_not_saved():
+    saved = []
+    manager = FakeAIManager(["частичный"], saved, fail=True)
+    manager.release.set()
+    relay = AIStreamRelay(manager_factory=lambda: manager)
+    events = await collect(relay.start(2, 7, "вопрос"))
+    assert events[-1] == {"error": "Ошибка генерации AI сообщения"}
+    assert saved == []
+    assert relay.stats()["failed"] == 1
@@ -0,0 +1,66 @@
+"""
+Тесты провайдеров эмбеддингов
+"""
+
+import asyncio
+import math
+
+import pytest
+from app.utils.embedders import BatchingEmbedder, Embedder, HashingEmbedder
+
+
+class FixedEmbedder(Embedder):
+    """Бэкенд с фиксированной размерностью, запоминающий батчи"""
+
+    def __init__(self, dimensions=3):
+        super().__init__()
+        self.size = dimensions
+        self.batches = []
+
+    @property
+    def name(self):
+        return "fixed"
+
+    async def _embed_batch(self, texts):
+        self.batches.append(texts)
+        return [[float(len(text))] * self.size for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_hashing_embedder_is_deterministic_and_normalized():
+    """Одинаковые тексты дают одинаковые единичные векторы, общие слова - близкие"""
+    embedder = HashingEmbedder(dimensions=64)
+    first, same, related, other = await embedder.embed(
+        ["настройка celery воркера", "Настройка Celery воркера", "настройка celery", "рецепт борща"]
+    )
+    assert first == same
+    assert math.isclose(sum(value * value for value in first), 1.0)
+
+    def cosine(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    assert cosine(first, related) > cosine(first, other)
+
+
+@pytest.mark.asyncio
+async def test_batching_embedder_merges_concurrent_calls():
+    """Одновременные вызовы уходят в бэкенд одним батчем, порядок результатов сохраняется"""
+    backend = FixedEmbedder()
+    embedder = BatchingEmbedder(backend, max_batch_size=10, max_wait=0.05)
+    results = await asyncio.gather(*(embedder.embed_one("x" * n) for n in range(1, 5)))
+    assert backend.batches == [["x", "xx", "xxx", "xxxx"]]
+    assert [result[0] for result in results] == [1.0, 2.0, 3.0, 4.0]
+    assert embedder.stats()["backend"]["avg_batch_size"] == 4.0
+    await embedder.close()
+
+
+@pytest.mark.asyncio
+async def test_dimension_negotiation():
+    """Модель с фиксированной размерностью несовместима с другой колонкой, hashing подстраивается"""
+    with pytest.raises(ValueError):
+        await FixedEmbedder(dimensions=3).negotiate_dimensions(1536)
+    assert await FixedEmbedder(dimensions=3).negotiate_dimensions(3) == 3
+
+    hashing = HashingEmbedder(dimensions=1536)
+    assert await hashing.negotiate_dimensions(768) == 768
+    assert len(await hashing.embed_one("текст")) == 768
@@ -0,0 +1,50 @@
+"""
+Тесты кэша эмбеддингов поисковых запросов
+"""
+
+import pytest
+from app.utils.embedding_cache import QueryEmbeddingCache
+
+
+@pytest.mark.asyncio
+async def test_near_identical_queries_share_entry():
+    """Регистр и лишние пробелы не влияют на ключ, модель - влияет"""
+    cache = QueryEmbeddingCache(max_entries=10, ttl=60)
+    await cache.set("model-a", "Как  настроить   Celery?", [0.5, -0.25, 1.0])
+    assert await cache.get("model-a", " как настроить celery? ") == [0.5, -0.25, 1.0]
+    assert await cache.get("model-b", "как настроить celery?") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["bytes"] == 12  # 3 компоненты float32
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_calls_model_once():
+    """Повторный запрос не обращается к модели"""
+    cache = QueryEmbeddingCache(max_entries=10, ttl=60)
+    calls = []
+
+    async def compute(text):
+        calls.append(text)
+        return [0.1, 0.2]
+
+    first = await cache.get_or_compute("model", "вопрос", compute)
+    second = await cache.get_or_compute("model", "Вопрос", compute)
+    assert calls == ["вопрос"]
+    assert first == second
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_and_ttl():
+    """Вытесняется самая давно использованная запись, устаревшие записи не возвращаются"""
+    cache = QueryEmbeddingCache(max_entries=2, ttl=60)
+    await cache.set("model", "a", [1.0])
+    await cache.set("model", "b", [2.0])
+    assert await cache.get("model", "a") == [1.0]
+    await cache.set("model", "c", [3.0])
+    assert await cache.get("model", "b") is None
+    assert await cache.get("model", "a") == [1.0]
+
+    expired = QueryEmbeddingCache(max_entries=2, ttl=-1)
+    await expired.set("model", "a", [1.0])
+    assert await expired.get("model", "a") is None
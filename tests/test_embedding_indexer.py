@@ -0,0 +1,234 @@
+"""
+Тесты микро-батчинга индексатора эмбеддингов сообщений
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from app.utils.embedders import HashingEmbedder
+from app.utils.embedding_indexer import MessageEmbeddingIndexer
+from app.utils.embedding_manager import EmbeddingChanges, EmbeddingSpace, content_hash, message_plain_text
+
+
+class RecordingIndexer(MessageEmbeddingIndexer):
+    """Индексатор без базы и Ollama: запоминает собранные батчи"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    async def _index(self, batch):
+        self.batches.append([message_id for message_id, _ in batch])
+
+
+class CountingEmbedder(HashingEmbedder):
+    """Хэширующий эмбеддер, запоминающий отправленные в модель тексты"""
+
+    def __init__(self):
+        super().__init__(dimensions=8)
+        self.texts = []
+
+    async def _embed_batch(self, texts):
+        self.texts.extend(texts)
+        return await super()._embed_batch(texts)
+
+
+class InMemoryManager:
+    """Минимальная замена EmbeddingManager для записи батча"""
+
+    space = None
+
+    def __init__(self, stored=None, messages=None, changes=None, spaces=None):
+        self.stored = dict(stored or {})
+        self.messages = dict(messages or {})
+        self.changes = list(changes or [])
+        self.spaces = list(spaces or [])
+        self.inserted = []
+        self.space_writes = []
+
+    async def vector_dimensions(self, table):
+        return 8
+
+    async def find_embeddings_by_hash(self, hashes):
+        return {key: self.stored[key] for key in hashes if key in self.stored}
+
+    async def insert_message_embeddings_bulk(self, rows, connection=None):
+        start = len(self.inserted)
+        self.inserted.extend(rows)
+        return list(range(start + 1, len(self.inserted) + 1))
+
+    async def refresh_space(self):
+        return None
+
+    async def list_spaces(self):
+        return self.spaces
+
+    async def write_space_embeddings(self, space, ids, embeddings, connection=None):
+        self.space_writes.append((space.name, list(ids), [len(embedding) for embedding in embeddings]))
+
+    @asynccontextmanager
+    async def claim_embedding_changes(self, limit):
+        """Изменения снимаются с outbox только при успешном выходе из блока"""
+        claimed = self.changes[:limit]
+        if not claimed:
+            yield None
+            return
+        yield EmbeddingChanges(None, claimed)
+        self.changes = self.changes[limit:]
+
+    async def fetch_messages_for_indexing(self, message_ids, connection=None):
+        return [(message_id, *self.messages[message_id]) for message_id in message_ids if message_id in self.messages]
+
+
+@pytest.mark.asyncio
+async def test_batch_flushed_by_size():
+    """Полный батч уходит сразу, не дожидаясь max_wait"""
+    indexer = RecordingIndexer(batch_size=3, max_wait=10)
+    for message_id in range(1, 7):
+        indexer.enqueue(message_id)
+    await asyncio.sleep(0.05)
+    assert indexer.batches == [[1, 2, 3], [4, 5, 6]]
+    await indexer.close()
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_flushed_by_time():
+    """Неполный батч уходит по истечении max_wait"""
+    indexer = RecordingIndexer(batch_size=100, max_wait=0.05)
+    indexer.enqueue(1)
+    indexer.enqueue(2)
+    await asyncio.sleep(0.01)
+    assert indexer.batches == []
+    await asyncio.sleep(0.1)
+    assert indexer.batches == [[1, 2]]
+    await indexer.close()
+
+
+@pytest.mark.asyncio
+async def test_queue_overflow_is_counted():
+    """При переполнении очереди сообщение отбрасывается и учитывается в метриках"""
+    indexer = RecordingIndexer(batch_size=10, max_wait=10, max_queue=2)
+    for message_id in range(5):
+        indexer.enqueue(message_id)
+    assert indexer._metrics["dropped"] == 3
+    await indexer.close()
+
+
+def test_message_plain_text_strips_quote_wrapper():
+    """Цитата create_message и HTML-разметка не попадают в текст для эмбеддинга"""
+    quoted = (
+        "<div class='quote-message' style='border: 1px solid #007bff;'> "
+        "<i>Исходное <b>сообщение</b>...</i><br></div>Ответ  на &quot;вопрос&quot;"
+    )
+    assert message_plain_text(quoted) == 'Ответ на "вопрос"'
+    assert message_plain_text("<div class='quote-message' style=''> Без цитаты") == "Без цитаты"
+
+
+@pytest.mark.asyncio
+async def test_duplicate_content_is_embedded_once():
+    """Известное и повторяющееся в батче содержимое переиспользует готовые векторы"""
+    known_vector = [1.0] + [0.0] * 7
+    embedder = CountingEmbedder()
+    manager = InMemoryManager({content_hash("старое"): known_vector})
+    indexer = MessageEmbeddingIndexer(embedder=embedder)
+    indexer._manager = manager
+
+    written = await indexer._write([(1, 1, "новое"), (2, 1, "новое"), (3, 2, "старое")])
+
+    assert written == 3
+    assert embedder.texts == ["новое"]
+    assert manager.inserted[0][3] == manager.inserted[1][3]
+    assert manager.inserted[2][3] == known_vector
+    stats = await indexer.stats()
+    assert stats["deduplicated"] == 2
+    assert stats["dedup_ratio"] == round(2 / 3, 3)
+
+
+@pytest.mark.asyncio
+async def test_changed_messages_are_reindexed_with_batch():
+    """Изменения из outbox переиндексируются вместе с батчем, удаленные сообщения пропускаются"""
+    manager = InMemoryManager(
+        messages={1: (1, "новое"), 2: (1, "отредактированное")},
+        changes=[2, 3],  # 3 - удаленное сообщение
+    )
+    indexer = MessageEmbeddingIndexer(embedder=CountingEmbedder())
+    indexer._manager = manager
+
+    await indexer._index([(1, 0.0)])
+
+    assert sorted(row[0] for row in manager.inserted) == [1, 2]
+    assert indexer._metrics["changes_applied"] == 2
+    assert manager.changes == []
+
+
+class FailingEmbedder(CountingEmbedder):
+    async def _embed_batch(self, texts):
+        raise RuntimeError("Ollama недоступна")
+
+
+@pytest.mark.asyncio
+async def test_failed_reindex_keeps_changes_in_outbox():
+    """Ошибка модели не теряет изменение: оно остается в outbox до следующей попытки"""
+    manager = InMemoryManager(messages={2: (1, "отредактированное")}, changes=[2])
+    indexer = MessageEmbeddingIndexer(embedder=FailingEmbedder())
+    indexer._manager = manager
+
+    with pytest.raises(RuntimeError):
+        await indexer.catch_up()
+    assert manager.changes == [2]
+    assert indexer._metrics["changes_applied"] == 0
+
+
+@pytest.mark.asyncio
+async def test_backfill_space_gets_dual_writes():
+    """Новые строки получают векторы дозаполняемого пространства его моделью и размерностью"""
+    space = EmbeddingSpace("small", "hashing", "hashing", 4, "embedding_small", "backfill")
+    manager = InMemoryManager(spaces=[space])
+    indexer = MessageEmbeddingIndexer(embedder=CountingEmbedder())
+    indexer._manager = manager
+
+    await indexer._write([(1, 1, "первое"), (2, 1, "второе")])
+
+    assert [len(row[3]) for row in manager.inserted] == [8, 8]
+    assert manager.space_writes == [("small", [1, 2], [4, 4])]
+    assert indexer._metrics["dual_writes"] == 2
+
+
+class TerminatingPool:
+    """Пул, который можно только оборвать (его цикл событий уже завершен)"""
+
+    terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+
+class ClosingManager(InMemoryManager):
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_stale_resources_released_on_loop_change():
+    """Пул прежнего asyncio.run обрывается, а не теряется; закрытие освобождает текущий"""
+    indexer = RecordingIndexer(batch_size=10, max_wait=10)
+    stale, current = ClosingManager(), ClosingManager()
+    stale.pool = TerminatingPool()
+
+    async def first_run():
+        indexer.enqueue(1)
+        indexer._manager = stale
+
+    async def second_run():
+        indexer.enqueue(2)
+        assert indexer._manager is None
+        indexer._manager = current
+        await indexer.close()
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
+    assert stale.pool.terminated and not stale.closed
+    assert current.closed
+    assert indexer._manager is None
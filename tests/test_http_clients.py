@@ -0,0 +1,61 @@
+"""
+Тесты пула общих HTTP-клиентов внешних сервисов
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from app.utils.http_clients import HTTPClientPool, Upstream
+
+
+def make_pool() -> HTTPClientPool:
+    return HTTPClientPool(
+        upstreams={
+            "rag": Upstream("http://rag:8001/", "secret", 120.0),
+            "empty": Upstream("", None, 10.0),
+        },
+        max_connections=10,
+        max_keepalive_connections=5,
+        connect_timeout=2.0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_client_is_shared_and_configured():
+    """Один клиент на апстрим: базовый адрес, ключ API и раздельные таймауты"""
+    pool = make_pool()
+    client = pool.get("rag")
+    try:
+        assert pool.get("rag") is client
+        assert str(client.base_url) == "http://rag:8001"
+        assert client.headers["Authorization"] == "Bearer secret"
+        assert client.timeout == httpx.Timeout(120.0, connect=2.0, pool=2.0)
+        assert pool.stats()["clients"] == ["rag"]
+    finally:
+        await pool.aclose()
+    assert client.is_closed
+    assert pool.stats()["clients"] == []
+
+
+@pytest.mark.asyncio
+async def test_unknown_or_unconfigured_upstream():
+    pool = make_pool()
+    with pytest.raises(ValueError):
+        pool.get("missing")
+    with pytest.raises(ValueError):
+        pool.get("empty")
+
+
+def test_new_event_loop_gets_new_client():
+    """Клиент прежнего asyncio.run не переиспользуется в новом цикле событий"""
+    pool = make_pool()
+
+    async def get_client():
+        return pool.get("rag")
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+    assert first is not second
+    assert pool.stats()["created"] == 2
+    assert pool.stats()["discarded"] == 1
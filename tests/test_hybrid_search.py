@@ -0,0 +1,71 @@
+"""
+Тесты запроса гибридного поиска сообщений (векторный + полнотекстовый, RRF)
+"""
+
+from contextlib import asynccontextmanager
+
+import pytest
+from app.utils.embedding_manager import RRF_K, EmbeddingManager, HybridSearchResult
+
+QUERY_EMBEDDING = [0.01] * 8
+
+
+class FakeConnection:
+    """Запоминает запрос и отдает заранее заданные строки"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    async def fetch(self, query, *params):
+        self.calls.append((query, params))
+        return self.rows
+
+
+def test_hybrid_query_fuses_both_rankings():
+    """Обе выдачи сливаются FULL OUTER JOIN со скором RRF, страница - LIMIT/OFFSET"""
+    manager = EmbeddingManager("postgresql://unused")
+    query, params = manager._hybrid_messages_query("кот", QUERY_EMBEDDING, 7, None, 20, 40, 50, RRF_K)
+
+    assert params == ["кот", 60, RRF_K, 20, 40, 7, QUERY_EMBEDDING]
+    assert "$7::vector" in query
+    assert "FULL OUTER JOIN lexical_hits l ON l.message_id = v.message_id" in query
+    assert "coalesce(1.0 / ($3 + v.rank), 0) + coalesce(1.0 / ($3 + l.rank), 0) AS score" in query
+    assert query.count("t.is_active AND t.id = $6") == 2
+    assert "LIMIT $4 OFFSET $5" in query
+
+
+def test_hybrid_query_without_embedding_is_fulltext_only():
+    manager = EmbeddingManager("postgresql://unused")
+    query, params = manager._hybrid_messages_query("кот", None, None, 3, 10, 0, 50, RRF_K)
+
+    assert params == ["кот", 50, RRF_K, 10, 0, 3]
+    assert "message_embeddings" not in query
+    assert "WHERE false" in query
+    assert "t.category_id = $6" in query
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_returns_fused_rows(monkeypatch):
+    """Сообщение, найденное обоими методами, получает сумму вкладов RRF"""
+    manager = EmbeddingManager("postgresql://unused")
+    both = 1 / (RRF_K + 1) + 1 / (RRF_K + 2)
+    connection = FakeConnection([
+        {"message_id": 5, "topic_id": 1, "content": "кот", "author_name": "anna",
+         "score": both, "vector_rank": 1, "lexical_rank": 2, "similarity": 0.9},
+        {"message_id": 3, "topic_id": 1, "content": "кошка", "author_name": None,
+         "score": 1 / (RRF_K + 1), "vector_rank": None, "lexical_rank": 1, "similarity": None},
+    ])
+
+    @asynccontextmanager
+    async def search_connection(probes=None, ef_search=None):
+        yield connection
+
+    monkeypatch.setattr(manager, "search_connection", search_connection)
+    results = await manager.hybrid_search_messages("кот", QUERY_EMBEDDING, limit=2)
+
+    assert results == [
+        HybridSearchResult(5, 1, "кот", "anna", both, 1, 2, 0.9),
+        HybridSearchResult(3, 1, "кошка", None, 1 / (RRF_K + 1), None, 1, None),
+    ]
+    assert connection.calls[0][1][:5] == ("кот", 50, RRF_K, 2, 0)
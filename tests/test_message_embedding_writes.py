@@ -0,0 +1,56 @@
+"""
+Запись эмбеддингов сообщений идемпотентна: один эмбеддинг на сообщение
+
+Требует PostgreSQL с pgvector и схемой из docker/init-pgvector.sql и миграций
+docker/migrations (make db-up), без доступной базы тесты пропускаются.
+"""
+
+import asyncio
+
+import pytest
+import pytest_asyncio
+from app.utils.embedding_manager import EmbeddingManager
+
+# Отрицательные id не пересекаются с настоящими сообщениями
+MESSAGE_IDS = (-101, -102)
+
+
+@pytest_asyncio.fixture
+async def manager():
+    manager = EmbeddingManager.from_settings()
+    try:
+        await manager.initialize()
+    except Exception as e:
+        pytest.skip(f"PostgreSQL с pgvector недоступен: {e}")
+    dimensions = manager.dimensions.get("message_embeddings")
+    if not dimensions:
+        await manager.close()
+        pytest.skip("Размерность message_embeddings не задана")
+    yield manager
+    async with manager.pool.acquire() as connection:
+        await connection.execute("DELETE FROM message_embeddings WHERE message_id = ANY($1::int[])", list(MESSAGE_IDS))
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writers_keep_one_row_per_message(manager):
+    """Индексатор и догоняющая индексация пишут одно сообщение одновременно - строка одна"""
+    vector = [0.5] * manager.dimensions["message_embeddings"]
+    rows = [(message_id, -1, f"текст {message_id}", vector, None) for message_id in MESSAGE_IDS]
+
+    first, second = await asyncio.gather(
+        manager.insert_message_embeddings_bulk(rows),
+        manager.insert_message_embeddings_bulk(list(reversed(rows))),
+    )
+    assert first == list(reversed(second))
+    assert await manager.insert_message_embedding(MESSAGE_IDS[0], -1, "новый текст", vector) == first[0]
+
+    async with manager.pool.acquire() as connection:
+        stored = await connection.fetch(
+            "SELECT message_id, content FROM message_embeddings WHERE message_id = ANY($1::int[]) ORDER BY message_id",
+            list(MESSAGE_IDS),
+        )
+    assert [(row['message_id'], row['content']) for row in stored] == [
+        (MESSAGE_IDS[1], f"текст {MESSAGE_IDS[1]}"),
+        (MESSAGE_IDS[0], "новый текст"),
+    ]
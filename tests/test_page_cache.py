@@ -0,0 +1,59 @@
+"""
+Тесты кэша отрендеренных страниц
+"""
+
+import pytest
+from app.utils.page_cache import INDEX_SCOPE, PageCache, _page_cache_enabled, topic_scope
+
+
+@pytest.mark.asyncio
+async def test_invalidate_changes_page_key():
+    """После инвалидации области страница по старому ключу больше не находится"""
+    cache = PageCache(max_entries=10, ttl=60)
+    key = await cache.page_key("topic", topic_scope(1))
+    assert await cache.get(key) is None
+    await cache.set(key, "<html>1</html>")
+    assert await cache.get(key) == "<html>1</html>"
+
+    await cache.invalidate(INDEX_SCOPE, topic_scope(1))
+    new_key = await cache.page_key("topic", topic_scope(1))
+    assert new_key != key
+    assert await cache.get(new_key) is None
+    assert cache.stats()["routes"]["topic"] == {"hits": 1, "misses": 2, "hit_rate": 0.333}
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    """Самая давно использованная страница вытесняется первой"""
+    cache = PageCache(max_entries=2, ttl=60)
+    await cache.set("topic:a", "a")
+    await cache.set("topic:b", "b")
+    assert await cache.get("topic:a") == "a"
+    await cache.set("topic:c", "c")
+    assert await cache.get("topic:b") is None
+    assert await cache.get("topic:a") == "a"
+
+
+class FailingRedis:
+    async def mget(self, keys):
+        raise ConnectionError("redis недоступен")
+
+
+@pytest.mark.asyncio
+async def test_unreadable_versions_bypass_cache():
+    """Без общих версий страница рендерится заново, а не берется по устаревшим локальным"""
+    cache = PageCache(max_entries=10, ttl=60)
+    cache._redis = FailingRedis()
+    key = await cache.page_key("topic", topic_scope(1))
+    assert key is None
+    await cache.set(key, "<html>1</html>")
+    assert await cache.get(key) is None
+    assert cache.stats()["bypassed"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_memory_cache_disabled_for_several_workers():
+    assert _page_cache_enabled("memory", 1)
+    assert not _page_cache_enabled("memory", 4)
+    assert _page_cache_enabled("redis", 4)
+    assert not _page_cache_enabled("off", 1)
@@ -0,0 +1,29 @@
+"""
+Тесты keyset-пагинации
+"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from app.utils.pagination import decode_cursor, encode_cursor, next_cursor
+
+
+def test_cursor_roundtrip():
+    """Курсор восстанавливает позицию последней строки"""
+    created_at = datetime(2025, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+    assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+
+
+def test_invalid_cursor():
+    """Поврежденный курсор дает ValueError"""
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_next_cursor_only_for_full_page():
+    """Курсор следующей страницы выдается только для полной страницы"""
+    rows = [SimpleNamespace(id=i, created_at=datetime(2025, 1, i)) for i in (3, 2, 1)]
+    assert next_cursor(rows, limit=5, sort_attr="created_at") is None
+    assert decode_cursor(next_cursor(rows, limit=3, sort_attr="created_at")) == (datetime(2025, 1, 1), 1)
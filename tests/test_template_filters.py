@@ -0,0 +1,28 @@
+"""
+Тесты фильтров шаблонов
+"""
+
+from app.template_filters import markdown_to_html, smart_content
+
+
+def test_smart_content_links_and_sanitizes():
+    """Автоссылки, переносы строк и очистка опасных тегов"""
+    html = smart_content("см. https://example.com\n<script>alert(1)</script>")
+    assert 'href="https://example.com"' in html
+    assert 'target="_blank"' in html
+    assert "<br>" in html
+    assert "<script>" not in html
+
+
+def test_smart_content_keeps_existing_links():
+    """Существующие ссылки не оборачиваются повторно"""
+    html = smart_content('<a href="https://example.com">сайт</a>')
+    assert html.count("<a ") == 1
+
+
+def test_markdown_instance_is_reset_between_calls():
+    """Переиспользуемый Markdown не накапливает состояние (id заголовков toc)"""
+    markdown_to_html.cache_clear()
+    first = markdown_to_html("# Заголовок\n\nтекст 1")
+    second = markdown_to_html("# Заголовок\n\nтекст 2")
+    assert first.split("</h1>")[0] == second.split("</h1>")[0]
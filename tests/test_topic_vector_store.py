@@ -0,0 +1,100 @@
+"""
+Тесты локального хранилища векторов тем
+"""
+
+import multiprocessing
+
+import pytest
+from app.utils.embedding_manager import EmbeddingManager
+from app.utils.topic_vector_store import StoredVector, TopicVectorStore
+
+
+def rows():
+    return [
+        StoredVector(1, 10, "про celery", [1.0, 0.0, 0.0], {"source": "forum"}),
+        StoredVector(2, 11, "про redis", [0.0, 1.0, 0.0], None),
+        StoredVector(3, 12, "про оба", [1.0, 1.0, 0.0], None),
+    ]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_search_matches_pgvector_format(tmp_path, dtype):
+    """Результаты упорядочены по близости и имеют формат search_similar_messages"""
+    store = TopicVectorStore(str(tmp_path), dtype=dtype)
+    assert store.search(5, [1.0, 0.0, 0.0]) is None
+    store.write_topic(5, 3, rows())
+
+    results = store.search(5, [2.0, 0.1, 0.0], limit=2, similarity_threshold=0.0)
+    assert [result[:4] for result in results] == [(1, 10, 5, "про celery"), (3, 12, 5, "про оба")]
+    assert results[0][4] == pytest.approx(0.9988, abs=1e-3)
+    assert results[0][5] == {"source": "forum"}
+    assert store.search(5, [2.0, 0.1, 0.0], limit=10, similarity_threshold=0.9) == [results[0]]
+
+
+def test_append_and_invalidate(tmp_path):
+    """Новые векторы дописываются только в материализованную тему, правка сбрасывает тему"""
+    store = TopicVectorStore(str(tmp_path))
+    new_row = StoredVector(4, 13, "про postgres", [0.0, 0.0, 1.0], None)
+    assert store.append(5, [new_row]) is False
+
+    store.write_topic(5, 3, rows())
+    assert store.append(5, [new_row]) is True
+    assert store.search(5, [0.0, 0.0, 1.0], limit=1)[0][:2] == (4, 13)
+
+    store.invalidate(5)
+    assert store.search(5, [0.0, 0.0, 1.0]) is None
+
+
+def append_many(directory, worker, count):
+    store = TopicVectorStore(directory)
+    for index in range(count):
+        row_id = worker * 1000 + index
+        # Вектор однозначно определяется id строки: по нему видно, с какой строкой он сопоставлен
+        store.append(5, [StoredVector(row_id, row_id, str(row_id), [1.0, float(row_id), 0.0], None)])
+
+
+def test_concurrent_appends_keep_rows_paired(tmp_path):
+    """Дозапись одной темы из нескольких процессов не сдвигает строки относительно векторов"""
+    store = TopicVectorStore(str(tmp_path))
+    store.write_topic(5, 3, [])
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=append_many, args=(str(tmp_path), worker, 200)) for worker in (1, 2)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    topic = store._load(5)
+    assert len(topic.rows) == 400
+    for row, vector in zip(topic.rows, topic.vectors):
+        assert vector[1] / vector[0] == pytest.approx(row["id"])
+
+
+class TransactionConnection:
+    """Соединение внутри внешней транзакции (запись изменений из outbox)"""
+
+    def __init__(self):
+        self.in_transaction = True
+
+    def is_in_transaction(self):
+        return self.in_transaction
+
+
+def test_vectors_appended_only_after_outer_commit(tmp_path):
+    """Векторы строк из незафиксированной транзакции не попадают в файлы темы, при откате - никогда"""
+    store = TopicVectorStore(str(tmp_path))
+    store.write_topic(5, 3, rows())
+    manager = EmbeddingManager("postgresql://unused", vector_store=store)
+    new_row = (13, 5, "про postgres", [0.0, 0.0, 1.0], None)
+
+    rolled_back = TransactionConnection()
+    manager._update_vector_store(rolled_back, {4: new_row}, set())
+    manager._finish_vector_store_updates(rolled_back, committed=False)
+    assert len(store._load(5).rows) == 3
+
+    committed = TransactionConnection()
+    manager._update_vector_store(committed, {5: new_row}, set())
+    assert len(store._load(5).rows) == 3
+    committed.in_transaction = False
+    manager._finish_vector_store_updates(committed, committed=True)
+    assert store.search(5, [0.0, 0.0, 1.0], limit=1)[0][:2] == (5, 13)
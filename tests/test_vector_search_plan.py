@@ -0,0 +1,58 @@
+"""
+Проверка плана поиска похожих сообщений: сортировка по расстоянию идет через ANN-индекс
+
+Требует PostgreSQL с pgvector и схемой из docker/init-pgvector.sql (make db-up),
+без доступной базы тесты пропускаются.
+"""
+
+import pytest
+import pytest_asyncio
+from app.utils.embedding_manager import EmbeddingManager, VectorQuery
+
+QUERY_EMBEDDING = [0.01] * 1536
+
+
+@pytest_asyncio.fixture
+async def manager():
+    manager = EmbeddingManager.from_settings()
+    try:
+        await manager.initialize()
+    except Exception as e:
+        pytest.skip(f"PostgreSQL с pgvector недоступен: {e}")
+    yield manager
+    await manager.close()
+
+
+async def explain(manager, query, params):
+    async with manager.search_connection() as connection:
+        # На почти пустой таблице seq scan дешевле - проверяем, что индекс применим в принципе
+        await connection.execute("SET LOCAL enable_seqscan = off")
+        rows = await connection.fetch(f"EXPLAIN {query}", *params)
+    return "\n".join(row[0] for row in rows)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("topic_id", [None, 1])
+async def test_similar_messages_use_ann_index(manager, topic_id):
+    """Порог и фильтр по топику не мешают упорядоченному сканированию индекса"""
+    query, params = manager._similar_messages_query(QUERY_EMBEDDING, topic_id, 10, 0.8)
+    plan = await explain(manager, query, params)
+    assert "Index Scan using message_embeddings_embedding_idx" in plan, plan
+
+
+@pytest.mark.asyncio
+async def test_search_many_uses_ann_index_per_query(manager):
+    """Каждый запрос пакета обходит ANN-индекс внутри LATERAL"""
+    query, params = manager._search_many_query(
+        [VectorQuery(QUERY_EMBEDDING), VectorQuery(QUERY_EMBEDDING, topic_id=1, limit=3)]
+    )
+    plan = await explain(manager, query, params)
+    assert "Index Scan using message_embeddings_embedding_idx" in plan, plan
+
+
+def test_topic_search_is_routed_to_partition():
+    """Поиск по топику секционированной таблицы обходит только секцию топика"""
+    manager = EmbeddingManager("postgresql://unused")
+    query, _ = manager._similar_messages_query(QUERY_EMBEDDING, 7, 10, 0.8, relation="message_embeddings_p3")
+    assert "FROM message_embeddings_p3" in query
+    assert "FROM message_embeddings\n" not in query